@@ -1,25 +1,144 @@
-from ..chatgpt_module.response_processor import ResponseProcessor as ChatGPTResponseProcessor
-from ..claude_module.response_processor import ClaudeResponseProcessor
+import importlib
+import threading
+from importlib.metadata import entry_points
+
+from .provider_router import ProviderRouter
 from ..config import config
 from ..utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# 外部パッケージがAIプロバイダーを登録するエントリーポイントのグループ
+ENTRY_POINT_GROUP = "gmail_discord_bot.ai_providers"
+
+# 組み込みのAIプロバイダー（"モジュール:クラス"。SDKを含め、最初に使う時点でインポートする）
+BUILTIN_PROVIDERS = {
+    "chatgpt": "..chatgpt_module.response_processor:ResponseProcessor",
+    "claude": "..claude_module.response_processor:ClaudeResponseProcessor",
+    "mock": ".mock_provider:MockResponseProcessor",
+}
+
+class ProviderRegistry:
+    """AIプロバイダー名と応答処理クラスの対応表
+
+    組み込みのプロバイダー、エントリーポイント（gmail_discord_bot.ai_providers）、
+    email_settings.json の "ai_providers"（名前: "モジュール:クラス"）の順に登録し、後のものが優先される。
+    クラスは名前を指定して初めて使う時点でインポートするため、使わないプロバイダーのSDKは読み込まない。
+    """
+
+    def __init__(self):
+        self._targets = {}
+        self._classes = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, target):
+        """
+        プロバイダーを登録
+
+        Args:
+            name: プロバイダー名（大文字・小文字は区別しない）
+            target: "モジュール:クラス" の文字列、エントリーポイント、または応答処理クラス
+        """
+        with self._lock:
+            self._targets[name.lower()] = target
+            self._classes.pop(name.lower(), None)
+
+    def names(self):
+        """登録されているプロバイダー名のリスト"""
+        with self._lock:
+            return sorted(self._targets)
+
+    def get(self, name):
+        """プロバイダーの応答処理クラスを取得（初回のみインポートする）"""
+        name = name.lower()
+        with self._lock:
+            if name not in self._classes:
+                if name not in self._targets:
+                    raise KeyError(name)
+                self._classes[name] = self._load(self._targets[name])
+            return self._classes[name]
+
+    def _load(self, target):
+        if isinstance(target, str):
+            module_name, _, attribute = target.partition(":")
+            return getattr(importlib.import_module(module_name, package=__package__), attribute)
+        if hasattr(target, "load"):
+            return target.load()
+        return target
+
+    def load_entry_points(self):
+        """インストール済みのパッケージがエントリーポイントで公開しているプロバイダーを登録"""
+        try:
+            for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+                self.register(entry_point.name, entry_point)
+        except Exception as e:
+            logger.error(f"AIプロバイダーのエントリーポイントの読み込みに失敗しました: {e}")
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_provider_registry():
+    """プロセス共通のAIプロバイダーの対応表を取得"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = ProviderRegistry()
+            for name, target in BUILTIN_PROVIDERS.items():
+                registry.register(name, target)
+            registry.load_entry_points()
+            for name, target in config.get_email_settings().get("ai_providers", {}).items():
+                registry.register(name, target)
+            _registry = registry
+        return _registry
+
 class AIFactory:
     """AIプロバイダーを選択するためのファクトリークラス"""
     
     @staticmethod
     def create_response_processor(provider=None):
-        """応答処理クラスを作成"""
+        """応答処理クラスを作成（ルーティングが有効な場合は複数プロバイダーのルーターを返す）"""
         if provider is None:
             provider = config.DEFAULT_AI_PROVIDER
         
+        routing = config.get_email_settings().get("routing", {})
+        if routing.get("enabled", False):
+            return AIFactory.create_provider_router(provider, routing)
+        
+        return AIFactory.create_single_processor(provider)
+    
+    @staticmethod
+    def create_single_processor(provider):
+        """1つのプロバイダーの応答処理クラスを作成"""
         logger.info(f"AIプロバイダー '{provider}' の応答処理クラスを作成")
         
-        if provider.lower() == "chatgpt":
-            return ChatGPTResponseProcessor()
-        elif provider.lower() == "claude":
-            return ClaudeResponseProcessor()
-        else:
-            logger.warning(f"未知のAIプロバイダー '{provider}' が指定されました。デフォルトのChatGPTを使用します。")
-            return ChatGPTResponseProcessor()
\ No newline at end of file
+        registry = get_provider_registry()
+        try:
+            processor_class = registry.get(provider)
+        except KeyError:
+            logger.warning(
+                f"未知のAIプロバイダー '{provider}' が指定されました（登録済み: {', '.join(registry.names())}）。"
+                "デフォルトのChatGPTを使用します。"
+            )
+            processor_class = registry.get("chatgpt")
+        return processor_class()
+    
+    @staticmethod
+    def create_provider_router(primary, routing):
+        """指定したプロバイダーを優先とし、設定されたプロバイダーにフェイルオーバーするルーターを作成"""
+        names = [primary.lower()] + [
+            name.lower() for name in routing.get("providers", ["claude", "chatgpt"])
+            if name.lower() != primary.lower()
+        ]
+        processors = [(name, AIFactory.create_single_processor(name)) for name in names]
+        return ProviderRouter(
+            processors,
+            hedge_percentile=routing.get("hedge_percentile", 95),
+            hedge_min_delay=routing.get("hedge_min_delay_seconds", 2.0),
+            default_hedge_delay=routing.get("default_hedge_delay_seconds", 10.0),
+            failure_threshold=routing.get("failure_threshold", 3),
+            cooldown=routing.get("cooldown_seconds", 60),
+            max_error_rate=routing.get("max_error_rate", 0.5),
+            window=routing.get("window", 50),
+            error_window=routing.get("error_window_seconds", 300),
+            min_samples=routing.get("min_samples", 3)
+        )
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+
+from ..config import config
+from ..utils.logger import setup_logger
+from ..utils.executor import run_disk
+from ..utils.llm_ledger import get_llm_ledger
+from .model_routing import get_model_policy
+from .http_pool import get_anthropic_client
+from ..claude_module.prompt_builder import format_signature_info, get_prompt_builder
+
+logger = setup_logger(__name__)
+
+# Anthropic Message Batches の料金は通常の50%
+BATCH_PRICE_FACTOR = 0.5
+
+class AnthropicBatchBackend:
+    """Anthropic Message Batches API を使うバッチバックエンド"""
+
+    def __init__(self, async_client=None):
+        self.async_client = async_client or get_anthropic_client()
+
+    async def submit(self, requests):
+        """
+        リクエストをまとめて送信
+
+        Args:
+            requests: custom_id / model / max_tokens / system（システムブロック）/ user を含む辞書のリスト
+
+        Returns:
+            バッチID
+        """
+        batch = await self.async_client.messages.batches.create(requests=[
+            {
+                "custom_id": request["custom_id"],
+                "params": {
+                    "model": request["model"],
+                    "max_tokens": request["max_tokens"],
+                    "system": request["system"],
+                    "messages": [{"role": "user", "content": request["user"]}],
+                },
+            }
+            for request in requests
+        ])
+        return batch.id
+
+    async def is_done(self, batch_id):
+        """バッチの処理が終わったか確認"""
+        batch = await self.async_client.messages.batches.retrieve(batch_id)
+        return batch.processing_status == "ended"
+
+    async def results(self, batch_id):
+        """
+        バッチの結果を取得
+
+        Returns:
+            custom_id をキーとした {"text": 応答テキストまたはNone, "input_tokens", "output_tokens"} の辞書
+        """
+        results = {}
+        async for entry in await self.async_client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                message = entry.result.message
+                results[entry.custom_id] = {
+                    "text": message.content[0].text,
+                    "input_tokens": message.usage.input_tokens,
+                    "output_tokens": message.usage.output_tokens,
+                }
+            else:
+                logger.warning(f"バッチ内のリクエスト {entry.custom_id} が完了しませんでした: {entry.result.type}")
+                results[entry.custom_id] = {"text": None, "input_tokens": 0, "output_tokens": 0}
+        return results
+
+class LocalBatchBackend:
+    """APIを呼ばずに非同期の完了を模擬するバッチバックエンド（動作確認用）
+
+    送信から delay 秒後に完了扱いとなり、complete（リクエストを受け取り応答テキストを返す
+    コルーチン関数）の結果を返す。complete を指定しない場合は定型の返信を返す。
+    """
+
+    def __init__(self, complete=None, delay=5.0):
+        self.complete = complete
+        self.delay = delay
+        self.batches = {}
+
+    async def submit(self, requests):
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        self.batches[batch_id] = {"requests": list(requests), "ready_at": time.monotonic() + self.delay}
+        return batch_id
+
+    async def is_done(self, batch_id):
+        batch = self.batches.get(batch_id)
+        # 再起動で失われたバッチは完了扱いにし、結果なしとして通常処理に戻す
+        return batch is None or time.monotonic() >= batch["ready_at"]
+
+    async def results(self, batch_id):
+        batch = self.batches.pop(batch_id, None)
+        if batch is None:
+            return {}
+        results = {}
+        for request in batch["requests"]:
+            if self.complete:
+                text = await self.complete(request)
+            else:
+                text = "<分析>ローカルバッチによる分析</分析>\n<返信>ローカルバッチによる返信の下書きです。</返信>"
+            results[request["custom_id"]] = {"text": text, "input_tokens": 0, "output_tokens": 0}
+        return results
+
+class BatchCoordinator:
+    """急ぎでないメールの分析・返信作成をバッチにまとめて処理するクラス
+
+    対象のメールは enqueue() で処理待ちに入れ、件数か経過時間が閾値に達したら
+    分析・返信一括プロンプトでまとめて送信する。送信済みのバッチは定期的に確認し、
+    完了した結果を on_result に渡す。処理待ちと送信済みのバッチはファイルに保存し、
+    再起動後も引き継ぐ。
+    """
+
+    def __init__(self, backend, model, state_file=None, max_batch_size=50, flush_interval=300,
+                 poll_interval=60, max_tokens=2000, labels=None, sender_patterns=None, use_list_unsubscribe=True):
+        """
+        初期化
+
+        Args:
+            backend: バッチバックエンド（submit / is_done / results を持つ）
+            model: 使用するモデル名
+            state_file: 処理待ち・送信済みバッチの保存先
+            max_batch_size: 1つのバッチにまとめる最大件数
+            flush_interval: 最も古い処理待ちがこの秒数を超えたら件数に関わらず送信する
+            poll_interval: 送信済みバッチを確認する間隔（秒）
+            max_tokens: 1件あたりの最大出力トークン数
+            labels: バッチ処理の対象とするGmailラベル（例: CATEGORY_PROMOTIONS）
+            sender_patterns: バッチ処理の対象とする送信者アドレスの正規表現
+            use_list_unsubscribe: List-Unsubscribe ヘッダーのあるメール（メールマガジンなど）を対象にするか
+        """
+        self.backend = backend
+        self.model = model
+        self.state_file = Path(state_file) if state_file else config.DATA_DIR / "batch_jobs.json"
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.max_tokens = max_tokens
+        self.labels = set(labels or [])
+        self.sender_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in (sender_patterns or [])]
+        self.use_list_unsubscribe = use_list_unsubscribe
+        self.pending = []
+        self.submitted = {}
+        self._load()
+
+    def matches(self, email_data):
+        """バッチ処理の対象メールか判定"""
+        if email_data.get('batch_fallback'):
+            return False
+        if self.labels & set(email_data.get('labels', [])):
+            return True
+        if self.use_list_unsubscribe and email_data.get('list_unsubscribe'):
+            return True
+        sender = email_data.get('sender', '')
+        return any(pattern.search(sender) for pattern in self.sender_patterns)
+
+    def _load(self):
+        """保存された処理待ち・送信済みバッチを読み込む"""
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.pending = state.get("pending", [])
+            self.submitted = state.get("submitted", {})
+            if self.pending or self.submitted:
+                logger.info(f"バッチ処理を再開します: 処理待ち {len(self.pending)}件, 送信済み {len(self.submitted)}バッチ")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"バッチ処理の状態の読み込みに失敗しました: {e}")
+
+    def _save_sync(self):
+        state = {"pending": self.pending, "submitted": self.submitted}
+        tmp_file = self.state_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp_file, self.state_file)
+
+    async def persist(self):
+        """処理待ち・送信済みバッチを保存（ディスク用プールで実行）"""
+        try:
+            await run_disk(self._save_sync)
+        except Exception as e:
+            logger.error(f"バッチ処理の状態の保存に失敗しました: {e}")
+
+    async def enqueue(self, email_data, prompt, signature=None):
+        """メールを処理待ちに追加（signature はメールボックスごとの署名設定）"""
+        signature_settings = signature or config.get_email_settings().get("signature", {})
+        job = {
+            "custom_id": re.sub(r'[^A-Za-z0-9_-]', '_', f"{email_data['id']}_{uuid.uuid4().hex[:6]}")[:64],
+            "email_data": {key: value for key, value in email_data.items() if key != 'raw_message'},
+            "prompt": prompt,
+            "signature_info": format_signature_info(signature_settings),
+            "queued_at": time.time(),
+        }
+        self.pending.append(job)
+        await self.persist()
+        logger.info(f"メール {email_data['id']} をバッチ処理待ちに追加しました（処理待ち {len(self.pending)}件）")
+
+    def _should_flush(self):
+        if not self.pending:
+            return False
+        if len(self.pending) >= self.max_batch_size:
+            return True
+        return time.time() - self.pending[0]["queued_at"] >= self.flush_interval
+
+    async def flush(self):
+        """処理待ちをバッチとして送信"""
+        jobs, self.pending = self.pending[:self.max_batch_size], self.pending[self.max_batch_size:]
+        system_prompt = config.get_email_combined_prompt()
+        prompt_builder = get_prompt_builder()
+        requests = [
+            {
+                "custom_id": job["custom_id"],
+                "model": self.model,
+                "max_tokens": self.max_tokens,
+                "system": prompt_builder.system_blocks(system_prompt, job.get("signature_info"), include_examples=True),
+                "user": job["prompt"],
+            }
+            for job in jobs
+        ]
+        try:
+            batch_id = await self.backend.submit(requests)
+        except Exception:
+            # 送信に失敗した場合は処理待ちに戻して次回に再送する
+            self.pending = jobs + self.pending
+            raise
+        self.submitted[batch_id] = {"submitted_at": time.time(), "jobs": jobs}
+        await self.persist()
+        logger.info(f"{len(jobs)}件のメールをバッチ {batch_id} として送信しました")
+
+    async def collect(self, on_result):
+        """完了したバッチの結果を取得して on_result(email_data, 応答テキストまたはNone) に渡す"""
+        for batch_id in list(self.submitted):
+            if not await self.backend.is_done(batch_id):
+                continue
+            results = await self.backend.results(batch_id)
+            batch = self.submitted.pop(batch_id)
+            elapsed = time.time() - batch["submitted_at"]
+            logger.info(f"バッチ {batch_id} が完了しました（{len(batch['jobs'])}件, {elapsed:.0f}秒）")
+            ledger = get_llm_ledger()
+            for job in batch["jobs"]:
+                result = results.get(job["custom_id"], {})
+                cost = 0.0
+                if result.get("text") is not None:
+                    cost = get_model_policy().record(
+                        "claude:batch", self.model, elapsed,
+                        input_tokens=result.get("input_tokens", 0),
+                        output_tokens=result.get("output_tokens", 0),
+                        price_factor=BATCH_PRICE_FACTOR
+                    )
+                if ledger:
+                    # バッチのレイテンシは送信から完了までの時間
+                    await ledger.record(
+                        provider="claude", model=self.model, route="claude:batch", stage="combined",
+                        email_id=job["email_data"].get("id"), sender=job["email_data"].get("sender"),
+                        input_tokens=result.get("input_tokens", 0), output_tokens=result.get("output_tokens", 0),
+                        latency=elapsed, outcome="ok" if result.get("text") is not None else "error",
+                        error=None if result.get("text") is not None else "バッチ内のリクエストが完了しませんでした",
+                        cost=cost
+                    )
+                try:
+                    await on_result(job["email_data"], result.get("text"))
+                except Exception as e:
+                    logger.error(f"バッチ結果の処理エラー（メール {job['email_data'].get('id')}）: {e}")
+            await self.persist()
+
+    async def run(self, on_result):
+        """処理待ちの送信と送信済みバッチの確認を繰り返す"""
+        while True:
+            try:
+                if self._should_flush():
+                    await self.flush()
+                await self.collect(on_result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"バッチ処理エラー: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+def create_batch_coordinator(state_file=None):
+    """設定に従ってバッチ処理クラスを作成（無効の場合はNone。state_file はシャーディング時のワーカーごとの保存先）"""
+    settings = config.get_email_settings().get("batch", {})
+    if not settings.get("enabled", False):
+        return None
+    if settings.get("backend", "anthropic") == "local":
+        backend = LocalBatchBackend(delay=settings.get("local_delay_seconds", 5))
+    else:
+        backend = AnthropicBatchBackend()
+    _, model = get_model_policy().select("claude", "combined", config.CLAUDE_MODEL)
+    return BatchCoordinator(
+        backend,
+        model,
+        state_file=state_file,
+        max_batch_size=settings.get("max_batch_size", 50),
+        flush_interval=settings.get("flush_interval_seconds", 300),
+        poll_interval=settings.get("poll_interval_seconds", 60),
+        labels=settings.get("labels", []),
+        sender_patterns=settings.get("sender_patterns", []),
+        use_list_unsubscribe=settings.get("use_list_unsubscribe", True)
+    )
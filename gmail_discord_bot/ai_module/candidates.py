@@ -0,0 +1,13 @@
+from ..config import config
+
+# 返信候補ごとのスタイル指示と温度（email_settings.json の candidates.styles で上書き可能）
+DEFAULT_CANDIDATE_STYLES = [
+    {"hint": "標準的なビジネスメールの丁寧さで、要点を過不足なく伝えてください。", "temperature": 0.5},
+    {"hint": "できるだけ簡潔に、要点だけを短く伝えてください。", "temperature": 0.7},
+    {"hint": "相手への配慮や感謝を多めに含めた、柔らかく丁寧な文面にしてください。", "temperature": 0.9},
+]
+
+def get_candidate_styles(num_responses):
+    """返信候補の数だけスタイルを返す（設定数より多い場合は繰り返して使う）"""
+    styles = config.get_email_settings().get("candidates", {}).get("styles") or DEFAULT_CANDIDATE_STYLES
+    return [styles[index % len(styles)] for index in range(num_responses)]
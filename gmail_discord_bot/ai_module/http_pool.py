@@ -0,0 +1,208 @@
+import asyncio
+import importlib
+import importlib.util
+import threading
+
+from ..config import config
+from ..utils.logger import setup_logger
+from ..utils.llm_ledger import count_http_attempt
+
+logger = setup_logger(__name__)
+
+# HTTP/2 は h2 パッケージがある場合のみ使用できる
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+DEFAULT_POOL_SETTINGS = {
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry_seconds": 60,
+    "connect_timeout_seconds": 10,
+    "timeout_seconds": 60,
+    "max_retries": 2,
+    "http2": True,
+    "warmup_connections": 2,
+}
+
+class PoolMetrics:
+    """接続プールの利用状況（リクエスト数・応答待ちの同時実行数）"""
+
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "peak_utilization": round(self.peak_in_flight / self.max_connections, 3) if self.max_connections else 0.0,
+            }
+
+# プロバイダーごとのSDKのモジュール名（使用するプロバイダーのSDKだけを最初に使う時点でインポートする）
+PROVIDER_SDKS = {
+    "anthropic": "anthropic",
+    "openai": "openai",
+}
+
+def _httpx_module(sdk):
+    """SDKが使用しているhttpx（互換）モジュールを取得（SDKと異なるモジュールのクライアントは渡せないため）"""
+    return importlib.import_module(sdk.DefaultAsyncHttpxClient.__mro__[1].__module__.partition(".")[0])
+
+class MeteredTransport:
+    """応答ヘッダーを受け取るまでの同時実行数を数えるトランスポート
+
+    SDK内部のリトライも1回ずつここを通るため、LLM呼び出しの台帳用にリクエスト回数も数える。
+    """
+
+    def __init__(self, transport, metrics):
+        self.transport = transport
+        self.metrics = metrics
+
+    async def handle_async_request(self, request):
+        count_http_attempt()
+        self.metrics.start()
+        try:
+            return await self.transport.handle_async_request(request)
+        finally:
+            self.metrics.finish()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    async def __aenter__(self):
+        await self.transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.transport.__aexit__(*args)
+
+class ProviderHttpPool:
+    """プロバイダーごとに1つだけ作成する非同期HTTPクライアントと接続プール"""
+
+    def __init__(self, provider, sdk, settings=None):
+        self.provider = provider
+        self.sdk = sdk
+        self.settings = {**DEFAULT_POOL_SETTINGS, **(settings or {})}
+        self.http2 = bool(self.settings["http2"]) and HTTP2_AVAILABLE
+        if self.settings["http2"] and not HTTP2_AVAILABLE:
+            logger.warning(f"h2 パッケージがないため {provider} の接続は HTTP/1.1 を使用します")
+        self.metrics = PoolMetrics(self.settings["max_connections"])
+        httpx = _httpx_module(sdk)
+        self.transport = httpx.AsyncHTTPTransport(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.settings["max_connections"],
+                max_keepalive_connections=self.settings["max_keepalive_connections"],
+                keepalive_expiry=self.settings["keepalive_expiry_seconds"]
+            )
+        )
+        self.http_client = sdk.DefaultAsyncHttpxClient(
+            transport=MeteredTransport(self.transport, self.metrics),
+            timeout=httpx.Timeout(self.settings["timeout_seconds"], connect=self.settings["connect_timeout_seconds"])
+        )
+        self.sdk_client = None
+        self.closed = False
+
+    def connection_stats(self):
+        """プール内の接続数（開いている接続・アイドル接続）"""
+        try:
+            connections = list(self.transport._pool.connections)
+        except AttributeError:
+            return {}
+        return {
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+        }
+
+    def to_dict(self):
+        return {
+            "http2": self.http2,
+            "max_connections": self.settings["max_connections"],
+            **self.metrics.to_dict(),
+            **self.connection_stats(),
+        }
+
+    async def warmup(self, probe):
+        """
+        接続を事前に確立（TLSハンドシェイクを起動時に済ませる）
+
+        Args:
+            probe: 軽いAPIリクエストを送るコルーチン関数。HTTP/1.1 の場合は
+                   warmup_connections 件を並行して送り、その数の接続を開いておく
+        """
+        count = 1 if self.http2 else max(1, min(self.settings["warmup_connections"], self.settings["max_keepalive_connections"]))
+        results = await asyncio.gather(*[probe() for _ in range(count)], return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(results):
+            raise errors[0]
+        logger.info(f"{self.provider} への接続を事前に確立しました: {self.connection_stats() or count}")
+
+    async def close(self):
+        """接続プールを閉じる（複数の処理クラスから呼ばれても1回だけ閉じる）"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.sdk_client is not None:
+            await self.sdk_client.close()
+        else:
+            await self.http_client.aclose()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(provider):
+    """プロバイダーの接続プールを取得（プロセス内で共有）"""
+    with _pools_lock:
+        pool = _pools.get(provider)
+        if pool is None or pool.closed:
+            settings = config.get_email_settings().get("http_pool", {})
+            pool = ProviderHttpPool(
+                provider, importlib.import_module(PROVIDER_SDKS[provider]), {**settings.get("default", {}), **settings.get(provider, {})}
+            )
+            _pools[provider] = pool
+        return pool
+
+def get_anthropic_client():
+    """プロセス共通の AsyncAnthropic クライアントを取得"""
+    pool = get_pool("anthropic")
+    if pool.sdk_client is None:
+        pool.sdk_client = pool.sdk.AsyncAnthropic(
+            api_key=config.CLAUDE_API_KEY,
+            base_url=config.CLAUDE_BASE_URL,
+            timeout=pool.settings["timeout_seconds"],
+            max_retries=pool.settings["max_retries"],
+            http_client=pool.http_client
+        )
+    return pool.sdk_client
+
+def get_openai_client():
+    """プロセス共通の AsyncOpenAI クライアントを取得"""
+    pool = get_pool("openai")
+    if pool.sdk_client is None:
+        pool.sdk_client = pool.sdk.AsyncOpenAI(
+            api_key=config.OPENAI_API_KEY,
+            base_url=config.OPENAI_BASE_URL,
+            timeout=pool.settings["timeout_seconds"],
+            max_retries=pool.settings["max_retries"],
+            http_client=pool.http_client
+        )
+    return pool.sdk_client
+
+def get_pool_stats():
+    """プロバイダーごとの接続プールの利用状況を取得"""
+    with _pools_lock:
+        return {provider: pool.to_dict() for provider, pool in _pools.items()}
@@ -0,0 +1,353 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ..utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# ステージごとの定型の出力（{digest} はリクエストごとの識別用の数字に置き換える）
+DEFAULT_OUTPUTS = {
+    "analysis": "<分析>\nモックサーバーによる分析（{digest}）: 追加情報なしで返信できます。\n</分析>",
+    "calendar": (
+        "<分析>\nモックサーバーによる分析（{digest}）: 日程の調整が必要です。\n</分析>\n"
+        "<必要情報>\n<タイプ>カレンダー</タイプ>\n<詳細>打ち合わせの候補日時</詳細>\n"
+        "<日程候補>\n<候補>5月10日14:00-15:00</候補>\n<候補>5月12日15:00-16:00</候補>\n</日程候補>\n</必要情報>"
+    ),
+    "reply": "<返信>\nお問い合わせいただきありがとうございます（{digest}）。内容を確認のうえ、改めてご連絡いたします。\n</返信>",
+    "summary": "<要約>\n- モックサーバーによるスレッドの要約（{digest}）\n</要約>",
+}
+
+class LatencyModel:
+    """応答時間の分布（最初のトークンまでの時間とチャンクごとの間隔）
+
+    distribution は "fixed"（常に median 秒）、"uniform"（min〜max 秒）、
+    "lognormal"（中央値 median、ばらつき sigma の対数正規分布。テールの長い分布の模擬）。
+    """
+
+    def __init__(self, distribution="lognormal", median=0.8, sigma=0.5, minimum=0.2, maximum=2.0, chunk_delay=0.02, seed=None):
+        self.distribution = distribution
+        self.median = median
+        self.sigma = sigma
+        self.minimum = minimum
+        self.maximum = maximum
+        self.chunk_delay = chunk_delay
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def first_token(self):
+        """最初のトークンまでの秒数"""
+        with self._lock:
+            if self.distribution == "fixed":
+                return self.median
+            if self.distribution == "uniform":
+                return self.random.uniform(self.minimum, self.maximum)
+            return self.random.lognormvariate(math.log(self.median), self.sigma)
+
+class MockLLMServer:
+    """Anthropic Messages API と OpenAI Chat Completions API を模擬するHTTPサーバー（負荷試験用）
+
+    ステージはリクエストの内容から判定し（システムプロンプトに要約タグがある場合はスレッドの要約、
+    返信タグがない場合は分析、ユーザーメッセージに「# メール分析結果」がある場合は返信作成、
+    それ以外は分析・返信一括）、
+    定型のタグ形式の出力を返す。応答時間は LatencyModel に従い、指定した割合で 429・5xx を返す。
+    """
+
+    def __init__(self, host="127.0.0.1", port=8787, latency=None, rate_429=0.0, rate_5xx=0.0,
+                 retry_after=1.0, calendar_rate=0.0, outputs=None, chunk_size=16, seed=None):
+        """
+        初期化
+
+        Args:
+            host: 待ち受けるアドレス
+            port: 待ち受けるポート
+            latency: LatencyModel（指定しない場合は既定の対数正規分布）
+            rate_429: 429（レート制限）を返す割合
+            rate_5xx: 500 / 503 / 529 を返す割合
+            retry_after: 429 の Retry-After ヘッダーの秒数
+            calendar_rate: 分析でカレンダーの必要情報を返す割合
+            outputs: DEFAULT_OUTPUTS を上書きするステージごとの出力
+            chunk_size: ストリーミングで1回に送る文字数
+            seed: 乱数のシード（同じシードと同じリクエスト順で同じ結果になる）
+        """
+        self.latency = latency or LatencyModel(seed=seed)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.calendar_rate = calendar_rate
+        self.outputs = {**DEFAULT_OUTPUTS, **(outputs or {})}
+        self.chunk_size = max(1, chunk_size)
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "streamed": 0, "rate_limited": 0, "server_errors": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+            def do_GET(self):
+                # 接続の事前確立（models.list）用
+                if self.path.rstrip("/").endswith("/models") or "/models?" in self.path:
+                    server._send_json(self, 200, {
+                        "object": "list", "data": [{"id": "mock", "type": "model", "object": "model"}],
+                        "has_more": False, "first_id": "mock", "last_id": "mock"
+                    })
+                else:
+                    server._send_json(self, 404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    server._send_json(self, 400, {"error": {"message": "invalid JSON"}})
+                    return
+                if self.path.endswith("/messages"):
+                    server._handle(self, body, "anthropic")
+                elif self.path.endswith("/chat/completions"):
+                    server._handle(self, body, "openai")
+                else:
+                    server._send_json(self, 404, {"error": {"message": "not found"}})
+
+        return Handler
+
+    def _send_json(self, handler, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _inject_error(self, handler, api):
+        """指定した割合で 429・5xx を返す（返した場合はTrue）"""
+        with self._lock:
+            roll = self.random.random()
+            status_5xx = self.random.choice([500, 503, 529])
+        if roll < self.rate_429:
+            self._count("rate_limited")
+            error_type = "rate_limit_error" if api == "anthropic" else "rate_limit_exceeded"
+            self._send_json(handler, 429, self._error_body(api, error_type, "モックサーバーのレート制限"),
+                            headers={"Retry-After": str(self.retry_after)})
+            return True
+        if roll < self.rate_429 + self.rate_5xx:
+            self._count("server_errors")
+            error_type = "overloaded_error" if status_5xx == 529 else "api_error"
+            self._send_json(handler, status_5xx, self._error_body(api, error_type, "モックサーバーのエラー"))
+            return True
+        return False
+
+    def _error_body(self, api, error_type, message):
+        if api == "anthropic":
+            return {"type": "error", "error": {"type": error_type, "message": message}}
+        return {"error": {"type": error_type, "message": message, "code": error_type}}
+
+    def _messages(self, body, api):
+        """(システムプロンプト, ユーザーメッセージ) を取り出す"""
+        def text_of(content):
+            if isinstance(content, list):
+                return "\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+            return content or ""
+
+        system = text_of(body.get("system")) if api == "anthropic" else ""
+        user = ""
+        for message in body.get("messages", []):
+            if message.get("role") == "system":
+                system += text_of(message.get("content"))
+            elif message.get("role") == "user":
+                user += text_of(message.get("content"))
+        return system, user
+
+    def _output(self, system, user):
+        """リクエストの内容から判定したステージの定型出力を作成"""
+        digest = int(hashlib.sha256(f"{system}\n{user}".encode("utf-8")).hexdigest(), 16) % 10000
+        if "<要約>" in system:
+            text = self.outputs["summary"]
+        elif "<返信>" not in system:
+            with self._lock:
+                calendar = self.random.random() < self.calendar_rate
+            text = self.outputs["calendar" if calendar else "analysis"]
+        elif "# メール分析結果" in user:
+            text = self.outputs["reply"]
+        else:
+            text = f"{self.outputs['analysis']}\n{self.outputs['reply']}"
+        return text.replace("{digest}", f"{digest:04d}")
+
+    def _chunks(self, text):
+        return [text[index:index + self.chunk_size] for index in range(0, len(text), self.chunk_size)]
+
+    def _handle(self, handler, body, api):
+        self._count("requests")
+        if self._inject_error(handler, api):
+            return
+
+        system, user = self._messages(body, api)
+        text = self._output(system, user)
+        model = body.get("model", "mock")
+        usage = {"input": max(1, len(system + user) // 2), "output": max(1, len(text) // 2)}
+        chunks = self._chunks(text)
+        time.sleep(self.latency.first_token())
+
+        if body.get("stream"):
+            self._count("streamed")
+            self._stream(handler, api, model, chunks, usage)
+            return
+
+        time.sleep(self.latency.chunk_delay * len(chunks))
+        if api == "anthropic":
+            payload = {
+                "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": usage["input"], "output_tokens": usage["output"],
+                          "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0},
+            }
+        else:
+            payload = {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion",
+                "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": usage["input"], "completion_tokens": usage["output"],
+                          "total_tokens": usage["input"] + usage["output"]},
+            }
+        self._send_json(handler, 200, payload)
+
+    def _stream(self, handler, api, model, chunks, usage):
+        """Server-Sent Events でチャンクを送信（チャンク転送エンコーディングで接続は再利用できる）"""
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def send(event, data):
+            payload = (f"event: {event}\n" if event else "") + f"data: {data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)}\n\n"
+            encoded = payload.encode("utf-8")
+            handler.wfile.write(f"{len(encoded):x}\r\n".encode("ascii") + encoded + b"\r\n")
+            handler.wfile.flush()
+
+        try:
+            if api == "anthropic":
+                message_id = f"msg_{uuid.uuid4().hex[:24]}"
+                send("message_start", {"type": "message_start", "message": {
+                    "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+                    "stop_reason": None, "stop_sequence": None,
+                    "usage": {"input_tokens": usage["input"], "output_tokens": 1,
+                              "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0},
+                }})
+                send("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+                for chunk in chunks:
+                    send("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}})
+                    time.sleep(self.latency.chunk_delay)
+                send("content_block_stop", {"type": "content_block_stop", "index": 0})
+                send("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                       "usage": {"output_tokens": usage["output"]}})
+                send("message_stop", {"type": "message_stop"})
+            else:
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+                created = int(time.time())
+                for index, chunk in enumerate(chunks):
+                    delta = {"content": chunk}
+                    if index == 0:
+                        delta["role"] = "assistant"
+                    send(None, {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                                "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                    time.sleep(self.latency.chunk_delay)
+                send(None, {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                send(None, "[DONE]")
+            handler.wfile.write(b"0\r\n\r\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアントが途中で切断した場合（タイムアウト・キャンセル）
+            handler.close_connection = True
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def serve_forever(self):
+        logger.info(f"モックLLMサーバーを起動しました: {self.base_url}")
+        self.httpd.serve_forever()
+
+    def start(self):
+        """別スレッドで起動（同じプロセス内での計測用）"""
+        thread = threading.Thread(target=self.serve_forever, name="mock-llm-server", daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main(argv=None):
+    """モックLLMサーバーを起動
+
+    例: python -m gmail_discord_bot.ai_module.mock_llm_server --port 8787 --median 1.0 --rate-429 0.05
+    .env で CLAUDE_BASE_URL=http://127.0.0.1:8787、OPENAI_BASE_URL=http://127.0.0.1:8787/v1 を指定して使う。
+    """
+    parser = argparse.ArgumentParser(description="Anthropic / OpenAI API を模擬するローカルHTTPサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal",
+                        help="最初のトークンまでの時間の分布（既定: lognormal）")
+    parser.add_argument("--median", type=float, default=0.8, help="fixed / lognormal の中央値（秒）")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal のばらつき")
+    parser.add_argument("--min", dest="minimum", type=float, default=0.2, help="uniform の最小値（秒）")
+    parser.add_argument("--max", dest="maximum", type=float, default=2.0, help="uniform の最大値（秒）")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="ストリーミングのチャンク間隔（秒）")
+    parser.add_argument("--chunk-size", type=int, default=16, help="ストリーミングで1回に送る文字数")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="429 を返す割合")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="500 / 503 / 529 を返す割合")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 の Retry-After（秒）")
+    parser.add_argument("--calendar-rate", type=float, default=0.0, help="分析でカレンダーの必要情報を返す割合")
+    parser.add_argument("--outputs", help="ステージ（analysis / calendar / reply / summary）ごとの出力を上書きするJSONファイル")
+    parser.add_argument("--seed", type=int, help="乱数のシード")
+    args = parser.parse_args(argv)
+
+    outputs = None
+    if args.outputs:
+        with open(args.outputs, "r", encoding="utf-8") as f:
+            outputs = json.load(f)
+
+    server = MockLLMServer(
+        host=args.host, port=args.port,
+        latency=LatencyModel(args.distribution, args.median, args.sigma, args.minimum, args.maximum,
+                             args.chunk_delay, seed=args.seed),
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, retry_after=args.retry_after,
+        calendar_rate=args.calendar_rate, outputs=outputs, chunk_size=args.chunk_size, seed=args.seed
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info(f"モックLLMサーバーを停止しました: {server.get_stats()}")
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+
+from ..utils.logger import setup_logger
+from ..utils.output_saver import OutputSaver
+from ..utils.tag_parser import TaggedOutput
+from ..utils.llm_ledger import track_llm_call
+from ..utils.text_compactor import estimate_tokens
+
+logger = setup_logger(__name__)
+
+# 返信候補の定型文（プロンプトのハッシュで選ぶため、同じ入力には常に同じ返信を返す）
+MOCK_REPLIES = [
+    "お問い合わせいただきありがとうございます。内容を確認のうえ、改めてご連絡いたします。",
+    "ご連絡ありがとうございます。承知いたしました。",
+    "メールを拝見しました。詳細を確認し、追ってご返信いたします。",
+]
+
+class MockResponseProcessor:
+    """APIを呼ばずに決まった応答を返すAIプロバイダー（動作確認・負荷試験用）
+
+    ChatGPT・Claude の応答処理クラスと同じメソッドを持ち、プロンプトのハッシュから
+    決まったタグ形式の応答を作成して同じ解析処理に通す。APIキーやSDKは不要。
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        初期化
+
+        Args:
+            latency: 1回の呼び出しで待つ秒数（APIの応答時間の模擬）
+        """
+        self.model = "mock"
+        self.latency = latency
+        self.output_saver = OutputSaver()  # LLM出力保存用
+        # ProviderRouter との互換のため（このプロバイダーは例外を送出しない）
+        self.strict = False
+
+    async def warmup(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _digest(self, prompt):
+        return int(hashlib.sha256((prompt or "").encode("utf-8")).hexdigest(), 16)
+
+    async def _complete(self, stage, prompt, text):
+        """呼び出しを模擬して台帳に記録"""
+        async with track_llm_call("mock", stage, f"mock:{stage}", self.model) as call:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            call.set_usage(estimate_tokens(prompt), estimate_tokens(text))
+        return text
+
+    def _analysis_text(self, prompt):
+        return f"<分析>\nモック分析（{self._digest(prompt) % 10000:04d}）: 追加情報は不要です。\n</分析>"
+
+    def _reply(self, prompt, index=0):
+        return MOCK_REPLIES[(self._digest(prompt) + index) % len(MOCK_REPLIES)]
+
+    async def analyze_email(self, prompt, email_id=None, deadline=None, signals=None):
+        """メールを分析（追加情報は常に不要と判定する）"""
+        analysis_text = await self._complete("analysis", prompt, self._analysis_text(prompt))
+        output = TaggedOutput(analysis_text)
+        return {
+            "analysis": output.analysis,
+            "required_info": output.required_info()
+        }
+
+    async def analyze_and_respond(self, prompt, email_id=None, signature=None, deadline=None, on_partial=None, signals=None):
+        """分析と返信の作成を1回で行う"""
+        response_text = await self._complete(
+            "combined", prompt, f"{self._analysis_text(prompt)}\n<返信>\n{self._reply(prompt)}\n</返信>"
+        )
+        analysis_result, responses = self.parse_combined_response(response_text)
+        if on_partial and responses:
+            await on_partial(0, responses[0])
+        return analysis_result, responses
+
+    async def generate_responses(self, prompt, analysis_result=None, num_responses=1, email_id=None, additional_info=None, signature=None, deadline=None, on_partial=None, signals=None):
+        """返信候補を num_responses 件作成"""
+        response_text = await self._complete(
+            "generation", prompt,
+            "\n".join(f"<返信>\n{self._reply(prompt, index)}\n</返信>" for index in range(num_responses))
+        )
+        responses = TaggedOutput(response_text).responses()
+        if on_partial:
+            for index, response in enumerate(responses):
+                await on_partial(index, response)
+        logger.info(f"{len(responses)}件の返信候補を生成しました（モック）")
+        return responses
+
+    async def summarize_thread(self, prompt, max_tokens=800, deadline=None):
+        """スレッドの要約を作成（これまでの要約に新しいメッセージの件名を経緯として追加する）"""
+        previous, _, new_messages = (prompt or "").partition("# 新しいメッセージ")
+        lines = [line for line in previous.splitlines() if line.startswith("- ")]
+        lines += [f"- {line[len('件名: '):]}" for line in new_messages.splitlines() if line.startswith("件名: ")]
+        summary_text = await self._complete("summary", prompt, "<要約>\n" + "\n".join(lines) + "\n</要約>")
+        return TaggedOutput(summary_text).summary
+
+    def parse_combined_response(self, response_text):
+        """分析・返信一括の応答を分析結果と返信候補に分ける"""
+        output = TaggedOutput(response_text)
+        analysis_result = {
+            "analysis": output.analysis,
+            "required_info": output.required_info()
+        }
+        responses = None
+        if not analysis_result["required_info"].get("type") and output.has_responses:
+            responses = output.responses()
+        return analysis_result, responses
@@ -0,0 +1,184 @@
+import re
+import threading
+
+from ..config import config
+from ..utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 引用の見出し行（英語のGmail形式と日本語のGmail形式）
+QUOTE_HEADER_PATTERN = re.compile(r'^(On .+wrote:|\d{4}年\d{1,2}月\d{1,2}日.+<[^<>]+>:|-+\s*Original Message\s*-+)\s*$', re.MULTILINE)
+# 行頭の引用記号（"> > " のようなネストを含む）
+QUOTE_PREFIX_PATTERN = re.compile(r'^((?:>\s?)+)', re.MULTILINE)
+# プロンプトキャッシュの読み込み・書き込みの入力単価に対する係数
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+class RoutingSignals:
+    """モデルの切り替えに使うメールの特徴"""
+
+    def __init__(self, body_length=0, thread_depth=0, required_info_type=None):
+        self.body_length = body_length
+        self.thread_depth = thread_depth
+        self.required_info_type = required_info_type
+
+    @classmethod
+    def from_prompt(cls, prompt, analysis_result=None):
+        """プロンプトと分析結果から特徴を抽出"""
+        prompt = prompt or ""
+        quote_depth = max((match.group(1).count('>') for match in QUOTE_PREFIX_PATTERN.finditer(prompt)), default=0)
+        header_count = len(QUOTE_HEADER_PATTERN.findall(prompt))
+        required_info_type = None
+        if analysis_result:
+            required_info_type = analysis_result.get("required_info", {}).get("type")
+        return cls(
+            body_length=len(prompt),
+            thread_depth=max(quote_depth, header_count),
+            required_info_type=required_info_type
+        )
+
+    @classmethod
+    def from_email(cls, email_data):
+        """圧縮前のメール本文から特徴を抽出（本文の圧縮で除かれる引用履歴もスレッドの深さに数える）"""
+        return cls.from_prompt(email_data.get('body', ''))
+
+    def with_analysis(self, analysis_result):
+        """分析結果の必要情報タイプを加えた特徴を返す"""
+        required_info_type = self.required_info_type
+        if analysis_result:
+            required_info_type = analysis_result.get("required_info", {}).get("type")
+        return RoutingSignals(self.body_length, self.thread_depth, required_info_type)
+
+    def __repr__(self):
+        return f"RoutingSignals(body_length={self.body_length}, thread_depth={self.thread_depth}, required_info_type={self.required_info_type})"
+
+class RouteStats:
+    """ルート（ステージとモデルの組み合わせ）ごとの呼び出し回数・レイテンシ・トークン数・コスト"""
+
+    def __init__(self):
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, model, elapsed, input_tokens, output_tokens, cost, cache_read_tokens=0, cache_write_tokens=0):
+        with self._lock:
+            stats = self.routes.setdefault(route, {
+                "model": model, "calls": 0, "total_seconds": 0.0,
+                "input_tokens": 0, "output_tokens": 0, "cost": 0.0,
+                "cache_read_tokens": 0, "cache_write_tokens": 0
+            })
+            stats["calls"] += 1
+            stats["total_seconds"] += elapsed
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cache_read_tokens"] += cache_read_tokens
+            stats["cache_write_tokens"] += cache_write_tokens
+            stats["cost"] += cost
+
+    @staticmethod
+    def _hit_rate(stats):
+        """入力トークンのうちプロンプトキャッシュから読み込まれた割合"""
+        total = stats["input_tokens"] + stats["cache_read_tokens"] + stats["cache_write_tokens"]
+        return round(stats["cache_read_tokens"] / total, 3) if total else 0.0
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                route: {
+                    "model": stats["model"],
+                    "calls": stats["calls"],
+                    "avg_seconds": round(stats["total_seconds"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                    "input_tokens": stats["input_tokens"],
+                    "output_tokens": stats["output_tokens"],
+                    "cache_read_tokens": stats["cache_read_tokens"],
+                    "cache_write_tokens": stats["cache_write_tokens"],
+                    "prompt_cache_hit_rate": self._hit_rate(stats),
+                    "cost_usd": round(stats["cost"], 4),
+                }
+                for route, stats in self.routes.items()
+            }
+
+class ModelRoutingPolicy:
+    """パイプラインのステージごとに使うモデルを選ぶポリシー
+
+    email_settings.json の "model_routing" で、プロバイダーとステージ（analysis / generation /
+    combined）ごとに通常のモデルと格上げ先のモデルを指定する。本文が長い、スレッドが深い、
+    または特定の必要情報タイプが検出された場合は格上げ先のモデルを使う。
+    設定がないステージは .env で指定されたモデルを使う。
+    """
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.enabled = settings.get("enabled", False)
+        self.providers = settings.get("providers", {})
+        escalation = settings.get("escalation", {})
+        self.escalate_body_chars = escalation.get("body_chars", 4000)
+        self.escalate_thread_depth = escalation.get("thread_depth", 3)
+        self.escalate_info_types = set(escalation.get("required_info_types", []))
+        self.costs = settings.get("costs_per_million_tokens", {})
+        self.stats = RouteStats()
+
+    def should_escalate(self, signals):
+        """格上げの条件を満たすか判定し、理由を返す（満たさない場合はNone）"""
+        if signals is None:
+            return None
+        if signals.body_length >= self.escalate_body_chars:
+            return f"本文が長い（{signals.body_length}文字）"
+        if signals.thread_depth >= self.escalate_thread_depth:
+            return f"スレッドが深い（{signals.thread_depth}階層）"
+        if signals.required_info_type in self.escalate_info_types:
+            return f"必要情報タイプが {signals.required_info_type}"
+        return None
+
+    def select(self, provider, stage, default_model, signals=None):
+        """
+        使用するモデルを選択
+
+        Returns:
+            (ルート名, モデル名)
+        """
+        if not self.enabled:
+            return f"{provider}:{stage}", default_model
+        route = self.providers.get(provider, {}).get(stage)
+        if not route:
+            return f"{provider}:{stage}", default_model
+
+        model = route.get("model", default_model)
+        reason = self.should_escalate(signals) if route.get("escalate_to") else None
+        if reason:
+            logger.info(f"{stage} のモデルを {route['escalate_to']} に格上げします: {reason}")
+            return f"{provider}:{stage}:escalated", route["escalate_to"]
+        return f"{provider}:{stage}", model
+
+    def estimate_cost(self, model, input_tokens, output_tokens, cache_read_tokens=0, cache_write_tokens=0):
+        """トークン数からコスト（USD）を見積もる（単価が設定されていない場合は0）
+
+        プロンプトキャッシュの読み込みは入力単価の0.1倍、書き込みは1.25倍で計算する。
+        """
+        prices = self.costs.get(model)
+        if not prices:
+            return 0.0
+        input_price = prices.get("input", 0)
+        return (
+            input_tokens * input_price
+            + cache_read_tokens * input_price * CACHE_READ_PRICE_FACTOR
+            + cache_write_tokens * input_price * CACHE_WRITE_PRICE_FACTOR
+            + output_tokens * prices.get("output", 0)
+        ) / 1_000_000
+
+    def record(self, route, model, elapsed, input_tokens=0, output_tokens=0, price_factor=1.0, cache_read_tokens=0, cache_write_tokens=0):
+        """ルートごとのレイテンシ・トークン数・コストを記録し、見積もったコストを返す（price_factor はバッチ割引などの係数）"""
+        cost = self.estimate_cost(model, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens) * price_factor
+        self.stats.record(route, model, elapsed, input_tokens, output_tokens, cost, cache_read_tokens, cache_write_tokens)
+        return cost
+
+    def get_stats(self):
+        return self.stats.to_dict()
+
+_model_policy = None
+
+def get_model_policy():
+    """設定に従ってプロセス共通のモデル選択ポリシーを取得"""
+    global _model_policy
+    if _model_policy is None:
+        _model_policy = ModelRoutingPolicy(config.get_email_settings().get("model_routing", {}))
+    return _model_policy
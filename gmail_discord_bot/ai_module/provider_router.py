@@ -0,0 +1,349 @@
+import asyncio
+import time
+from collections import deque
+
+from ..utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """プロバイダーごとのサーキットブレーカー
+
+    連続して failure_threshold 回失敗すると開放状態になり、cooldown 秒間はそのプロバイダーを
+    使わない。クールダウン後は半開状態で1件だけ試行し、成功すれば閉じ、失敗すれば再び開く。
+    試行の結果が出るまでは、他のリクエストは開放状態と同じく送らない。
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=60):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def allow(self):
+        """リクエストを送ってよいか判定（半開状態では試行中のリクエストがない場合だけ許可）"""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self.probing
+        return self.state == CLOSED
+
+    def acquire(self):
+        """リクエストの送信直前に呼び出し、送ってよいか判定（半開状態では試行中として記録する）"""
+        if not self.allow():
+            return False
+        if self.state == HALF_OPEN:
+            self.probing = True
+        return True
+
+    def release(self):
+        """結果が出ないまま終わった試行（キャンセルなど）を取り消し、次のリクエストで試行できるようにする"""
+        self.probing = False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+class ProviderHealth:
+    """プロバイダーごとの直近の成功・失敗とレイテンシ"""
+
+    def __init__(self, name, processor, breaker, window=50, error_window=300):
+        self.name = name
+        self.processor = processor
+        self.breaker = breaker
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.error_window = error_window
+        self.calls = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record_success(self, elapsed):
+        self.calls += 1
+        self.latencies.append(elapsed)
+        self.outcomes.append((time.monotonic(), True))
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.calls += 1
+        self.failures += 1
+        self.outcomes.append((time.monotonic(), False))
+        self.breaker.record_failure()
+
+    def error_rate(self, min_samples=1):
+        """直近 error_window 秒以内の呼び出しのエラー率（サンプルが min_samples 未満の場合は0）
+
+        古い結果を除外することで、一度優先順位を下げたプロバイダーも時間が経てば優先に戻る。
+        """
+        now = time.monotonic()
+        recent = [ok for at, ok in self.outcomes if now - at <= self.error_window]
+        if len(recent) < min_samples:
+            return 0.0
+        return recent.count(False) / len(recent)
+
+    def latency_percentile(self, percentile):
+        """直近の成功した呼び出しのレイテンシのパーセンタイル（サンプルがない場合はNone）"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self):
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        return {
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate(), 3),
+            "p50_seconds": round(p50, 2) if p50 is not None else None,
+            "p95_seconds": round(p95, 2) if p95 is not None else None,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+class ProviderRouter:
+    """複数のAIプロバイダーに振り分ける応答処理クラス
+
+    各プロバイダーの処理クラスと同じメソッド（analyze_email / generate_responses /
+    analyze_and_respond）を持ち、次のように呼び出し先を選ぶ。
+
+    - サーキットブレーカーが開いているプロバイダー、エラー率が高いプロバイダーは後回しにする
+    - 優先プロバイダーの応答が直近のレイテンシのパーセンタイルを超えたら、次のプロバイダーにも
+      同じリクエストを送り（ヘッジ）、先に返った有効な応答を採用してもう一方はキャンセルする
+    - 優先プロバイダーが失敗した場合はすぐに次のプロバイダーへ切り替える
+    """
+
+    def __init__(self, processors, hedge_percentile=95, hedge_min_delay=2.0, default_hedge_delay=10.0,
+                 failure_threshold=3, cooldown=60, max_error_rate=0.5, window=50, error_window=300, min_samples=3):
+        """
+        初期化
+
+        Args:
+            processors: (プロバイダー名, 処理クラス) のリスト（優先順）
+            hedge_percentile: ヘッジを送るまでの待ち時間に使うレイテンシのパーセンタイル
+            hedge_min_delay: ヘッジを送るまでの最短の待ち時間（秒）
+            default_hedge_delay: レイテンシのサンプルがない場合の待ち時間（秒）
+            failure_threshold: サーキットブレーカーを開く連続失敗回数
+            cooldown: サーキットブレーカーを開いておく時間（秒）
+            max_error_rate: これを超えるエラー率のプロバイダーは優先順位を下げる
+            window: エラー率・レイテンシの集計に使う直近の呼び出し数
+            error_window: エラー率の集計対象とする期間（秒）
+            min_samples: エラー率で優先順位を下げるのに必要な最小の呼び出し数
+        """
+        self.providers = []
+        for name, processor in processors:
+            # 失敗を定型文ではなく例外で受け取る
+            processor.strict = True
+            breaker = CircuitBreaker(failure_threshold=failure_threshold, cooldown=cooldown)
+            self.providers.append(ProviderHealth(name, processor, breaker, window=window, error_window=error_window))
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.strict = False
+
+        # 保存処理・カレンダー処理は優先プロバイダーのものを共有する
+        self.output_saver = self.providers[0].processor.output_saver
+        logger.info(f"プロバイダールーターを初期化しました: {[p.name for p in self.providers]}")
+
+    @property
+    def schedule_analyzer(self):
+        """優先プロバイダーのカレンダー処理（参照した時点で作成される）"""
+        return self.providers[0].processor.schedule_analyzer
+
+    def _candidates(self, method):
+        """呼び出し可能なプロバイダーを優先順に並べる"""
+        usable = [p for p in self.providers if hasattr(p.processor, method)]
+        healthy = [p for p in usable if p.error_rate(self.min_samples) <= self.max_error_rate]
+        degraded = [p for p in usable if p.error_rate(self.min_samples) > self.max_error_rate]
+        return [p for p in healthy + degraded if p.breaker.allow()]
+
+    def _hedge_delay(self, provider):
+        """ヘッジを送るまでの待ち時間"""
+        latency = provider.latency_percentile(self.hedge_percentile)
+        if latency is None or len(provider.latencies) < 5:
+            return self.default_hedge_delay
+        return max(self.hedge_min_delay, latency)
+
+    def _partial_gate(self, on_partial):
+        """逐次表示は最初に出力を返したプロバイダーだけが行うようにする"""
+        owner = {"name": None}
+
+        def for_provider(name):
+            async def forward(index, text):
+                if owner["name"] is None:
+                    owner["name"] = name
+                if owner["name"] == name:
+                    await on_partial(index, text)
+            return forward
+
+        return for_provider
+
+    async def _call(self, provider, method, args, kwargs):
+        """プロバイダーを呼び出し、結果と所要時間を記録"""
+        started = time.monotonic()
+        try:
+            result = await getattr(provider.processor, method)(*args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            provider.record_failure()
+            logger.warning(f"プロバイダー {provider.name} の {method} が失敗しました: {e}（状態: {provider.breaker.state}）")
+            raise
+        provider.record_success(time.monotonic() - started)
+        return result
+
+    async def _route(self, method, *args, **kwargs):
+        """優先プロバイダーを呼び出し、遅延・失敗時は次のプロバイダーにヘッジ・フェイルオーバーする"""
+        candidates = self._candidates(method)
+        if not candidates:
+            raise RuntimeError(f"{method} を実行できるプロバイダーがありません（すべてのサーキットブレーカーが開いています）")
+
+        on_partial = kwargs.pop("on_partial", None)
+        gate = self._partial_gate(on_partial) if on_partial else None
+
+        def start_next():
+            """控えのプロバイダーを順に試し、送信を許可された最初のプロバイダーで開始（なければNone）"""
+            while remaining:
+                provider = remaining.pop(0)
+                if not provider.breaker.acquire():
+                    continue
+                call_kwargs = dict(kwargs)
+                if gate:
+                    call_kwargs["on_partial"] = gate(provider.name)
+                task = asyncio.ensure_future(self._call(provider, method, args, call_kwargs))
+                # ヘッジで負けてキャンセルされた試行は結果が出ないため、半開状態の試行を取り消す
+                task.add_done_callback(lambda done, breaker=provider.breaker: breaker.release() if done.cancelled() else None)
+                tasks[task] = provider
+                return provider
+            return None
+
+        tasks = {}
+        remaining = list(candidates)
+        last_error = None
+        try:
+            if start_next() is None:
+                raise RuntimeError(f"{method} を実行できるプロバイダーがありません（半開状態のプロバイダーは試行中です）")
+            while tasks:
+                # 実行中が1件だけで控えのプロバイダーがある場合は、ヘッジまでの時間だけ待つ
+                timeout = None
+                if len(tasks) == 1 and remaining:
+                    timeout = self._hedge_delay(next(iter(tasks.values())))
+                done, _ = await asyncio.wait(list(tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    slow = next(iter(tasks.values()))
+                    hedge = start_next()
+                    if hedge:
+                        hedge.hedges += 1
+                        logger.info(f"{slow.name} の応答が {timeout:.1f}秒を超えたため {hedge.name} にもリクエストを送ります")
+                    continue
+
+                for task in done:
+                    provider = tasks.pop(task)
+                    if task.exception() is None:
+                        if tasks:
+                            if provider is not candidates[0]:
+                                provider.hedge_wins += 1
+                            logger.info(f"{provider.name} の応答を採用し、他のリクエストをキャンセルします")
+                        return task.result()
+                    last_error = task.exception()
+
+                # 失敗した場合は次のプロバイダーにすぐ切り替える
+                if not tasks:
+                    start_next()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        raise last_error
+
+    async def _route_with_fallback(self, method, fallback, *args, **kwargs):
+        """全プロバイダーが失敗した場合は定型の結果を返す（strict の場合は例外を送出）"""
+        try:
+            return await self._route(method, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"すべてのプロバイダーで {method} が失敗しました: {e}")
+            if self.strict:
+                raise
+            return fallback
+
+    async def analyze_email(self, prompt, email_id=None, deadline=None, signals=None):
+        """メールを分析"""
+        return await self._route_with_fallback(
+            "analyze_email",
+            {"analysis": "分析中にエラーが発生しました。", "required_info": {"type": None}},
+            prompt, email_id=email_id, deadline=deadline, signals=signals
+        )
+
+    async def analyze_and_respond(self, prompt, email_id=None, signature=None, deadline=None, on_partial=None, signals=None):
+        """1回のAPI呼び出しでメールの分析と返信の作成を行う"""
+        return await self._route_with_fallback(
+            "analyze_and_respond",
+            ({"analysis": "分析中にエラーが発生しました。", "required_info": {"type": None}}, None),
+            prompt, email_id=email_id, signature=signature, deadline=deadline, on_partial=on_partial, signals=signals
+        )
+
+    async def generate_responses(self, prompt, analysis_result=None, num_responses=1, email_id=None, additional_info=None, signature=None, deadline=None, on_partial=None, signals=None):
+        """返信を生成"""
+        return await self._route_with_fallback(
+            "generate_responses",
+            [
+                "申し訳ありません。返信の生成中にエラーが発生しました。",
+                "しばらく経ってからもう一度お試しください。"
+            ],
+            prompt, analysis_result, num_responses=num_responses, email_id=email_id,
+            additional_info=additional_info, signature=signature, deadline=deadline, on_partial=on_partial,
+            signals=signals
+        )
+
+    async def summarize_thread(self, prompt, max_tokens=800, deadline=None):
+        """メールスレッドの要約を更新"""
+        return await self._route_with_fallback(
+            "summarize_thread", None, prompt, max_tokens=max_tokens, deadline=deadline
+        )
+
+    def parse_combined_response(self, response_text):
+        """分析・返信一括プロンプトの応答を分析結果と返信候補に分ける"""
+        return self.providers[0].processor.parse_combined_response(response_text)
+
+    async def warmup(self):
+        """全プロバイダーへの接続を事前に確立（1つでも成功すれば準備完了とする）"""
+        warmups = [p.processor.warmup() for p in self.providers if hasattr(p.processor, 'warmup')]
+        results = await asyncio.gather(*warmups, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        for error in errors:
+            logger.warning(f"一部のプロバイダーの事前接続に失敗しました: {error}")
+
+    async def close(self):
+        """全プロバイダーの接続を閉じる"""
+        for provider in self.providers:
+            if hasattr(provider.processor, 'close'):
+                try:
+                    await provider.processor.close()
+                except Exception as e:
+                    logger.error(f"{provider.name} の接続終了エラー: {e}")
+
+    def get_stats(self):
+        """プロバイダーごとの状態・エラー率・レイテンシを取得"""
+        return {p.name: p.to_dict() for p in self.providers}
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+
+from ..config import config
+from ..utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+class TokenBucket:
+    """1分あたりの上限から毎秒補充されるバケット（容量は1分ぶん）"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """amount を取り出せるまでの秒数"""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        self.level -= amount
+
+class Reservation:
+    """acquire() で確保した枠（実際の使用量で補正するために使う）"""
+
+    def __init__(self, limiter, estimated_tokens):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self.reconciled = False
+
+    def reconcile(self, actual_tokens):
+        """見積もったトークン数と実際のトークン数の差をバケットに反映（1回だけ）"""
+        if self.reconciled:
+            return
+        self.reconciled = True
+        self.limiter.reconcile(self, actual_tokens)
+
+class RateLimiter:
+    """プロバイダー・モデルごとのリクエスト数（RPM）とトークン数（TPM）の制限
+
+    リクエスト前に見積もったトークン数を確保し、上限に達している場合は補充されるまで待つ。
+    待機中のリクエストは到着順に処理する（先頭が待っている間は後続も待つ）。
+    応答後は実際のトークン数で補正し、429 を受けた場合は Retry-After の間すべて止める。
+    """
+
+    def __init__(self, name, rpm=None, tpm=None):
+        """
+        初期化
+
+        Args:
+            name: ログ・統計用の名前（"claude:モデル名" など）
+            rpm: 1分あたりの最大リクエスト数（Noneの場合は制限しない）
+            tpm: 1分あたりの最大トークン数（入力と出力の合計。Noneの場合は制限しない）
+        """
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "acquired": 0, "waited": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0,
+            "estimated_tokens": 0, "actual_tokens": 0, "rate_limited": 0
+        }
+
+    def _wait_time(self, estimated_tokens):
+        now = time.monotonic()
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests:
+            self.requests.refill(now)
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens:
+            self.tokens.refill(now)
+            wait = max(wait, self.tokens.wait_time(estimated_tokens))
+        return wait
+
+    async def acquire(self, estimated_tokens=0, timeout=None):
+        """
+        リクエストの枠を確保（上限に達している場合は待機）
+
+        Args:
+            estimated_tokens: 見積もったトークン数（入力の見積もり + 最大出力トークン数）
+            timeout: 待機の上限（秒）。超える場合は asyncio.TimeoutError を送出
+
+        Returns:
+            Reservation
+        """
+        started = time.monotonic()
+        give_up_at = started + timeout if timeout is not None else None
+
+        async with self._lock:
+            while True:
+                wait = self._wait_time(estimated_tokens)
+                if wait <= 0:
+                    break
+                if give_up_at is not None and time.monotonic() + wait > give_up_at:
+                    raise asyncio.TimeoutError(f"{self.name} のレート制限の待機が期限を超えます（{wait:.1f}秒）")
+                await asyncio.sleep(wait)
+
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(estimated_tokens)
+
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self.stats["acquired"] += 1
+            self.stats["estimated_tokens"] += estimated_tokens
+            if waited >= 0.01:
+                self.stats["waited"] += 1
+                self.stats["total_wait_seconds"] += waited
+                self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        if waited >= 1.0:
+            logger.info(f"{self.name} のレート制限で {waited:.1f}秒待機しました")
+        return Reservation(self, estimated_tokens)
+
+    def reconcile(self, reservation, actual_tokens):
+        """見積もりとの差をバケットに戻す（見積もりより多く使った場合は不足分を差し引く）"""
+        if self.tokens:
+            self.tokens.take(actual_tokens - reservation.estimated_tokens)
+        with self._stats_lock:
+            self.stats["actual_tokens"] += actual_tokens
+
+    def backoff(self, retry_after=None):
+        """429 を受けた場合に Retry-After（不明な場合は5秒）の間リクエストを止める"""
+        seconds = retry_after if retry_after is not None else 5.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        with self._stats_lock:
+            self.stats["rate_limited"] += 1
+        logger.warning(f"{self.name} でレート制限を受けたため {seconds:.1f}秒リクエストを止めます")
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["total_wait_seconds"] = round(stats["total_wait_seconds"], 2)
+        stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 2)
+        return stats
+
+def is_rate_limit_error(error):
+    """APIエラーがレート制限（HTTP 429）によるものか判定"""
+    return getattr(error, "status_code", None) == 429
+
+def retry_after_seconds(error):
+    """APIエラーのレスポンスヘッダーから Retry-After の秒数を取得（取得できない場合はNone）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider, model):
+    """
+    プロバイダー・モデルのレート制限を取得（プロセス内で共有）
+
+    email_settings.json の "rate_limits" でプロバイダーごとの既定値（default）と
+    モデルごとの上書き（models）を指定する。設定がない場合はNoneを返す。
+    """
+    key = f"{provider}:{model}"
+    with _limiters_lock:
+        if key not in _limiters:
+            settings = config.get_email_settings().get("rate_limits", {})
+            provider_settings = settings.get(provider, {}) if settings.get("enabled", False) else {}
+            limits = {**provider_settings.get("default", {}), **provider_settings.get("models", {}).get(model, {})}
+            if limits.get("rpm") or limits.get("tpm"):
+                _limiters[key] = RateLimiter(key, rpm=limits.get("rpm"), tpm=limits.get("tpm"))
+            else:
+                _limiters[key] = None
+        return _limiters[key]
+
+def get_rate_limit_stats():
+    """レート制限ごとの待機回数・待機時間・トークン数を取得"""
+    with _limiters_lock:
+        return {key: limiter.get_stats() for key, limiter in _limiters.items() if limiter}
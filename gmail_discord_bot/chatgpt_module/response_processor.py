@@ -1,44 +1,69 @@
 import re
-import openai
+import time
+import asyncio
 from ..config import config
 from ..utils.logger import setup_logger
-from ..calendar_module.schedule_analyzer import ScheduleAnalyzer
 from ..utils.output_saver import OutputSaver
+from ..utils.executor import get_executor
+from ..utils.response_cache import ResponseCache, get_response_cache
+from ..ai_module.model_routing import RoutingSignals, get_model_policy
+from ..ai_module.candidates import get_candidate_styles
+from ..ai_module.http_pool import get_openai_client, get_pool
+from ..ai_module.rate_limiter import get_rate_limiter, is_rate_limit_error, retry_after_seconds
+from ..utils.text_compactor import estimate_tokens
+from ..utils.tag_parser import TaggedOutput
+from ..utils.llm_ledger import record_cached_call, track_llm_call
 
 logger = setup_logger(__name__)
 
 class ResponseProcessor:
     def __init__(self):
-        openai.api_key = config.OPENAI_API_KEY
-        self.schedule_analyzer = ScheduleAnalyzer()
+        # プロセス共通のクライアントを使い、接続プールを全リクエスト・全処理クラスで共有する
+        # （api_key などのグローバル設定は変更しないため、並行して呼び出しても安全）
+        self.async_client = get_openai_client()
+        self.model = config.OPENAI_MODEL
+        self._schedule_analyzer = None  # カレンダー情報が必要になった時点で作成する
         self.output_saver = OutputSaver()  # LLM出力保存用
         self.settings = config.get_email_settings()
+        self.executor = get_executor()
+        self.response_cache = get_response_cache()
+        self.model_policy = get_model_policy()
+        # Trueの場合はAPIエラー時に定型文を返さず例外を送出する（ProviderRouterでのフェイルオーバー用）
+        self.strict = False
     
-    async def analyze_email(self, prompt, email_id=None):
+    @property
+    def schedule_analyzer(self):
+        """スケジュール分析クラス（Google Calendar のクライアントを含むため初回アクセス時に作成）"""
+        if self._schedule_analyzer is None:
+            from ..calendar_module.schedule_analyzer import ScheduleAnalyzer
+            self._schedule_analyzer = ScheduleAnalyzer()
+        return self._schedule_analyzer
+    
+    async def warmup(self):
+        """APIへの接続を事前に確立（起動時にTLSハンドシェイクを済ませておく）"""
+        await get_pool("openai").warmup(self.async_client.models.list)
+        logger.info("ChatGPT APIへの接続を確立しました")
+    
+    async def close(self):
+        """接続プールを閉じる"""
+        await get_pool("openai").close()
+    
+    async def analyze_email(self, prompt, email_id=None, deadline=None, signals=None):
         """ChatGPT APIを使用してメールを分析"""
         try:
             # メール分析用のシステムプロンプトを取得
             system_prompt = config.get_email_analyzer_prompt()
             
-            response = openai.ChatCompletion.create(
-                model=config.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                n=1
+            # 分析テキストを取得（同一入力はキャッシュから返す）
+            analysis_text = await self._create_completion(
+                "analysis", system_prompt, prompt, max_tokens=1000, deadline=deadline,
+                signals=signals or RoutingSignals.from_prompt(prompt)
             )
             
-            # レスポンスから分析テキストを抽出
-            analysis_text = response.choices[0].message.content
-            
-            # 分析結果を抽出
-            analysis = self._extract_analysis(analysis_text)
-            
-            # 必要情報を抽出
-            required_info = self._extract_required_info(analysis_text)
+            # 分析結果と必要情報を抽出（出力全体を1回だけ走査）
+            output = TaggedOutput(analysis_text)
+            analysis = output.analysis
+            required_info = output.required_info()
             
             # 結果を構造化
             analysis_result = {
@@ -49,7 +74,8 @@ class ResponseProcessor:
             # 結果をファイルに保存（メールIDがある場合のみ）
             if email_id:
                 try:
-                    filepath = self.output_saver.save_analysis(
+                    filepath = await self.executor.run_disk(
+                        self.output_saver.save_analysis,
                         email_id=email_id,
                         analysis_text=analysis_text,
                         analysis_result=analysis_result,
@@ -64,21 +90,88 @@ class ResponseProcessor:
         
         except Exception as e:
             logger.error(f"メール分析API呼び出しエラー: {e}")
+            if self.strict:
+                raise
             return {
                 "analysis": "分析中にエラーが発生しました。",
                 "required_info": {"type": None}
             }
     
-    async def generate_responses(self, prompt, analysis_result=None, num_responses=1, email_id=None):
-        """ChatGPT APIを使用して返信を生成"""
+    async def analyze_and_respond(self, prompt, email_id=None, signature=None, deadline=None, on_partial=None, signals=None):
+        """1回のAPI呼び出しでメールの分析と返信の作成を行う
+
+        追加情報（カレンダー・承認・確認など）が必要と判断された場合は返信を作成しないため、
+        返信候補は None になる。その場合は従来どおり generate_responses を呼び出す。
+
+        Returns:
+            (分析結果, 返信候補のリストまたはNone)
+        """
+        try:
+            # 分析・返信用のシステムプロンプトを取得
+            system_prompt = config.get_email_combined_prompt()
+            full_prompt = f"{prompt}{self._build_signature_info(signature)}"
+            
+            # 分析と返信のテキストを取得（同一入力はキャッシュから返す）
+            response_text = await self._create_completion(
+                "combined", system_prompt, full_prompt, max_tokens=2000, deadline=deadline,
+                signals=signals or RoutingSignals.from_prompt(prompt)
+            )
+            
+            analysis_result, responses = self.parse_combined_response(response_text)
+            
+            # 結果をファイルに保存（メールIDがある場合のみ）
+            if email_id:
+                try:
+                    filepath = await self.executor.run_disk(
+                        self.output_saver.save_analysis,
+                        email_id=email_id,
+                        analysis_text=response_text,
+                        analysis_result=analysis_result,
+                        provider="chatgpt"
+                    )
+                    logger.info(f"メール分析結果を保存しました: {filepath}")
+                    if responses:
+                        filepath = await self.executor.run_disk(
+                            self.output_saver.save_responses,
+                            email_id=email_id,
+                            response_text=response_text,
+                            responses=responses,
+                            provider="chatgpt",
+                            additional_info={}
+                        )
+                        logger.info(f"返信候補を保存しました: {filepath}")
+                except Exception as save_error:
+                    logger.error(f"分析・返信結果の保存に失敗しました: {save_error}")
+            
+            logger.info(
+                f"メール分析・返信完了: 必要情報タイプ={analysis_result['required_info'].get('type', 'なし')}, "
+                f"返信候補={len(responses) if responses else 0}件"
+            )
+            return analysis_result, responses
+        
+        except Exception as e:
+            logger.error(f"メール分析・返信API呼び出しエラー: {e}")
+            if self.strict:
+                raise
+            return {
+                "analysis": "分析中にエラーが発生しました。",
+                "required_info": {"type": None}
+            }, None
+    
+    async def generate_responses(self, prompt, analysis_result=None, num_responses=1, email_id=None, additional_info=None, signature=None, deadline=None, on_partial=None, signals=None):
+        """ChatGPT APIを使用して返信を生成
+
+        num_responses が2以上の場合は、スタイルの異なるリクエストを並行して送り候補を1件ずつ生成し、
+        完成した候補から順に on_partial(index, text) で通知する。ストリーミングは行わない。
+        """
         try:
             # 追加情報の取得
-            additional_info = {}
+            additional_info = additional_info or {}
             additional_info_text = ""
             
             if analysis_result and analysis_result.get("required_info", {}).get("type") == "カレンダー":
                 # カレンダー情報が必要な場合、利用可能なスロットを取得
-                available_slots = self.schedule_analyzer.get_available_slots()
+                available_slots = await self.executor.run_network(self.schedule_analyzer.get_available_slots)
                 slots_text = "\n".join([f"- {slot}" for slot in available_slots])
                 additional_info_text = f"\n\n# 利用可能な日時スロット\n以下の日時が空いています：\n{slots_text}"
                 additional_info = {"type": "カレンダー", "available_slots": available_slots}
@@ -86,15 +179,8 @@ class ResponseProcessor:
             # 返信生成用のシステムプロンプトを取得
             system_prompt = config.get_email_responder_prompt()
             
-            # 署名情報を取得
-            signature_settings = self.settings.get("signature", {})
-            company_name = signature_settings.get("company_name")
-            name = signature_settings.get("name")
-            email = signature_settings.get("email")
-            url = signature_settings.get("url")
-            
             # 署名情報をプロンプトに追加
-            signature_info = f"\n\n# 署名情報\n会社名: {company_name}\n名前: {name}\nEmail: {email}\nURL: {url}"
+            signature_info = self._build_signature_info(signature)
             
             # 分析結果を含めたプロンプトを作成
             full_prompt = prompt
@@ -102,27 +188,27 @@ class ResponseProcessor:
                 analysis = analysis_result.get("analysis", "")
                 full_prompt = f"{prompt}\n\n# メール分析結果\n{analysis}{additional_info_text}{signature_info}"
             
-            response = openai.ChatCompletion.create(
-                model=config.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": full_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000,
-                n=1
-            )
-            
-            # レスポンスから返信テキストを抽出
-            response_text = response.choices[0].message.content
-            
-            # 返信を抽出
-            responses = self._split_responses(response_text)
+            signals = signals.with_analysis(analysis_result) if signals else RoutingSignals.from_prompt(prompt, analysis_result)
+            if num_responses > 1:
+                # 複数の候補を並行して1件ずつ生成
+                responses, response_text = await self._generate_candidates(
+                    system_prompt, full_prompt, num_responses, deadline=deadline, signals=signals, on_partial=on_partial
+                )
+            else:
+                # 返信テキストを取得（同一入力はキャッシュから返す）
+                response_text = await self._create_completion(
+                    "generation", system_prompt, full_prompt, max_tokens=2000, deadline=deadline,
+                    signals=signals
+                )
+                
+                # 返信を抽出
+                responses = TaggedOutput(response_text).responses()
             
             # 結果をファイルに保存（メールIDがある場合のみ）
             if email_id:
                 try:
-                    filepath = self.output_saver.save_responses(
+                    filepath = await self.executor.run_disk(
+                        self.output_saver.save_responses,
                         email_id=email_id,
                         response_text=response_text,
                         responses=responses,
@@ -138,51 +224,175 @@ class ResponseProcessor:
         
         except Exception as e:
             logger.error(f"ChatGPT API呼び出しエラー: {e}")
+            if self.strict:
+                raise
             # エラー時のフォールバック
             return [
                 "申し訳ありません。返信の生成中にエラーが発生しました。",
                 "しばらく経ってからもう一度お試しください。"
             ]
     
-    def _extract_analysis(self, text):
-        """分析結果を抽出"""
-        pattern = r'<分析>(.*?)</分析>'
-        match = re.search(pattern, text, re.DOTALL)
-        if match:
-            return match.group(1).strip()
+    async def _generate_candidates(self, system_prompt, full_prompt, num_responses, deadline=None, signals=None, on_partial=None):
+        """
+        スタイルの異なる返信候補を並行して生成
+        
+        Returns:
+            (返信候補のリスト, 保存用の応答テキスト)
+        """
+        async def generate(index, style):
+            candidate_prompt = f"{full_prompt}\n\n# 返信スタイル\n{style['hint']}\n返信は1件だけ作成してください。"
+            text = await self._create_completion(
+                "generation", system_prompt, candidate_prompt, max_tokens=2000, deadline=deadline,
+                signals=signals, temperature=style.get("temperature", 0.7), cache_variant=index
+            )
+            candidate = TaggedOutput(text).responses()[0]
+            # 完成した候補から順に表示する
+            if on_partial:
+                try:
+                    await on_partial(index, candidate)
+                except Exception as e:
+                    logger.error(f"返信候補の通知エラー: {e}")
+            return text, candidate
+        
+        styles = get_candidate_styles(num_responses)
+        results = await asyncio.gather(
+            *[generate(index, style) for index, style in enumerate(styles)],
+            return_exceptions=True
+        )
+        succeeded = [result for result in results if not isinstance(result, BaseException)]
+        for error in (result for result in results if isinstance(result, BaseException)):
+            logger.error(f"返信候補の生成に失敗しました: {error}")
+        if not succeeded:
+            raise next(result for result in results if isinstance(result, BaseException))
+        
+        response_text = "\n\n".join(text for text, _ in succeeded)
+        return [candidate for _, candidate in succeeded], response_text
+    
+    async def _create_completion(self, stage, system_prompt, user_prompt, max_tokens, deadline=None, signals=None, temperature=0.7, cache_variant=None):
+        """ChatGPT APIを呼び出して応答テキストを返す（応答キャッシュを経由）
+
+        使用するモデルはステージとメールの特徴（signals）からモデル選択ポリシーで決める。
+        cache_variant は同じプロンプトから別々の応答を得る場合（返信候補の番号など）にキャッシュキーを分けるために使う。
+        """
+        route, model = self.model_policy.select("chatgpt", stage, self.model, signals)
+        
+        cache_key = None
+        if self.response_cache:
+            cache_key = ResponseCache.make_key(
+                "chatgpt", model, system_prompt, user_prompt,
+                temperature=temperature, max_tokens=max_tokens, variant=cache_variant
+            )
+            cached_text = await self.response_cache.get(cache_key)
+            if cached_text is not None:
+                logger.info(f"応答キャッシュを使用しました: stage={stage}, {self.response_cache.get_stats()}")
+                await record_cached_call("chatgpt", stage, route, model)
+                return cached_text
+        
+        # レート制限の枠を確保（入力の見積もりと最大出力トークン数の合計）
+        rate_limiter = get_rate_limiter("chatgpt", model)
+        reservation = None
+        if rate_limiter:
+            estimated_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + max_tokens
+            reservation = await rate_limiter.acquire(estimated_tokens, timeout=deadline.remaining() if deadline else None)
+        
+        # 非同期クライアントを使用（イベントループをブロックしない）
+        started = time.monotonic()
+        # 確保した枠は実際の使用量で補正する（429・タイムアウトを含めて失敗した場合は使用量0として枠を戻す）
+        actual_tokens = 0
+        try:
+            # 呼び出しごとのレイテンシ・トークン数・リトライ回数・結果を台帳に記録
+            async with track_llm_call("chatgpt", stage, route, model) as call:
+                try:
+                    response = await self.async_client.chat.completions.create(
+                        model=model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        n=1,
+                        **self._request_options(deadline)
+                    )
+                except Exception as e:
+                    if rate_limiter and is_rate_limit_error(e):
+                        rate_limiter.backoff(retry_after_seconds(e))
+                    raise
+                
+                # ルートごとのレイテンシ・トークン数・コストを記録
+                usage = getattr(response, "usage", None)
+                input_tokens = getattr(usage, "prompt_tokens", 0) or 0
+                output_tokens = getattr(usage, "completion_tokens", 0) or 0
+                cost = self.model_policy.record(
+                    route, model, time.monotonic() - started,
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens
+                )
+                call.set_usage(input_tokens, output_tokens, cost=cost)
+            actual_tokens = input_tokens + output_tokens
+        finally:
+            if reservation:
+                reservation.reconcile(actual_tokens)
+        
+        # レスポンスからテキストを抽出
+        text = response.choices[0].message.content
+        
+        if cache_key:
+            await self.response_cache.set(cache_key, text)
         return text
     
-    def _extract_required_info(self, text):
-        """必要情報を抽出"""
-        # タイプを抽出
-        type_pattern = r'<必要情報>.*?<タイプ>(.*?)</タイプ>.*?</必要情報>'
-        type_match = re.search(type_pattern, text, re.DOTALL)
+    async def summarize_thread(self, prompt, max_tokens=800, deadline=None):
+        """メールスレッドのこれまでの要約と新しいメッセージから、更新した要約を作成
+
+        Returns:
+            要約のテキスト（エラーの場合はNone）
+        """
+        try:
+            summary_text = await self._create_completion(
+                "summary", config.get_thread_summary_prompt(), prompt, max_tokens=max_tokens,
+                deadline=deadline, temperature=0.3
+            )
+            return TaggedOutput(summary_text).summary
+        except Exception as e:
+            logger.error(f"スレッド要約API呼び出しエラー: {e}")
+            if self.strict:
+                raise
+            return None
+    
+    def parse_combined_response(self, response_text):
+        """
+        分析・返信一括プロンプトの応答を分析結果と返信候補に分ける
         
-        # 詳細情報を抽出（存在する場合）
-        details_pattern = r'<必要情報>.*?<詳細>(.*?)</詳細>.*?</必要情報>'
-        details_match = re.search(details_pattern, text, re.DOTALL)
+        Returns:
+            (分析結果, 返信候補のリスト。追加情報が必要な場合や返信タグがない場合はNone)
+        """
+        output = TaggedOutput(response_text)
+        analysis_result = {
+            "analysis": output.analysis,
+            "required_info": output.required_info()
+        }
         
-        if type_match:
-            info_type = type_match.group(1).strip()
-            details = details_match.group(1).strip() if details_match else ""
-            return {
-                "type": info_type,
-                "details": details
-            }
-        return {"type": None, "details": ""}
+        # 追加情報が不要で返信タグがある場合のみ返信候補として扱う
+        responses = None
+        if not analysis_result["required_info"].get("type") and output.has_responses:
+            responses = output.responses()
+        return analysis_result, responses
     
-    def _split_responses(self, response_text):
-        """ChatGPTの応答から返信を抽出"""
-        # XMLタグで囲まれた返信を抽出
-        pattern = r'<返信>(.*?)</返信>'
-        matches = re.findall(pattern, response_text, re.DOTALL)
+    def _build_signature_info(self, signature=None):
+        """署名情報をプロンプト用のテキストに変換（メールボックスごとの署名が指定されていればそちらを優先）"""
+        signature_settings = signature or self.settings.get("signature", {})
+        company_name = signature_settings.get("company_name")
+        name = signature_settings.get("name")
+        email = signature_settings.get("email")
+        url = signature_settings.get("url")
         
-        if matches:
-            # 返信タグが見つかった場合
-            return [match.strip() for match in matches]
-        else:
-            # 返信タグが見つからない場合は、全体を1つの返信として扱う
-            return [response_text.strip()]
+        return f"\n\n# 署名情報\n会社名: {company_name}\n名前: {name}\nEmail: {email}\nURL: {url}"
+    
+    def _request_options(self, deadline):
+        """処理期限の残り時間をAPIリクエストのタイムアウトとして渡す"""
+        if deadline is None:
+            return {}
+        return {"timeout": max(1.0, deadline.remaining())}
     
     def clean_response(self, response_text):
         """返信テキストをクリーンアップ"""
@@ -0,0 +1,121 @@
+from ..config import config
+from ..utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+def format_signature_info(signature_settings):
+    """署名設定をプロンプト用のテキストに変換"""
+    signature_settings = signature_settings or {}
+    return f"""
+
+# 署名情報
+───────────────────
+{signature_settings.get("company_name")}
+{signature_settings.get("name")}
+Email：{signature_settings.get("email")}
+URL: {signature_settings.get("url")}
+───────────────────"""
+
+def _normalize(text):
+    """改行コードと末尾の空白を揃え、同じ内容が常に同じバイト列になるようにする"""
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+class ClaudePromptBuilder:
+    """Claude APIに送るリクエストを組み立てるクラス
+
+    システムプロンプト・返信例・署名を静的なプレフィックスとしてシステムブロックにまとめ、
+    最後のブロックに cache_control を付けてプロンプトキャッシュの対象にする。メールごとに
+    変わる内容はユーザーメッセージにだけ入れるため、同じプロンプトファイル・署名を使う
+    リクエストはプレフィックスのキャッシュを共有できる。
+    """
+
+    def __init__(self, enabled=True, ttl=None, examples=None):
+        """
+        初期化
+
+        Args:
+            enabled: cache_control を付けるか
+            ttl: キャッシュの有効期間（"1h" など。指定しない場合はAPIの既定値の5分）
+            examples: 返信例のリスト（{"email": メール本文, "reply": 返信} の辞書）
+        """
+        self.enabled = enabled
+        self.ttl = ttl
+        self.examples_text = self._format_examples(examples or [])
+
+    def _format_examples(self, examples):
+        """返信例をプロンプト用のテキストに変換"""
+        if not examples:
+            return ""
+        sections = []
+        for number, example in enumerate(examples, 1):
+            sections.append(
+                f"## 例{number}\n### メール\n{_normalize(example.get('email'))}\n\n"
+                f"### 返信\n<返信>\n{_normalize(example.get('reply'))}\n</返信>"
+            )
+        return "# 返信例\n" + "\n\n".join(sections)
+
+    def _cache_control(self):
+        cache_control = {"type": "ephemeral"}
+        if self.ttl:
+            cache_control["ttl"] = self.ttl
+        return cache_control
+
+    def system_blocks(self, system_prompt, signature_info=None, include_examples=False):
+        """
+        静的なプレフィックスのシステムブロックを作成
+
+        Args:
+            system_prompt: システムプロンプト
+            signature_info: 署名情報のテキスト
+            include_examples: 返信例を含めるか（返信を作成するステージのみ）
+
+        Returns:
+            システムブロックのリスト（最後のブロックにcache_controlを付与）
+        """
+        texts = [_normalize(system_prompt)]
+        if include_examples and self.examples_text:
+            texts.append(self.examples_text)
+        if signature_info:
+            texts.append(_normalize(signature_info))
+
+        blocks = [{"type": "text", "text": text} for text in texts if text]
+        if self.enabled and blocks:
+            blocks[-1]["cache_control"] = self._cache_control()
+        return blocks
+
+    def build_request(self, model, max_tokens, temperature, system_prompt, user_prompt, signature_info=None, include_examples=False):
+        """
+        messages.create / messages.stream に渡すリクエストを作成
+
+        Returns:
+            リクエストの辞書
+        """
+        return {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": self.system_blocks(system_prompt, signature_info, include_examples),
+            "messages": [
+                {"role": "user", "content": user_prompt}
+            ],
+        }
+
+    @staticmethod
+    def system_text(blocks):
+        """システムブロックを応答キャッシュのキー用に1つのテキストにまとめる"""
+        return "\n\n".join(block["text"] for block in blocks)
+
+_prompt_builder = None
+
+def get_prompt_builder():
+    """設定に従ってプロセス共通のプロンプト組み立てクラスを取得"""
+    global _prompt_builder
+    if _prompt_builder is None:
+        settings = config.get_email_settings().get("prompt_cache", {})
+        _prompt_builder = ClaudePromptBuilder(
+            enabled=settings.get("enabled", True),
+            ttl=settings.get("ttl"),
+            examples=settings.get("examples", [])
+        )
+    return _prompt_builder
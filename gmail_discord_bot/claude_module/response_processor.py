@@ -1,47 +1,70 @@
 import re
+import time
 import asyncio
-import anthropic
 from ..config import config
 from ..utils.logger import setup_logger
-from ..calendar_module.schedule_analyzer import ScheduleAnalyzer
 from ..utils.output_saver import OutputSaver
+from ..utils.executor import get_executor
+from ..utils.response_cache import ResponseCache, get_response_cache
+from ..ai_module.model_routing import RoutingSignals, get_model_policy
+from ..ai_module.candidates import get_candidate_styles
+from ..ai_module.http_pool import get_anthropic_client, get_pool
+from ..ai_module.rate_limiter import get_rate_limiter, is_rate_limit_error, retry_after_seconds
+from ..utils.text_compactor import estimate_tokens
+from ..utils.tag_parser import IncrementalTagParser, TaggedOutput
+from ..utils.llm_ledger import record_cached_call, track_llm_call
+from .prompt_builder import ClaudePromptBuilder, format_signature_info, get_prompt_builder
 
 logger = setup_logger(__name__)
 
 class ClaudeResponseProcessor:
     def __init__(self):
-        self.client = anthropic.Anthropic(api_key=config.CLAUDE_API_KEY)
-        self.async_client = anthropic.AsyncAnthropic(api_key=config.CLAUDE_API_KEY)
+        # プロセス共通のクライアントを使い、接続プールを全リクエスト・全処理クラスで共有する
+        self.async_client = get_anthropic_client()
         self.model = config.CLAUDE_MODEL  # .envファイルで設定されたモデル
-        self.schedule_analyzer = ScheduleAnalyzer()
+        self._schedule_analyzer = None  # カレンダー情報が必要になった時点で作成する
         self.output_saver = OutputSaver()  # LLM出力保存用
         self.settings = config.get_email_settings()
+        self.executor = get_executor()
+        self.response_cache = get_response_cache()
+        self.model_policy = get_model_policy()
+        self.prompt_builder = get_prompt_builder()
+        # Trueの場合はAPIエラー時に定型文を返さず例外を送出する（ProviderRouterでのフェイルオーバー用）
+        self.strict = False
     
-    async def analyze_email(self, prompt, email_id=None):
+    @property
+    def schedule_analyzer(self):
+        """スケジュール分析クラス（Google Calendar のクライアントを含むため初回アクセス時に作成）"""
+        if self._schedule_analyzer is None:
+            from ..calendar_module.schedule_analyzer import ScheduleAnalyzer
+            self._schedule_analyzer = ScheduleAnalyzer()
+        return self._schedule_analyzer
+    
+    async def warmup(self):
+        """APIへの接続を事前に確立（起動時にTLSハンドシェイクを済ませておく）"""
+        await get_pool("anthropic").warmup(lambda: self.async_client.models.list(limit=1))
+        logger.info("Claude APIへの接続を確立しました")
+    
+    async def close(self):
+        """接続プールを閉じる"""
+        await get_pool("anthropic").close()
+    
+    async def analyze_email(self, prompt, email_id=None, deadline=None, signals=None):
         """Claude APIを使用してメールを分析"""
         try:
             # メール分析用のシステムプロンプトを取得
             system_prompt = config.get_email_analyzer_prompt()
             
-            # 非同期クライアントを使用
-            response = await self.async_client.messages.create(
-                model=self.model,
-                max_tokens=1000,
-                temperature=0.7,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            # 分析テキストを取得（同一入力はキャッシュから返す）
+            analysis_text = await self._create_message(
+                "analysis", system_prompt, prompt, max_tokens=1000, deadline=deadline,
+                signals=signals or RoutingSignals.from_prompt(prompt)
             )
             
-            # レスポンスから分析テキストを抽出
-            analysis_text = response.content[0].text
-            
-            # 分析結果を抽出
-            analysis = self._extract_analysis(analysis_text)
-            
-            # 必要情報を抽出
-            required_info = self._extract_required_info(analysis_text)
+            # 分析結果と必要情報を抽出（出力全体を1回だけ走査）
+            output = TaggedOutput(analysis_text)
+            analysis = output.analysis
+            required_info = output.required_info()
             
             # 結果を構造化
             analysis_result = {
@@ -52,7 +75,8 @@ class ClaudeResponseProcessor:
             # 結果をファイルに保存（メールIDがある場合のみ）
             if email_id:
                 try:
-                    filepath = self.output_saver.save_analysis(
+                    filepath = await self.executor.run_disk(
+                        self.output_saver.save_analysis,
                         email_id=email_id,
                         analysis_text=analysis_text,
                         analysis_result=analysis_result,
@@ -67,13 +91,82 @@ class ClaudeResponseProcessor:
         
         except Exception as e:
             logger.error(f"メール分析API呼び出しエラー: {e}")
+            if self.strict:
+                raise
             return {
                 "analysis": "分析中にエラーが発生しました。",
                 "required_info": {"type": None}
             }
     
-    async def generate_responses(self, prompt, analysis_result=None, num_responses=1, email_id=None, additional_info=None):
-        """Claude APIを使用して返信を生成"""
+    async def analyze_and_respond(self, prompt, email_id=None, signature=None, deadline=None, on_partial=None, signals=None):
+        """1回のAPI呼び出しでメールの分析と返信の作成を行う
+
+        追加情報（カレンダー・承認・確認など）が必要と判断された場合は返信を作成しないため、
+        返信候補は None になる。その場合は従来どおり generate_responses を呼び出す。
+
+        Returns:
+            (分析結果, 返信候補のリストまたはNone)
+        """
+        try:
+            # 分析・返信用のシステムプロンプトを取得
+            system_prompt = config.get_email_combined_prompt()
+            
+            # 分析と返信のテキストを取得（同一入力はキャッシュから返す）
+            response_text = await self._create_message(
+                "combined", system_prompt, prompt, max_tokens=2000, deadline=deadline,
+                signals=signals or RoutingSignals.from_prompt(prompt),
+                signature_info=self._build_signature_info(signature), include_examples=True,
+                on_text=self._partial_responses_handler(on_partial) if on_partial else None
+            )
+            
+            analysis_result, responses = self.parse_combined_response(response_text)
+            
+            # 結果をファイルに保存（メールIDがある場合のみ）
+            if email_id:
+                try:
+                    filepath = await self.executor.run_disk(
+                        self.output_saver.save_analysis,
+                        email_id=email_id,
+                        analysis_text=response_text,
+                        analysis_result=analysis_result,
+                        provider="claude"
+                    )
+                    logger.info(f"メール分析結果を保存しました: {filepath}")
+                    if responses:
+                        filepath = await self.executor.run_disk(
+                            self.output_saver.save_responses,
+                            email_id=email_id,
+                            response_text=response_text,
+                            responses=responses,
+                            provider="claude",
+                            additional_info={}
+                        )
+                        logger.info(f"返信候補を保存しました: {filepath}")
+                except Exception as save_error:
+                    logger.error(f"分析・返信結果の保存に失敗しました: {save_error}")
+            
+            logger.info(
+                f"メール分析・返信完了: 必要情報タイプ={analysis_result['required_info'].get('type', 'なし')}, "
+                f"返信候補={len(responses) if responses else 0}件"
+            )
+            return analysis_result, responses
+        
+        except Exception as e:
+            logger.error(f"メール分析・返信API呼び出しエラー: {e}")
+            if self.strict:
+                raise
+            return {
+                "analysis": "分析中にエラーが発生しました。",
+                "required_info": {"type": None}
+            }, None
+    
+    async def generate_responses(self, prompt, analysis_result=None, num_responses=1, email_id=None, additional_info=None, signature=None, deadline=None, on_partial=None, signals=None):
+        """Claude APIを使用して返信を生成
+
+        num_responses が2以上の場合は、スタイルの異なるリクエストを並行して送り候補を1件ずつ生成する。
+        on_partial を指定した場合はストリーミングで生成し、生成途中の返信候補ごとに
+        on_partial(index, text) を呼び出す。
+        """
         try:
             # 追加情報の初期化
             if additional_info is None:
@@ -83,7 +176,7 @@ class ClaudeResponseProcessor:
             # カレンダー情報の処理
             if analysis_result and analysis_result.get("required_info", {}).get("type") == "カレンダー":
                 # カレンダー情報が必要な場合、利用可能なスロットを取得
-                available_slots = self.schedule_analyzer.get_available_slots()
+                available_slots = await self.executor.run_network(self.schedule_analyzer.get_available_slots)
                 
                 # メール分析結果から日程候補を抽出し、最適な日程を提案
                 analysis_text = analysis_result.get("analysis", "")
@@ -190,51 +283,37 @@ class ClaudeResponseProcessor:
             # 返信生成用のシステムプロンプトを取得
             system_prompt = config.get_email_responder_prompt()
             
-            # 署名情報を取得
-            signature_settings = self.settings.get("signature", {})
-            company_name = signature_settings.get("company_name")
-            name = signature_settings.get("name")
-            email = signature_settings.get("email")
-            url = signature_settings.get("url")
-            
-            # 署名情報をプロンプトに追加（フォーマット済み）
-            signature_info = f"""
-
-# 署名情報
-───────────────────
-{company_name}
-{name}
-Email：{email}
-URL: {url}
-───────────────────"""
-            
-            # 分析結果を含めたプロンプトを作成
+            # 分析結果を含めたプロンプトを作成（署名情報はキャッシュ対象のシステムブロックに入れる）
             full_prompt = prompt
+            signature_info = None
             if analysis_result:
                 analysis = analysis_result.get("analysis", "")
-                full_prompt = f"{prompt}\n\n# メール分析結果\n{analysis}{additional_info_text}{signature_info}"
+                full_prompt = f"{prompt}\n\n# メール分析結果\n{analysis}{additional_info_text}"
+                signature_info = self._build_signature_info(signature)
             
-            # 非同期クライアントを使用
-            response = await self.async_client.messages.create(
-                model=self.model,
-                max_tokens=2000,
-                temperature=0.7,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": full_prompt}
-                ]
-            )
-            
-            # レスポンスから返信テキストを抽出
-            response_text = response.content[0].text
-            
-            # 返信を抽出
-            responses = self._split_responses(response_text)
+            signals = signals.with_analysis(analysis_result) if signals else RoutingSignals.from_prompt(prompt, analysis_result)
+            if num_responses > 1:
+                # 複数の候補を並行して1件ずつ生成
+                responses, response_text = await self._generate_candidates(
+                    system_prompt, full_prompt, num_responses, deadline=deadline, signals=signals,
+                    on_partial=on_partial, signature_info=signature_info
+                )
+            else:
+                # 返信テキストを取得（同一入力はキャッシュから返す）
+                response_text = await self._create_message(
+                    "generation", system_prompt, full_prompt, max_tokens=2000, deadline=deadline,
+                    signals=signals, signature_info=signature_info, include_examples=True,
+                    on_text=self._partial_responses_handler(on_partial) if on_partial else None
+                )
+                
+                # 返信を抽出
+                responses = TaggedOutput(response_text).responses()
             
             # 結果をファイルに保存（メールIDがある場合のみ）
             if email_id:
                 try:
-                    filepath = self.output_saver.save_responses(
+                    filepath = await self.executor.run_disk(
+                        self.output_saver.save_responses,
                         email_id=email_id,
                         response_text=response_text,
                         responses=responses,
@@ -250,121 +329,213 @@ URL: {url}
         
         except Exception as e:
             logger.error(f"Claude API呼び出しエラー: {e}")
+            if self.strict:
+                raise
             # エラー時のフォールバック
             return [
                 "申し訳ありません。返信の生成中にエラーが発生しました。",
                 "しばらく経ってからもう一度お試しください。"
             ]
     
-    def _extract_analysis(self, text):
-        """分析結果を抽出"""
-        pattern = r'<分析>(.*?)</分析>'
-        match = re.search(pattern, text, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return text
+    async def _generate_candidates(self, system_prompt, full_prompt, num_responses, deadline=None, signals=None, on_partial=None, signature_info=None):
+        """
+        スタイルの異なる返信候補を並行して生成
+        
+        Returns:
+            (返信候補のリスト, 保存用の応答テキスト)
+        """
+        async def generate(index, style):
+            candidate_prompt = f"{full_prompt}\n\n# 返信スタイル\n{style['hint']}\n返信は1件だけ作成してください。"
+            text = await self._create_message(
+                "generation", system_prompt, candidate_prompt, max_tokens=2000, deadline=deadline,
+                signals=signals, temperature=style.get("temperature", 0.7),
+                signature_info=signature_info, include_examples=True, cache_variant=index,
+                on_text=self._partial_responses_handler(on_partial, index=index) if on_partial else None
+            )
+            candidate = TaggedOutput(text).responses()[0]
+            # 完成した候補から順に表示を確定させる
+            if on_partial:
+                try:
+                    await on_partial(index, candidate)
+                except Exception as e:
+                    logger.error(f"返信候補の通知エラー: {e}")
+            return text, candidate
+        
+        styles = get_candidate_styles(num_responses)
+        results = await asyncio.gather(
+            *[generate(index, style) for index, style in enumerate(styles)],
+            return_exceptions=True
+        )
+        succeeded = [result for result in results if not isinstance(result, BaseException)]
+        for error in (result for result in results if isinstance(result, BaseException)):
+            logger.error(f"返信候補の生成に失敗しました: {error}")
+        if not succeeded:
+            raise next(result for result in results if isinstance(result, BaseException))
+        
+        response_text = "\n\n".join(text for text, _ in succeeded)
+        return [candidate for _, candidate in succeeded], response_text
     
-    def _extract_required_info(self, text):
-        """必要情報を抽出"""
-        # タイプを抽出
-        type_pattern = r'<必要情報>.*?<タイプ>(.*?)</タイプ>.*?</必要情報>'
-        type_match = re.search(type_pattern, text, re.DOTALL)
+    async def _create_message(self, stage, system_prompt, user_prompt, max_tokens, deadline=None, on_text=None, signals=None, temperature=0.7, signature_info=None, include_examples=False, cache_variant=None):
+        """Claude APIを呼び出して応答テキストを返す（応答キャッシュを経由）
+
+        使用するモデルはステージとメールの特徴（signals）からモデル選択ポリシーで決める。
+        システムプロンプト・返信例・署名情報はプロンプトキャッシュの対象となる静的なプレフィックスとして送る。
+        on_text を指定した場合はストリーミングで受信し、受信済みのテキスト全体を渡して呼び出す。
+        cache_variant は同じプロンプトから別々の応答を得る場合（返信候補の番号など）にキャッシュキーを分けるために使う。
+        """
+        route, model = self.model_policy.select("claude", stage, self.model, signals)
+        request = self.prompt_builder.build_request(
+            model, max_tokens, temperature, system_prompt, user_prompt,
+            signature_info=signature_info, include_examples=include_examples
+        )
         
-        # 詳細情報を抽出（存在する場合）
-        details_pattern = r'<必要情報>.*?<詳細>(.*?)</詳細>.*?</必要情報>'
-        details_match = re.search(details_pattern, text, re.DOTALL)
+        cache_key = None
+        if self.response_cache:
+            cache_key = ResponseCache.make_key(
+                "claude", model, ClaudePromptBuilder.system_text(request["system"]), user_prompt,
+                temperature=temperature, max_tokens=max_tokens, variant=cache_variant
+            )
+            cached_text = await self.response_cache.get(cache_key)
+            if cached_text is not None:
+                logger.info(f"応答キャッシュを使用しました: stage={stage}, {self.response_cache.get_stats()}")
+                await record_cached_call("claude", stage, route, model)
+                return cached_text
         
-        # 本文を抽出
-        body_pattern = r'<本文>(.*?)</本文>'
-        body_match = re.search(body_pattern, text, re.DOTALL)
-        email_body = body_match.group(1).strip() if body_match else ""
+        # レート制限の枠を確保（入力の見積もりと最大出力トークン数の合計）
+        rate_limiter = get_rate_limiter("claude", model)
+        reservation = None
+        if rate_limiter:
+            estimated_tokens = estimate_tokens(ClaudePromptBuilder.system_text(request["system"])) + estimate_tokens(user_prompt) + max_tokens
+            reservation = await rate_limiter.acquire(estimated_tokens, timeout=deadline.remaining() if deadline else None)
         
-        # 日程候補を抽出（カレンダー情報の場合）
-        date_suggestions = []
-        date_pattern = r'<日程候補>(.*?)</日程候補>'
-        date_match = re.search(date_pattern, text, re.DOTALL)
-        if date_match:
-            date_content = date_match.group(1)
-            suggestion_pattern = r'<候補>(.*?)</候補>'
-            date_suggestions = re.findall(suggestion_pattern, date_content, re.DOTALL)
-            date_suggestions = [suggestion.strip() for suggestion in date_suggestions]
-            
-            # 時間範囲が含まれていない場合、メール本文から補完
-            if email_body and date_suggestions:
-                # 日付と時間範囲のパターン
-                date_time_range_patterns = [
-                    r'(\d{1,2}月\d{1,2}日).*?(\d{1,2}:\d{2})[-〜~](\d{1,2}:\d{2})',  # 4月10日21:00〜23:00
-                    r'(\d{1,2}/\d{1,2}).*?(\d{1,2}:\d{2})[-〜~](\d{1,2}:\d{2})',     # 4/10 21:00-23:00
-                ]
-                
-                # 各日程候補について時間範囲を確認
-                enhanced_suggestions = []
-                for suggestion in date_suggestions:
-                    # 既に時間範囲が含まれている場合はそのまま使用
-                    if re.search(r'\d{1,2}:\d{2}-\d{1,2}:\d{2}', suggestion):
-                        enhanced_suggestions.append(suggestion)
-                        continue
-                    
-                    # 日付部分を抽出
-                    date_part = re.search(r'(\d{1,2}月\d{1,2}日|\d{1,2}/\d{1,2})', suggestion)
-                    if not date_part:
-                        enhanced_suggestions.append(suggestion)
-                        continue
-                    
-                    date_str = date_part.group(1)
-                    time_range_found = False
-                    
-                    # メール本文から対応する時間範囲を検索
-                    for pattern in date_time_range_patterns:
-                        for match in re.finditer(pattern, email_body):
-                            if date_str in match.group(1) or match.group(1) in date_str:
-                                start_time = match.group(2)
-                                end_time = match.group(3)
-                                # 時間範囲を含む形式に変換
-                                enhanced_suggestion = suggestion.replace(date_str, f"{date_str} {start_time}-{end_time}")
-                                enhanced_suggestions.append(enhanced_suggestion)
-                                time_range_found = True
-                                break
-                        if time_range_found:
-                            break
-                    
-                    # 時間範囲が見つからなかった場合は元の候補を使用
-                    if not time_range_found:
-                        enhanced_suggestions.append(suggestion)
-                
-                # 拡張された日程候補で置き換え
-                if enhanced_suggestions:
-                    date_suggestions = enhanced_suggestions
-            
-            logger.info(f"抽出された日程候補: {date_suggestions}")
+        request.update(self._request_options(deadline))
         
-        if type_match:
-            info_type = type_match.group(1).strip()
-            details = details_match.group(1).strip() if details_match else ""
-            result = {
-                "type": info_type,
-                "details": details
-            }
-            
-            # カレンダー情報の場合は日程候補も追加
-            if info_type == "カレンダー" and date_suggestions:
-                result["date_suggestions"] = date_suggestions
+        started = time.monotonic()
+        # 確保した枠は実際の使用量で補正する（429・タイムアウトを含めて失敗した場合は使用量0として枠を戻す）
+        actual_tokens = 0
+        try:
+            # 呼び出しごとのレイテンシ・トークン数・リトライ回数・結果を台帳に記録
+            async with track_llm_call("claude", stage, route, model) as call:
+                try:
+                    if on_text:
+                        # ストリーミングで受信し、受信済みのテキスト全体を逐次通知
+                        text = ""
+                        async with self.async_client.messages.stream(**request) as stream:
+                            async for delta in stream.text_stream:
+                                text += delta
+                                await on_text(text)
+                            response = await stream.get_final_message()
+                    else:
+                        # 非同期クライアントを使用
+                        response = await self.async_client.messages.create(**request)
+                        
+                        # レスポンスからテキストを抽出
+                        text = response.content[0].text
+                except Exception as e:
+                    if rate_limiter and is_rate_limit_error(e):
+                        rate_limiter.backoff(retry_after_seconds(e))
+                    raise
                 
-            return result
-        return {"type": None, "details": ""}
+                # ルートごとのレイテンシ・トークン数・コストを記録
+                usage = getattr(response, "usage", None)
+                input_tokens = getattr(usage, "input_tokens", 0) or 0
+                output_tokens = getattr(usage, "output_tokens", 0) or 0
+                cache_read_tokens = getattr(usage, "cache_read_input_tokens", 0) or 0
+                cache_write_tokens = getattr(usage, "cache_creation_input_tokens", 0) or 0
+                cost = self.model_policy.record(
+                    route, model, time.monotonic() - started,
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens,
+                    cache_read_tokens=cache_read_tokens,
+                    cache_write_tokens=cache_write_tokens
+                )
+                call.set_usage(input_tokens, output_tokens, cache_read_tokens, cache_write_tokens, cost)
+            # キャッシュから読み込んだ入力トークンはレート制限の対象外
+            actual_tokens = input_tokens + cache_write_tokens + output_tokens
+        finally:
+            if reservation:
+                reservation.reconcile(actual_tokens)
+        
+        if cache_key:
+            await self.response_cache.set(cache_key, text)
+        return text
     
-    def _split_responses(self, response_text):
-        """Claudeの応答から返信を抽出"""
-        # XMLタグで囲まれた返信を抽出
-        pattern = r'<返信>(.*?)</返信>'
-        matches = re.findall(pattern, response_text, re.DOTALL)
+    async def summarize_thread(self, prompt, max_tokens=800, deadline=None):
+        """メールスレッドのこれまでの要約と新しいメッセージから、更新した要約を作成
+
+        Returns:
+            要約のテキスト（エラーの場合はNone）
+        """
+        try:
+            summary_text = await self._create_message(
+                "summary", config.get_thread_summary_prompt(), prompt, max_tokens=max_tokens,
+                deadline=deadline, temperature=0.3
+            )
+            return TaggedOutput(summary_text).summary
+        except Exception as e:
+            logger.error(f"スレッド要約API呼び出しエラー: {e}")
+            if self.strict:
+                raise
+            return None
+    
+    def parse_combined_response(self, response_text):
+        """
+        分析・返信一括プロンプトの応答を分析結果と返信候補に分ける
+        
+        Returns:
+            (分析結果, 返信候補のリスト。追加情報が必要な場合や返信タグがない場合はNone)
+        """
+        output = TaggedOutput(response_text)
+        analysis_result = {
+            "analysis": output.analysis,
+            "required_info": output.required_info()
+        }
         
-        if matches:
-            # 返信タグが見つかった場合
-            return [match.strip() for match in matches]
-        else:
-            # 返信タグが見つからない場合は、全体を1つの返信として扱う
-            return [response_text.strip()]
+        # 追加情報が不要で返信タグがある場合のみ返信候補として扱う
+        responses = None
+        if not analysis_result["required_info"].get("type") and output.has_responses:
+            responses = output.responses()
+        return analysis_result, responses
+    
+    def _build_signature_info(self, signature=None):
+        """署名情報をプロンプト用のテキストに変換（メールボックスごとの署名が指定されていればそちらを優先）"""
+        return format_signature_info(signature or self.settings.get("signature", {}))
+    
+    def _partial_responses_handler(self, on_partial, index=None):
+        """受信途中のテキストから返信ブロックを取り出し、変化した候補だけを通知する関数を作成
+
+        受信済みのテキストは増えた分だけをパーサーに渡し、閉じた返信ブロックと生成中の
+        返信ブロックを取り出す。index を指定した場合は1件の候補を生成するリクエストとみなし、
+        最初の返信ブロックをその番号の候補として通知する。
+        """
+        parser = IncrementalTagParser()
+        sent = {}
+        
+        async def handle(text):
+            parser.feed(text[len(parser.buffer):])
+            blocks = [element.text for element in parser.find("返信")]
+            open_text = parser.open_text("返信")
+            if open_text is not None:
+                blocks.append(open_text)
+            for block_index, block in enumerate(blocks):
+                if index is not None and block_index > 0:
+                    break
+                candidate_index = index if index is not None else block_index
+                partial = block.strip()
+                if partial and sent.get(candidate_index) != partial:
+                    sent[candidate_index] = partial
+                    try:
+                        await on_partial(candidate_index, partial)
+                    except Exception as e:
+                        logger.error(f"生成途中の返信候補の通知エラー: {e}")
+        
+        return handle
+    
+    def _request_options(self, deadline):
+        """処理期限の残り時間をAPIリクエストのタイムアウトとして渡す"""
+        if deadline is None:
+            return {}
+        return {"timeout": max(1.0, deadline.remaining())}
     
     def clean_response(self, response_text):
         """返信テキストをクリーンアップ"""
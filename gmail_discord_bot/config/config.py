@@ -22,10 +22,15 @@ CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 DEFAULT_AI_PROVIDER = os.getenv("DEFAULT_AI_PROVIDER", "chatgpt")  # デフォルトはChatGPT
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")  # デフォルトはGPT-4
 CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-3-sonnet-20240229")  # デフォルトはClaude 3 Sonnet
+# APIの接続先（ローカルのモックサーバーなどを使う場合のみ指定。未指定の場合は公式のエンドポイント）
+CLAUDE_BASE_URL = os.getenv("CLAUDE_BASE_URL") or None
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 
 # システムプロンプト設定
 EMAIL_ANALYZER_PROMPT_FILE = config_dir / "01_email_analyzer_prompt.txt"
 EMAIL_RESPONDER_PROMPT_FILE = config_dir / "02_email_responder_prompt.txt"
+EMAIL_COMBINED_PROMPT_FILE = config_dir / "03_email_combined_prompt.txt"
+THREAD_SUMMARY_PROMPT_FILE = config_dir / "04_thread_summary_prompt.txt"
 
 # Google Calendar API設定
 CALENDAR_CREDENTIALS_FILE = config_dir / os.getenv("CALENDAR_CREDENTIALS_FILE")
@@ -48,10 +53,10 @@ EMAIL_USER_MAPPING_FILE = config_dir / os.getenv("EMAIL_USER_MAPPING_FILE", "ema
 # メール設定ファイル
 EMAIL_SETTINGS_FILE = config_dir / "email_settings.json"
 
-def get_email_channel_mapping():
+def get_email_channel_mapping(mapping_file=None):
     """メールアドレスとDiscordチャンネルのマッピングを取得"""
     try:
-        with open(EMAIL_CHANNEL_MAPPING_FILE, 'r', encoding='utf-8') as f:
+        with open(mapping_file or EMAIL_CHANNEL_MAPPING_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
     except FileNotFoundError:
         # デフォルトの空のマッピングを返す
@@ -86,11 +91,32 @@ def save_email_user_mapping(mapping):
         print(f"ユーザーマッピング保存エラー: {e}")
         return False
 
+# プロンプトファイルのキャッシュ（ファイルパス -> (更新時刻, 内容)）
+_prompt_cache = {}
+
+def _read_prompt_file(prompt_file):
+    """プロンプトファイルを読み込む（更新時刻が変わらない限りキャッシュを返す）"""
+    mtime = os.path.getmtime(prompt_file)
+    cached = _prompt_cache.get(prompt_file)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(prompt_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    _prompt_cache[prompt_file] = (mtime, content)
+    return content
+
+def preload_prompts():
+    """システムプロンプトを事前に読み込んでキャッシュする"""
+    get_email_analyzer_prompt()
+    get_email_responder_prompt()
+    get_email_combined_prompt()
+    get_thread_summary_prompt()
+    return len(_prompt_cache)
+
 def get_email_analyzer_prompt():
     """メール分析用のシステムプロンプトを取得"""
     try:
-        with open(EMAIL_ANALYZER_PROMPT_FILE, 'r', encoding='utf-8') as f:
-            return f.read()
+        return _read_prompt_file(EMAIL_ANALYZER_PROMPT_FILE)
     except FileNotFoundError:
         # デフォルトのシステムプロンプトを返す
         return "あなたはメール分析アシスタント「メール分析くん」です。メールを分析し、必要な情報を特定してください。"
@@ -102,8 +128,7 @@ def get_email_analyzer_prompt():
 def get_email_responder_prompt():
     """メール返信用のシステムプロンプトを取得"""
     try:
-        with open(EMAIL_RESPONDER_PROMPT_FILE, 'r', encoding='utf-8') as f:
-            return f.read()
+        return _read_prompt_file(EMAIL_RESPONDER_PROMPT_FILE)
     except FileNotFoundError:
         # デフォルトのシステムプロンプトを返す
         return "あなたはメール返信アシスタント「メール返信くん」です。適切な返信を作成してください。"
@@ -112,6 +137,30 @@ def get_email_responder_prompt():
         # エラー時のフォールバック
         return "あなたはメール返信アシスタント「メール返信くん」です。適切な返信を作成してください。"
 
+def get_email_combined_prompt():
+    """メール分析と返信作成を1回で行うためのシステムプロンプトを取得"""
+    try:
+        return _read_prompt_file(EMAIL_COMBINED_PROMPT_FILE)
+    except FileNotFoundError:
+        # デフォルトのシステムプロンプトを返す
+        return "あなたはメール分析・返信アシスタントです。メールを分析して必要な情報を特定し、追加情報が不要な場合は適切な返信を作成してください。"
+    except Exception as e:
+        print(f"メール分析・返信プロンプト読み込みエラー: {e}")
+        # エラー時のフォールバック
+        return "あなたはメール分析・返信アシスタントです。メールを分析して必要な情報を特定し、追加情報が不要な場合は適切な返信を作成してください。"
+
+def get_thread_summary_prompt():
+    """メールスレッドの経緯を要約するためのシステムプロンプトを取得"""
+    try:
+        return _read_prompt_file(THREAD_SUMMARY_PROMPT_FILE)
+    except FileNotFoundError:
+        # デフォルトのシステムプロンプトを返す
+        return "あなたはメールスレッドの要約アシスタントです。これまでの要約と新しいメッセージから、返信の作成に必要な経緯を簡潔に要約してください。"
+    except Exception as e:
+        print(f"スレッド要約プロンプト読み込みエラー: {e}")
+        # エラー時のフォールバック
+        return "あなたはメールスレッドの要約アシスタントです。これまでの要約と新しいメッセージから、返信の作成に必要な経緯を簡潔に要約してください。"
+
 def get_email_settings():
     """メール設定を取得"""
     try:
@@ -157,6 +206,35 @@ def get_email_settings():
             }
         }
 
+def get_mailboxes():
+    """監視対象のメールボックス設定を取得
+
+    email_settings.json に "mailboxes" がない場合は、.env の設定から
+    単一のメールボックスを構成する。ファイルパスは config ディレクトリからの相対パス。
+    """
+    settings = get_email_settings()
+    mailboxes = []
+    for index, mailbox in enumerate(settings.get("mailboxes", [])):
+        mailboxes.append({
+            "name": mailbox.get("name", f"mailbox{index + 1}"),
+            "token_file": config_dir / mailbox["token_file"] if mailbox.get("token_file") else GMAIL_TOKEN_FILE,
+            "credentials_file": config_dir / mailbox["credentials_file"] if mailbox.get("credentials_file") else GMAIL_CREDENTIALS_FILE,
+            "channel_mapping_file": config_dir / mailbox["channel_mapping_file"] if mailbox.get("channel_mapping_file") else EMAIL_CHANNEL_MAPPING_FILE,
+            "signature": mailbox.get("signature") or settings.get("signature", {}),
+            "weight": mailbox.get("weight", 1)
+        })
+    
+    if not mailboxes:
+        mailboxes.append({
+            "name": "default",
+            "token_file": GMAIL_TOKEN_FILE,
+            "credentials_file": GMAIL_CREDENTIALS_FILE,
+            "channel_mapping_file": EMAIL_CHANNEL_MAPPING_FILE,
+            "signature": settings.get("signature", {}),
+            "weight": 1
+        })
+    return mailboxes
+
 def save_email_settings(settings):
     """メール設定を保存"""
     try:
@@ -0,0 +1,130 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from ..config import config
+from ..utils.logger import setup_logger
+from ..utils.executor import run_disk
+
+logger = setup_logger(__name__)
+
+class ApprovalRegistry:
+    """メールIDをキーに承認待ちリクエストを管理するレジストリ
+
+    承認イベントのハンドラは1つだけ登録し、このレジストリでメールIDから
+    承認待ちのコンテキストを引いて処理を振り分ける。内容はファイルに保存され、
+    再起動後も承認待ちの状態を復元できる。
+    """
+
+    def __init__(self, store_file=None, default_ttl=86400):
+        """
+        初期化
+
+        Args:
+            store_file: 承認待ち情報の保存先ファイル。指定しない場合はデータディレクトリを使用
+            default_ttl: 承認待ちの有効期限（秒）
+        """
+        self.store_file = Path(store_file) if store_file else config.DATA_DIR / "pending_approvals.json"
+        self.default_ttl = default_ttl
+        self._entries = {}
+        self._load()
+
+    def __contains__(self, email_id):
+        entry = self._entries.get(email_id)
+        return entry is not None and entry["expires_at"] > time.time()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def register(self, email_id, context, ttl=None):
+        """
+        承認待ちリクエストを登録
+
+        Args:
+            email_id: メールID
+            context: 承認後の処理に必要な情報（JSONに変換可能な辞書）
+            ttl: 有効期限（秒）。指定しない場合はデフォルト値を使用
+        """
+        self.purge_expired()
+        self._entries[email_id] = {
+            "context": context,
+            "registered_at": time.time(),
+            "expires_at": time.time() + (ttl or self.default_ttl),
+        }
+        logger.info(f"メール {email_id} を承認待ちとして登録しました（承認待ち: {len(self._entries)}件）")
+
+    def get(self, email_id):
+        """承認待ちのコンテキストを取得（存在しないか期限切れの場合はNone）"""
+        if email_id not in self:
+            return None
+        return self._entries[email_id]["context"]
+
+    def resolve(self, email_id, decision):
+        """
+        承認結果を反映し、承認待ちから取り除く
+
+        Args:
+            email_id: メールID
+            decision: 承認結果（"approve" または "reject"）
+
+        Returns:
+            登録時のコンテキスト。該当する承認待ちがない場合はNone
+        """
+        entry = self._entries.pop(email_id, None)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= time.time():
+            logger.warning(f"メール {email_id} の承認待ちは期限切れです")
+            return None
+        logger.info(f"メール {email_id} の承認待ちを解決しました: {decision}")
+        return entry["context"]
+
+    def purge_expired(self):
+        """期限切れの承認待ちを削除し、削除したメールIDのリストを返す"""
+        now = time.time()
+        expired = [email_id for email_id, entry in self._entries.items() if entry["expires_at"] <= now]
+        for email_id in expired:
+            del self._entries[email_id]
+        if expired:
+            logger.info(f"期限切れの承認待ちを削除しました: {expired}")
+        return expired
+
+    def pending(self):
+        """有効な承認待ちの (メールID, コンテキスト) のリストを返す"""
+        now = time.time()
+        return [(email_id, entry["context"]) for email_id, entry in self._entries.items() if entry["expires_at"] > now]
+
+    async def persist(self):
+        """承認待ちの内容をファイルに保存"""
+        # スナップショットはループ上で作成し、書き込みのみディスク用プールで行う
+        data = json.dumps(self._entries, ensure_ascii=False, indent=2, default=str)
+        try:
+            await run_disk(self._write, data)
+        except Exception as e:
+            logger.error(f"承認待ち情報の保存に失敗しました: {e}")
+
+    def _write(self, data):
+        """一時ファイル経由で保存（書き込み途中のファイルを残さない）"""
+        tmp_file = self.store_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_file, self.store_file)
+
+    def _load(self):
+        """保存された承認待ちを読み込む"""
+        try:
+            with open(self.store_file, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+            return
+        except Exception as e:
+            logger.error(f"承認待ち情報の読み込みに失敗しました: {e}")
+            self._entries = {}
+            return
+        expired = [email_id for email_id, entry in self._entries.items() if entry.get("expires_at", 0) <= time.time()]
+        for email_id in expired:
+            del self._entries[email_id]
+        if self._entries:
+            logger.info(f"{len(self._entries)}件の承認待ちを復元しました")
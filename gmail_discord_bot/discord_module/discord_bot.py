@@ -4,6 +4,9 @@ import asyncio
 from async_timeout import timeout as async_timeout
 from ..config import config
 from ..utils.logger import setup_logger
+from ..utils.executor import run_network
+from .approval_registry import ApprovalRegistry
+from .response_stream import ResponseStreamPublisher
 import json
 from pathlib import Path
 from discord import ui, ButtonStyle
@@ -258,7 +261,7 @@ class ResponseSelectView(ui.View):
             await interaction.response.send_message(f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 class DiscordBot:
-    def __init__(self):
+    def __init__(self, approval_store_file=None):
         self.token = config.DISCORD_BOT_TOKEN
         self.guild_id = config.DISCORD_GUILD_ID
         
@@ -269,10 +272,33 @@ class DiscordBot:
         self.setup_events()
         self.setup_commands()
         
+        # 返信送信に使うGmailクライアントの取得関数（メールボックスごとに切り替える）
+        self.gmail_client_resolver = None
+        # 送信処理中のタスク（シャットダウン時に完了を待つ）
+        self.pending_sends = set()
+        self.accepting_sends = True
+        
         # 応答選択のためのデータ保存
         self.response_options = {}
         # 承認リクエストのためのデータ保存
         self.approval_requests = {}
+        # 承認待ちの永続レジストリ（再起動後も承認を受け付ける）
+        self.approval_registry = ApprovalRegistry(store_file=approval_store_file)
+        self.restore_approval_views()
+    
+    def restore_approval_views(self):
+        """保存された承認待ちの承認ボタンを再登録"""
+        for email_id, context in self.approval_registry.pending():
+            self.restore_approval_view(email_id, context)
+    
+    def restore_approval_view(self, email_id, context):
+        """承認待ちの承認ボタンを再登録（押した後に処理が失敗した場合も、もう一度押せるようにする）"""
+        message_id = context.get('message_id')
+        if not message_id:
+            return
+        view = ApprovalView(email_id, self.bot, timeout=None)
+        self.bot.add_view(view, message_id=int(message_id))
+        logger.info(f"メール {email_id} の承認ボタンを復元しました")
     
     def setup_events(self):
         """イベントハンドラの設定"""
@@ -282,8 +308,7 @@ class DiscordBot:
             logger.info(f'Bot ID: {self.bot.user.id}')
             logger.info('------')
             
-        @self.bot.event
-        async def on_send_email(channel_id, option_number, reply_all=False):
+        async def send_email_event(channel_id, option_number, reply_all=False):
             """メール送信イベントを処理"""
             logger.info(f"メール送信イベント: チャンネルID {channel_id}, オプション {option_number}")
             
@@ -300,9 +325,12 @@ class DiscordBot:
             selected_text = response_data['options'][option_number - 1]
             
             try:
-                # Gmail APIクライアントを取得（クラス外でインポート）
-                from gmail_discord_bot.gmail_module.gmail_client import GmailClient
-                gmail_client = GmailClient()
+                # Gmail APIクライアントを取得（受信したメールボックスのクライアントを優先）
+                if self.gmail_client_resolver:
+                    gmail_client = self.gmail_client_resolver(email_data)
+                else:
+                    from gmail_discord_bot.gmail_module.gmail_client import GmailClient
+                    gmail_client = await run_network(GmailClient)
                 
                 # 送信先メールアドレスを取得
                 to_email = email_data['sender']
@@ -340,7 +368,8 @@ class DiscordBot:
                         logger.info(f"raw_messageからメッセージID {message_id} を取得しました")
                 
                 # メールを送信（元のメッセージを引用する）
-                result = gmail_client.send_email(
+                result = await run_network(
+                    gmail_client.send_email,
                     to=to_email,
                     subject=subject,
                     body=selected_text,
@@ -386,6 +415,21 @@ class DiscordBot:
                 import traceback
                 logger.error(f"詳細なエラー情報: {traceback.format_exc()}")
                 await self.send_message(channel_id, f"❌ エラーが発生しました: {str(e)}")
+        
+        @self.bot.event
+        async def on_send_email(channel_id, option_number, reply_all=False):
+            """メール送信イベントを受け付け、シャットダウン時に完了を待てるよう送信中として記録"""
+            if not self.accepting_sends:
+                logger.warning(f"シャットダウン中のためメール送信を受け付けません: チャンネルID {channel_id}")
+                await self.send_message(channel_id, "⚠ ボットを停止中のため、メールを送信できません。再起動後にもう一度お試しください。")
+                return
+            
+            task = asyncio.current_task()
+            self.pending_sends.add(task)
+            try:
+                await send_email_event(channel_id, option_number, reply_all)
+            finally:
+                self.pending_sends.discard(task)
     
     def setup_commands(self):
         """コマンドの設定"""
@@ -445,12 +489,13 @@ class DiscordBot:
         @self.bot.command(name='approve')
         async def approve_request(ctx, email_id: str):
             """承認リクエストを承認"""
-            if email_id not in self.approval_requests:
+            if email_id not in self.approval_requests and email_id not in self.approval_registry:
                 await ctx.send(f"メール {email_id} の承認リクエストが見つかりません。")
                 return
                 
             # 承認情報を保存
-            self.approval_requests[email_id]['result'] = "approve"
+            if email_id in self.approval_requests:
+                self.approval_requests[email_id]['result'] = "approve"
             await ctx.send(f"メール {email_id} を承認しました。返信を生成します...")
             
             # 承認イベントを発火（メインプログラムで処理）
@@ -459,12 +504,13 @@ class DiscordBot:
         @self.bot.command(name='reject')
         async def reject_request(ctx, email_id: str):
             """承認リクエストを拒否"""
-            if email_id not in self.approval_requests:
+            if email_id not in self.approval_requests and email_id not in self.approval_registry:
                 await ctx.send(f"メール {email_id} の承認リクエストが見つかりません。")
                 return
                 
             # 拒否情報を保存
-            self.approval_requests[email_id]['result'] = "reject"
+            if email_id in self.approval_requests:
+                self.approval_requests[email_id]['result'] = "reject"
             await ctx.send(f"メール {email_id} を拒否しました。")
             
             # 拒否イベントを発火（メインプログラムで処理）
@@ -641,49 +687,17 @@ class DiscordBot:
             logger.error(f"メール通知送信エラー: {e}")
             return False
     
-    async def send_response_options(self, channel_id, email_data, response_options):
-        """返信候補をDiscordチャンネルに送信"""
-        logger.info(f"send_response_options: チャンネルID {channel_id} へ返信候補を送信開始")
-        try:
-            channel = self.bot.get_channel(int(channel_id))
-            if not channel:
-                logger.error(f"チャンネルが見つかりません: {channel_id}")
-                return False
-            
-            logger.info(f"チャンネル {channel.name} が見つかりました")
-            
-            # タイムアウト処理を追加
-            async with async_timeout(30):  # 30秒のタイムアウト（複数のメッセージを送信するため長めに設定）
-                # 返信候補を保存
-                self.response_options[str(channel_id)] = {
-                    'email': email_data,
-                    'options': response_options,
-                    'selected': None
-                }
-                
-                # 各候補を表示（選択ボタン付き）
-                logger.info(f"{len(response_options)}個の返信候補を送信中...")
-                for i, option in enumerate(response_options, 1):
-                    # 選択ボタンを含むビューを作成
-                    select_view = ResponseSelectView(self, channel_id, i, option, timeout=86400)  # 24時間のタイムアウト
-                    
-                    # Embedを作成して返信候補を表示
-                    embed = discord.Embed(
-                        title=f"返信候補 {i}",
-                        description=f"```\n{option}\n```",
-                        color=discord.Color.blue()
-                    )
-                    
-                    await channel.send(embed=embed, view=select_view)
-            
-            logger.info(f"チャンネル {channel_id} への返信候補送信完了")
-            return True
-        except asyncio.TimeoutError:
-            logger.error(f"チャンネル {channel_id} への返信候補送信がタイムアウトしました")
-            return False
-        except Exception as e:
-            logger.error(f"返信候補送信エラー: {e}")
-            return False
+    def create_response_stream(self, channel_id, email_data):
+        """生成中の返信候補を逐次表示するパブリッシャーを作成"""
+        streaming = config.get_email_settings().get("streaming", {})
+        return ResponseStreamPublisher(
+            self,
+            channel_id,
+            email_data,
+            edit_interval=streaming.get("edit_interval_seconds", 1.0),
+            max_edits=streaming.get("max_edits_per_window", 5),
+            window_seconds=streaming.get("window_seconds", 5.0)
+        )
     
     def run(self):
         """ボットを実行"""
@@ -731,7 +745,8 @@ class DiscordBot:
             }
             
             # メッセージを送信
-            await channel.send(embed=embed, view=view)
+            message = await channel.send(embed=embed, view=view)
+            self.approval_requests[email_data['id']]['message_id'] = str(message.id)
             logger.info(f"チャンネル {channel_id} への承認リクエスト送信完了")
             return True
         except Exception as e:
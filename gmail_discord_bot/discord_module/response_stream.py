@@ -0,0 +1,213 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+
+import discord
+
+from ..utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Embedの説明文の上限（4096文字）からコードブロック記号の分を引いた長さ
+MAX_STREAM_TEXT = 4000
+
+# Discordのレート制限はチャンネル単位のため、同じチャンネルに表示するパブリッシャーで編集回数を共有する
+_channel_edit_times = defaultdict(deque)
+
+class ResponseStreamPublisher:
+    """生成中の返信候補をDiscordに逐次表示するクラス
+
+    update() で受け取った途中の返信候補ごとにEmbedを作成し、一定間隔でまとめて編集する。
+    Discordのレート制限（チャンネルあたり5秒間に5回程度）を超えないよう、
+    編集回数はチャンネルごとのスライディングウィンドウで制限する。生成完了後は finalize() で
+    確定した本文と選択ボタンに差し替える。
+    """
+
+    def __init__(self, discord_bot, channel_id, email_data, edit_interval=1.0, max_edits=5, window_seconds=5.0):
+        """
+        初期化
+
+        Args:
+            discord_bot: DiscordBotインスタンス
+            channel_id: 表示先のチャンネルID
+            email_data: メールデータ
+            edit_interval: 編集をまとめて反映する間隔（秒）
+            max_edits: window_seconds 内に許可するメッセージ作成・編集の回数
+            window_seconds: レート制限のウィンドウ（秒）
+        """
+        self.discord_bot = discord_bot
+        self.channel_id = channel_id
+        self.email_data = email_data
+        self.edit_interval = edit_interval
+        self.max_edits = max_edits
+        self.window_seconds = window_seconds
+        self.texts = {}
+        self.messages = {}
+        self.dirty = set()
+        # 過去の類似メールの返信案を仮に表示している候補の番号（新しい出力が届いたら外す）
+        self.placeholders = set()
+        self.closed = False
+        self._edit_times = _channel_edit_times[str(channel_id)]
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    def _get_channel(self):
+        return self.discord_bot.bot.get_channel(int(self.channel_id))
+
+    def _allow_edit(self):
+        """レート制限の範囲内であれば編集回数を記録してTrueを返す"""
+        now = time.monotonic()
+        while self._edit_times and now - self._edit_times[0] >= self.window_seconds:
+            self._edit_times.popleft()
+        if len(self._edit_times) >= self.max_edits:
+            return False
+        self._edit_times.append(now)
+        return True
+
+    def _build_embed(self, index, text, streaming, reused_from=None):
+        """返信候補のEmbedを作成"""
+        if streaming and len(text) > MAX_STREAM_TEXT:
+            text = "…" + text[-MAX_STREAM_TEXT:]
+        if streaming and index in self.placeholders:
+            title = f"返信候補 {index + 1}（過去の類似メールの返信案・再生成中…）"
+        elif streaming:
+            title = f"返信候補 {index + 1}（生成中…）"
+        else:
+            title = f"返信候補 {index + 1}"
+        embed = discord.Embed(
+            title=title,
+            description=f"```\n{text}\n```",
+            color=discord.Color.light_grey() if streaming else discord.Color.blue()
+        )
+        if reused_from:
+            embed.set_footer(text=f"過去の類似メール（{reused_from}）の返信案を再利用しています。日付・金額などが今回のメールと合っているか確認してください")
+        return embed
+
+    async def show_placeholders(self, drafts):
+        """
+        過去の類似メールの返信案を、新しい返信候補が届くまでの仮の表示として表示
+
+        Args:
+            drafts: 過去の返信案のリスト
+        """
+        for index, draft in enumerate(drafts):
+            await self.update(index, draft)
+            self.placeholders.add(index)
+
+    async def update(self, index, text):
+        """
+        生成途中の返信候補を更新（表示は次のフラッシュで反映）
+
+        Args:
+            index: 返信候補の番号（0始まり）
+            text: その時点までの返信テキスト
+        """
+        if self.closed or not text:
+            return
+        if index in self.placeholders:
+            # 新しい出力が届いたら仮の表示であることを示す見出しを外す
+            self.placeholders.discard(index)
+        elif self.texts.get(index) == text:
+            return
+        self.texts[index] = text
+        self.dirty.add(index)
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self):
+        """一定間隔で変更のあった返信候補を反映"""
+        try:
+            while not self.closed:
+                await self._flush()
+                await asyncio.sleep(self.edit_interval)
+        except asyncio.CancelledError:
+            pass
+
+    async def _flush(self):
+        """変更のあった返信候補のメッセージを作成・編集"""
+        async with self._lock:
+            channel = self._get_channel()
+            if not channel:
+                return
+            for index in sorted(self.dirty):
+                if self.closed or not self._allow_edit():
+                    break
+                self.dirty.discard(index)
+                embed = self._build_embed(index, self.texts[index], streaming=True)
+                try:
+                    if index in self.messages:
+                        await self.messages[index].edit(embed=embed)
+                    else:
+                        self.messages[index] = await channel.send(embed=embed)
+                except Exception as e:
+                    logger.error(f"生成中の返信候補の表示エラー: {e}")
+
+    async def close(self):
+        """逐次表示を停止
+
+        送信・編集の途中で更新タスクを止めると、Discord上にはメッセージがあるのに
+        self.messages に記録されないため、ロックを取って送信が終わるのを待ってから止める。
+        """
+        self.closed = True
+        if self._flush_task is not None:
+            async with self._lock:
+                self._flush_task.cancel()
+
+    async def finalize(self, responses, reused_from=None):
+        """
+        確定した返信候補を表示し、選択ボタンを付ける
+
+        Args:
+            responses: 確定した返信候補のリスト
+            reused_from: 過去の類似メールの返信案をそのまま使う場合はそのメールID（Embedに明記する）
+
+        Returns:
+            成功した場合はTrue
+        """
+        from .discord_bot import ResponseSelectView
+
+        await self.close()
+        try:
+            async with self._lock:
+                channel = self._get_channel()
+                if not channel:
+                    logger.error(f"チャンネルが見つかりません: {self.channel_id}")
+                    return False
+
+                self.discord_bot.response_options[str(self.channel_id)] = {
+                    'email': self.email_data,
+                    'options': responses,
+                    'selected': None
+                }
+
+                for index, option in enumerate(responses):
+                    select_view = ResponseSelectView(self.discord_bot, self.channel_id, index + 1, option, timeout=86400)
+                    embed = self._build_embed(index, option, streaming=False, reused_from=reused_from)
+                    if index in self.messages:
+                        await self.messages[index].edit(embed=embed, view=select_view)
+                    else:
+                        self.messages[index] = await channel.send(embed=embed, view=select_view)
+
+                # 途中で表示したが最終的に候補にならなかったメッセージは削除
+                for index in sorted(set(self.messages) - set(range(len(responses)))):
+                    await self.messages.pop(index).delete()
+
+            logger.info(f"チャンネル {self.channel_id} への返信候補送信完了（逐次表示）")
+            return True
+        except Exception as e:
+            logger.error(f"返信候補送信エラー: {e}")
+            return False
+
+    async def abort(self, reason="返信の生成が中断されました"):
+        """逐次表示を中断し、表示済みの候補に中断を示す"""
+        await self.close()
+        for index, message in self.messages.items():
+            try:
+                embed = discord.Embed(
+                    title=f"返信候補 {index + 1}（中断）",
+                    description=reason,
+                    color=discord.Color.red()
+                )
+                await message.edit(embed=embed)
+            except Exception as e:
+                logger.error(f"返信候補の中断表示エラー: {e}")
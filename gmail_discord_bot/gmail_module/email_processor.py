@@ -6,9 +6,9 @@ from .gmail_client import GmailClient
 logger = setup_logger(__name__)
 
 class EmailProcessor:
-    def __init__(self, gmail_client=None):
+    def __init__(self, gmail_client=None, channel_mapping=None):
         self.gmail_client = gmail_client or GmailClient()
-        self.email_channel_mapping = config.get_email_channel_mapping()
+        self.email_channel_mapping = channel_mapping if channel_mapping is not None else config.get_email_channel_mapping()
     
     @flow_step(FlowStep.RECEIVE_EMAIL)
     def process_new_emails(self, max_emails=10):
@@ -14,15 +14,17 @@ from ..utils.logger import setup_logger
 logger = setup_logger(__name__)
 
 class GmailClient:
-    def __init__(self):
+    def __init__(self, token_file=None, credentials_file=None):
+        self.token_file = token_file or config.GMAIL_TOKEN_FILE
+        self.credentials_file = credentials_file or config.GMAIL_CREDENTIALS_FILE
         self.creds = None
         self.service = None
         self.initialize_service()
     
     def initialize_service(self):
         """Gmail APIサービスの初期化"""
-        if os.path.exists(config.GMAIL_TOKEN_FILE):
-            with open(config.GMAIL_TOKEN_FILE, 'rb') as token:
+        if os.path.exists(self.token_file):
+            with open(self.token_file, 'rb') as token:
                 self.creds = pickle.load(token)
         
         # 認証情報がない、または期限切れの場合
@@ -31,11 +33,11 @@ class GmailClient:
                 self.creds.refresh(Request())
             else:
                 flow = InstalledAppFlow.from_client_secrets_file(
-                    config.GMAIL_CREDENTIALS_FILE, config.GMAIL_SCOPES)
+                    self.credentials_file, config.GMAIL_SCOPES)
                 self.creds = flow.run_local_server(port=0)
             
             # トークンを保存
-            with open(config.GMAIL_TOKEN_FILE, 'wb') as token:
+            with open(self.token_file, 'wb') as token:
                 pickle.dump(self.creds, token)
         
         self.service = build('gmail', 'v1', credentials=self.creds)
@@ -78,6 +80,7 @@ class GmailClient:
         message_id = ""
         references = ""
         in_reply_to = ""
+        list_unsubscribe = ""
         
         for header in headers:
             name = header.get('name', '').lower()
@@ -96,6 +99,8 @@ class GmailClient:
                 references = header.get('value', '')
             elif name == 'in-reply-to':
                 in_reply_to = header.get('value', '')
+            elif name == 'list-unsubscribe':
+                list_unsubscribe = header.get('value', '')
         
         # 本文を取得
         body = ""
@@ -120,9 +125,23 @@ class GmailClient:
             'message_id': message_id,
             'references': references,
             'in_reply_to': in_reply_to,
+            'internal_date': int(message.get('internalDate', 0) or 0),
+            'labels': message.get('labelIds', []),
+            'list_unsubscribe': list_unsubscribe,
             'raw_message': message
         }
     
+    def get_email(self, msg_id):
+        """IDを指定してメールを取得"""
+        try:
+            msg = self.service.users().messages().get(
+                userId='me', id=msg_id, format='full'
+            ).execute()
+            return self._parse_message(msg)
+        except Exception as e:
+            logger.error(f"メール取得エラー: {e}")
+            return None
+    
     def mark_as_read(self, msg_id):
         """メールを既読にする"""
         try:
@@ -216,6 +235,27 @@ class GmailClient:
             logger.error(f"スレッド詳細取得エラー: {e}")
             return None
     
+    def get_thread_messages(self, thread_id, user_id='me'):
+        """スレッド内のメッセージをパースして古い順に取得する
+        
+        Args:
+            thread_id: スレッドID
+            user_id: ユーザーID（通常は'me'）
+            
+        Returns:
+            パースしたメッセージのリスト（取得できない場合は空のリスト）
+        """
+        thread = self.get_thread(thread_id, user_id)
+        if not thread:
+            return []
+        messages = []
+        for message in thread.get('messages', []):
+            try:
+                messages.append(self._parse_message(message))
+            except Exception as e:
+                logger.error(f"スレッド内のメッセージのパースエラー: {e}")
+        return sorted(messages, key=lambda message: message['internal_date'])
+    
     def send_email(self, to, subject, body, thread_id=None, message_id=None, references=None, quote_original=False, reply_all=False, cc=None):
         """メールを送信する
         
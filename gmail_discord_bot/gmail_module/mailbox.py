@@ -0,0 +1,79 @@
+from ..config import config
+from ..utils.logger import setup_logger
+from ..name_module.name_manager import NameManager
+from .gmail_client import GmailClient
+from .email_processor import EmailProcessor
+
+logger = setup_logger(__name__)
+
+class Mailbox:
+    """1つのGmailアカウントに対応するクライアント・ルーティング・署名のまとまり"""
+
+    def __init__(self, name, token_file=None, credentials_file=None, channel_mapping_file=None, signature=None, weight=1):
+        self.name = name
+        self.signature = signature or {}
+        self.weight = max(1, int(weight))
+
+        # メールボックスごとのルーティングマップ
+        channel_mapping = config.get_email_channel_mapping(channel_mapping_file)
+
+        self.gmail_client = GmailClient(token_file=token_file, credentials_file=credentials_file)
+        self.email_processor = EmailProcessor(self.gmail_client, channel_mapping=channel_mapping)
+        self.name_manager = NameManager(email_mapping=channel_mapping)
+        logger.info(f"メールボックス '{name}' を初期化しました（ルーティング {len(channel_mapping)}件）")
+
+    def fetch_new_emails(self, max_emails):
+        """新しいメールを取得し、メールボックス名を付与して返す"""
+        emails = self.email_processor.process_new_emails(max_emails)
+        for email_data in emails:
+            email_data['mailbox'] = self.name
+        return emails
+
+class MailboxScheduler:
+    """複数のメールボックス間でメール取得の割り当てを公平に配分するスケジューラ
+
+    1回のチェックで取得するメール数の上限を各メールボックスの重みに応じて配分し、
+    取得順をチェックごとにローテーションする。取得したメールはメールボックス間で
+    交互に並べ替え、特定のメールボックスの大量受信が他を待たせないようにする。
+    """
+
+    def __init__(self, mailboxes, emails_per_check=10):
+        self.mailboxes = list(mailboxes)
+        self.emails_per_check = emails_per_check
+        self._offset = 0
+
+    def allocate(self):
+        """今回のチェックで各メールボックスから取得する件数を (Mailbox, 件数) のリストで返す"""
+        count = len(self.mailboxes)
+        if count == 0:
+            return []
+
+        # 開始位置をローテーション
+        ordered = self.mailboxes[self._offset:] + self.mailboxes[:self._offset]
+        self._offset = (self._offset + 1) % count
+
+        total_weight = sum(mailbox.weight for mailbox in ordered)
+        allocations = []
+        remaining = self.emails_per_check
+        for mailbox in ordered:
+            share = max(1, self.emails_per_check * mailbox.weight // total_weight)
+            share = min(share, remaining) if remaining > 0 else 1
+            remaining -= share
+            allocations.append((mailbox, share))
+        return allocations
+
+    @staticmethod
+    def interleave(email_lists):
+        """メールボックスごとのメールリストを交互に並べ替える"""
+        interleaved = []
+        index = 0
+        while any(index < len(emails) for emails in email_lists):
+            for emails in email_lists:
+                if index < len(emails):
+                    interleaved.append(emails[index])
+            index += 1
+        return interleaved
+
+def build_mailboxes():
+    """設定からメールボックスのリストを構築"""
+    return [Mailbox(**mailbox_config) for mailbox_config in config.get_mailboxes()]
@@ -13,20 +13,33 @@
 # limitations under the License.
 
 import asyncio
+import signal
 import time
 import threading
 from pathlib import Path
+from collections import deque
 import logging
-from async_timeout import timeout as async_timeout
 
-from gmail_discord_bot.gmail_module.gmail_client import GmailClient
-from gmail_discord_bot.gmail_module.email_processor import EmailProcessor
+from gmail_discord_bot.gmail_module.mailbox import MailboxScheduler, build_mailboxes
 from gmail_discord_bot.discord_module.discord_bot import DiscordBot
 from gmail_discord_bot.discord_module.message_formatter import MessageFormatter
-from gmail_discord_bot.name_module.name_manager import NameManager
 from gmail_discord_bot.ai_module.ai_factory import AIFactory
+from gmail_discord_bot.ai_module.model_routing import RoutingSignals, get_model_policy
+from gmail_discord_bot.ai_module.batch import create_batch_coordinator
+from gmail_discord_bot.ai_module.http_pool import get_pool_stats
+from gmail_discord_bot.ai_module.rate_limiter import get_rate_limit_stats
 from gmail_discord_bot.calendar_module.schedule_analyzer import ScheduleAnalyzer
 from gmail_discord_bot.utils.logger import setup_logger, flow_step, FlowStep
+from gmail_discord_bot.utils.executor import get_executor, LoopLagMonitor
+from gmail_discord_bot.utils.lease_store import create_lease_store
+from gmail_discord_bot.utils.deadline import Deadline, get_deadline_stats
+from gmail_discord_bot.utils.checkpoint import JobCheckpoint
+from gmail_discord_bot.utils.readiness import ReadinessState
+from gmail_discord_bot.utils.response_cache import get_response_cache
+from gmail_discord_bot.utils.text_compactor import create_text_compactor
+from gmail_discord_bot.utils.llm_ledger import set_call_context
+from gmail_discord_bot.utils.near_duplicate import create_near_duplicate_index
+from gmail_discord_bot.utils.thread_context import create_thread_context_builder
 from gmail_discord_bot.config import config
 
 logger = setup_logger(__name__)
@@ -37,20 +50,91 @@ class EmailBot:
         self.ai_provider = ai_provider or config.DEFAULT_AI_PROVIDER
         logger.log_flow(FlowStep.RECEIVE_EMAIL, f"AIプロバイダー '{self.ai_provider}' を使用します")
         
+        # メールボックスの初期化（1つのDiscord接続で複数のメールボックスを扱う）
+        self.mailboxes = build_mailboxes()
+        self.mailboxes_by_name = {mailbox.name: mailbox for mailbox in self.mailboxes}
+        self.mailbox_scheduler = MailboxScheduler(self.mailboxes)
+        logger.info(f"{len(self.mailboxes)}件のメールボックスを監視します: {list(self.mailboxes_by_name)}")
+        
+        # 既定のメールボックス（単一メールボックス時の互換用）
+        self.gmail_client = self.mailboxes[0].gmail_client
+        self.email_processor = self.mailboxes[0].email_processor
+        self.name_manager = self.mailboxes[0].name_manager
+        
+        # 複数ワーカー間でメールの処理権を管理するリースストア（シャーディング有効時のみ）
+        self.lease_store = create_lease_store()
+        self._last_lease_purge = None
+        
         # 各モジュールの初期化
-        self.gmail_client = GmailClient()
-        self.email_processor = EmailProcessor(self.gmail_client)
-        self.discord_bot = DiscordBot()
+        # （シャーディング時は承認待ちをワーカーごとのファイルに保存する）
+        self.discord_bot = DiscordBot(
+            approval_store_file=self.lease_store.worker_file("pending_approvals.json") if self.lease_store else None
+        )
+        self.discord_bot.gmail_client_resolver = self._get_gmail_client_for_email
         self.message_formatter = MessageFormatter()
-        self.name_manager = NameManager()
         self.response_processor = AIFactory.create_response_processor(self.ai_provider)
         self.schedule_analyzer = ScheduleAnalyzer()
         
+        # ブロッキング処理用のスレッドプールとイベントループ監視
+        self.executor = get_executor()
+        performance_settings = config.get_email_settings().get("performance", {})
+        self.loop_lag_monitor = LoopLagMonitor(
+            threshold_ms=performance_settings.get("loop_lag_threshold_ms", 100)
+        )
+        
         # 処理中のメールIDを追跡
         self.processing_emails = set()
         
+        # 承認待ちのレジストリと承認イベントのハンドラ（ハンドラは1つだけ登録する）
+        self.approval_registry = self.discord_bot.approval_registry
+        self.discord_bot.bot.add_listener(self._on_approval_decision, 'on_approval_decision')
+        
         # 定期チェックの設定
         self.check_interval = 60  # 60秒ごとにメールをチェック
+        
+        # シャットダウン制御（処理待ち・処理中のジョブを追跡し、停止時に完了を待つ）
+        self.queued_emails = deque()
+        self.in_flight_jobs = {}
+        # （シャーディング時は未完了ジョブをワーカーごとのファイルに保存し、他のワーカーの分を読み込まない）
+        self.checkpoint = JobCheckpoint(
+            self.lease_store.worker_file("unfinished_jobs.json") if self.lease_store else None
+        )
+        self.drain_timeout = config.get_email_settings().get("shutdown", {}).get("drain_timeout_seconds", 60)
+        self.shutting_down = False
+        self._stop_event = None
+        self._background_tasks = []
+        
+        # 生成する返信候補の数（2以上の場合は候補ごとに並行してリクエストする）
+        self.num_responses = config.get_email_settings().get("candidates", {}).get("num_responses", 1)
+        
+        # プロンプトに入れる前のメール本文の圧縮
+        self.text_compactor = create_text_compactor()
+        
+        # スレッドの経緯をプロンプトに入れるための要約（要約に対応していないプロバイダーでは無効）
+        self.thread_context = (
+            create_thread_context_builder() if hasattr(self.response_processor, 'summarize_thread') else None
+        )
+        
+        # ほぼ同じ内容の過去のメールの分析結果と返信案を再利用する索引
+        self.near_duplicates = create_near_duplicate_index()
+        # 再利用する返信案を先に表示したうえで、返信を新たに作成するか
+        self.regenerate_duplicates = config.get_email_settings().get("near_duplicates", {}).get("regenerate", True)
+        
+        # 分析と返信作成を1回のAPI呼び出しで行うか（対応していないプロバイダーでは無効）
+        self.combined_mode = (
+            config.get_email_settings().get("combined_mode", {}).get("enabled", False)
+            and hasattr(self.response_processor, 'analyze_and_respond')
+        )
+        
+        # 急ぎでないメール（プロモーション・メールマガジンなど）をまとめて処理するバッチモード
+        # （シャーディング時は処理待ち・送信済みバッチをワーカーごとのファイルに保存する）
+        self.batch_coordinator = create_batch_coordinator(
+            state_file=self.lease_store.worker_file("batch_jobs.json") if self.lease_store else None
+        )
+        
+        # 起動時の準備状態（Discordの接続は必須、その他の事前準備は任意）
+        self.readiness = None
+        self.ready_timeout = config.get_email_settings().get("startup", {}).get("ready_timeout_seconds", 60)
     
     @flow_step(FlowStep.RECEIVE_EMAIL)
     async def process_email_for_discord(self, email_data):
@@ -61,35 +145,45 @@ class EmailBot:
                 logger.info(f"メール {email_data['id']} は既に処理中です")
                 return
             
+            # 他のワーカーが処理中・処理済みのメールはスキップ
+            if self.lease_store:
+                claimed = await self._claim_lease(email_data)
+                if claimed is None:
+                    # 既読にしたメールを取りこぼさないよう、リースを確認できなかった場合は処理待ちに戻す
+                    logger.warning(f"メール {email_data['id']} のリースを確認できなかったため、処理待ちに戻します")
+                    self.queued_emails.append(email_data)
+                    return
+                if not claimed:
+                    logger.info(f"メール {email_data['id']} は他のワーカーが処理しています")
+                    return
+            
             logger.info(f"メール {email_data['id']} の処理を開始します")
             self.processing_emails.add(email_data['id'])
+            # このメールの処理中のLLM呼び出しを台帳にメールID・送信者付きで記録する
+            set_call_context(email_data['id'], email_data.get('sender'))
+            
+            # メール1件分の処理期限（各ステージは残り時間をタイムアウトとして使う）
+            deadline = Deadline.for_email(email_data['id'])
+            cancelled = False
+            response_stream = None
             
             # 元のメール内容を保存
             try:
                 output_saver = self.response_processor.output_saver
-                filepath = output_saver.save_email_content(email_data['id'], email_data)
+                filepath = await self.executor.run_disk(output_saver.save_email_content, email_data['id'], email_data)
                 logger.info(f"元のメール内容を保存しました: {filepath}")
             except Exception as save_error:
                 logger.error(f"元のメール内容の保存に失敗しました: {save_error}")
             
             try:
+                # 受信したメールボックスを取得
+                mailbox = self._get_mailbox(email_data)
+                
                 # 送信元アドレスの確認
                 logger.log_flow(FlowStep.CHECK_SENDER, f"メール {email_data['id']} の送信元を確認")
                 
-                # 送信者情報を処理
-                logger.log_flow(FlowStep.EXTRACT_ADDRESS, "送信者情報から宛名を抽出")
-                sender_info = self.name_manager.process_email(email_data)
-                sender_email = sender_info['email']
-                logger.info(f"送信者メールアドレス: {sender_email}")
-                
-                # 宛名を生成
-                address = self.name_manager.format_address(sender_email)
-                logger.info(f"生成された宛名: {address}")
-                
-                # 送信者情報をemail_dataに追加
-                email_data['sender_name'] = sender_info.get('name', '')
-                email_data['sender_company'] = sender_info.get('company', '')
-                logger.info(f"送信者名: {email_data['sender_name']}, 会社名: {email_data['sender_company']}")
+                # 送信者情報を処理して宛名を生成
+                address = self._prepare_sender(email_data, mailbox)
                 
                 # Discordチャンネルにメール通知を送信
                 logger.log_flow(FlowStep.TRANSFER_TO_DISCORD, "Discordチャンネルへメールを転送")
@@ -98,38 +192,72 @@ class EmailBot:
                 
                 # タイムアウト処理を追加
                 try:
-                    async with async_timeout(15):  # 15秒のタイムアウト
-                        success = await self.discord_bot.send_email_notification(channel_id, email_data)
-                        if not success:
-                            logger.error(f"メール通知の送信に失敗しました: チャンネルID {channel_id}")
-                            return
+                    if email_data.get('notified'):
+                        # 前回の起動で通知済みのメールは再通知しない
+                        logger.info(f"メール {email_data['id']} は通知済みのため、通知をスキップします")
+                    else:
+                        async with deadline.stage("notify"):
+                            success = await self.discord_bot.send_email_notification(channel_id, email_data)
+                            if not success:
+                                logger.error(f"メール通知の送信に失敗しました: チャンネルID {channel_id}")
+                                return
+                        email_data['notified'] = True
+                        # 引き継いだワーカーが通知を重複して送らないよう、リースにも記録する
+                        if self.lease_store:
+                            await self._update_lease(email_data, notified=True)
                 except asyncio.TimeoutError:
                     logger.error(f"メール通知の送信がタイムアウトしました: チャンネルID {channel_id}")
                     return
                 
-                # 基本プロンプトを生成
+                # 基本プロンプトを生成（返信の場合はスレッドの経緯の要約を含める）
                 logger.log_flow(FlowStep.GENERATE_PROMPT, "メール分析用プロンプトを生成")
+                thread_summary = await self._build_thread_context(email_data, mailbox, deadline)
+                prompt, signals = self._build_prompt(email_data, address, thread_summary)
                 
-                # メール情報を含むプロンプトを生成
-                prompt = f"""
-# 元のメール情報
-件名: {email_data['subject']}
-送信者: {email_data['sender']}
-本文:
-{email_data['body']}
-
-# 宛名情報
-宛名: {address}
-"""
+                # 生成中の返信候補を逐次表示するパブリッシャー（最初のトークンが届いた時点で表示を開始）
+                response_stream = self.discord_bot.create_response_stream(channel_id, email_data)
                 
-                # ステップ1: メール分析
-                logger.log_flow(FlowStep.ANALYZE_EMAIL, "AIでメールを分析")
-                try:
-                    async with async_timeout(30):  # 30秒のタイムアウト
-                        analysis_result = await self.response_processor.analyze_email(prompt, email_id=email_data['id'])
-                except asyncio.TimeoutError:
-                    logger.error("メール分析がタイムアウトしました")
-                    return
+                # 同じルートの直近のメールとほぼ同じ内容なら、そのときの分析結果と返信案を使う
+                duplicate_route = self._duplicate_route(email_data, mailbox)
+                duplicate = None
+                if self.near_duplicates:
+                    duplicate = await self.near_duplicates.find(duplicate_route, email_data['body'])
+                
+                # ステップ1: メール分析（一括モードでは追加情報が不要な場合の返信も同時に作成）
+                combined_responses = None
+                if duplicate and not self.regenerate_duplicates:
+                    logger.info(
+                        f"メール {email_data['id']} は過去のメール {duplicate.email_id} とほぼ同じ内容のため、"
+                        f"分析結果と返信案を再利用します（距離 {duplicate.distance}）"
+                    )
+                    analysis_result = duplicate.analysis_result
+                    combined_responses = duplicate.responses_for(address)
+                else:
+                    if duplicate:
+                        # 過去の返信案を仮に表示し、新しい返信の生成に合わせて置き換える
+                        logger.info(f"メール {email_data['id']} に過去のメール {duplicate.email_id} の返信案を先に表示します")
+                        await response_stream.show_placeholders(duplicate.responses_for(address))
+                    
+                    logger.log_flow(FlowStep.ANALYZE_EMAIL, "AIでメールを分析")
+                    try:
+                        async with deadline.stage("analysis"):
+                            if self.combined_mode:
+                                analysis_result, combined_responses = await self.response_processor.analyze_and_respond(
+                                    prompt,
+                                    email_id=email_data['id'],
+                                    signature=mailbox.signature,
+                                    deadline=deadline,
+                                    on_partial=response_stream.update,
+                                    signals=signals
+                                )
+                            else:
+                                analysis_result = await self.response_processor.analyze_email(
+                                    prompt, email_id=email_data['id'], deadline=deadline, signals=signals
+                                )
+                    except asyncio.TimeoutError:
+                        logger.error("メール分析がタイムアウトしました")
+                        await response_stream.abort()
+                        return
                 
                 # 必要情報の確認
                 required_info_type = analysis_result.get("required_info", {}).get("type")
@@ -145,14 +273,20 @@ class EmailBot:
                     # ステップ2: 返信生成
                     logger.log_flow(FlowStep.GENERATE_RESPONSE, "AIで返信を生成")
                     try:
-                        async with async_timeout(60):  # 60秒のタイムアウト（AI生成は時間がかかる可能性がある）
+                        async with deadline.stage("generation"):
                             responses = await self.response_processor.generate_responses(
                                 prompt,
                                 analysis_result,
-                                email_id=email_data['id']
+                                email_id=email_data['id'],
+                                signature=mailbox.signature,
+                                num_responses=self.num_responses,
+                                deadline=deadline,
+                                on_partial=response_stream.update,
+                                signals=signals
                             )
                     except asyncio.TimeoutError:
                         logger.error("AI応答生成がタイムアウトしました")
+                        await response_stream.abort()
                         return
                 
                 elif required_info_type == "承認":
@@ -163,14 +297,17 @@ class EmailBot:
                     approval_message = f"**承認リクエスト**\n\nこのメールには承認が必要です。\n\n{required_info_details}\n\n以下のボタンで承認または拒否してください。"
                     
                     try:
-                        async with async_timeout(15):
+                        async with deadline.stage("approval_request"):
                             await self.discord_bot.send_approval_request(channel_id, email_data, approval_message)
                             
-                            # 承認イベントハンドラを設定
-                            self._setup_approval_handler(email_data, analysis_result, prompt, channel_id)
+                            # 承認待ちとしてレジストリに登録
+                            await self._register_approval(email_data, analysis_result, prompt, channel_id)
                     except asyncio.TimeoutError:
                         logger.error("承認リクエストの送信がタイムアウトしました")
                     
+                    # 仮に表示した過去の返信案や生成途中の返信は使わない
+                    await response_stream.abort("追加情報が必要なため、この返信候補は使用しません")
+                    
                     # 承認待ちの状態なので、ここで処理を終了
                     logger.info(f"メール {email_data['id']} は承認待ちです")
                     return
@@ -180,20 +317,25 @@ class EmailBot:
                     logger.log_flow(FlowStep.REQUEST_CONFIRMATION, "添付データの確認を求める")
                     
                     # メール内のURLやデータを抽出
-                    attachments = self.gmail_client.get_attachments(email_data['id'])
+                    try:
+                        async with deadline.stage("attachments_fetch"):
+                            attachments = await self.executor.run_network(mailbox.gmail_client.get_attachments, email_data['id'])
+                    except asyncio.TimeoutError:
+                        logger.error("添付ファイルの取得がタイムアウトしました")
+                        attachments = []
                     urls = self._extract_urls_from_email(email_data['body'])
                     
                     if attachments or urls:
                         # 添付ファイルやURLがある場合、Discordに送信
                         try:
-                            async with async_timeout(30):
+                            async with deadline.stage("attachments_send"):
                                 await self.discord_bot.send_attachments_and_urls(channel_id, email_data, attachments, urls)
                         except asyncio.TimeoutError:
                             logger.error("添付ファイル/URL送信がタイムアウトしました")
                     else:
                         # 添付ファイルやURLがない場合、エラーメッセージを送信
                         try:
-                            async with async_timeout(15):
+                            async with deadline.stage("message"):
                                 await self.discord_bot.send_message(
                                     channel_id,
                                     "**確認が必要なデータが見つかりません**\n\nメールに添付ファイルやURLが含まれていないようです。メールを直接確認してください。"
@@ -211,15 +353,21 @@ class EmailBot:
                     # 返信を生成
                     logger.log_flow(FlowStep.GENERATE_RESPONSE, "AIで返信を生成")
                     try:
-                        async with async_timeout(60):  # 60秒のタイムアウト（AI生成は時間がかかる可能性がある）
+                        async with deadline.stage("generation"):
                             responses = await self.response_processor.generate_responses(
                                 prompt,
                                 analysis_result,
                                 email_id=email_data['id'],
-                                additional_info=additional_info
+                                additional_info=additional_info,
+                                signature=mailbox.signature,
+                                num_responses=self.num_responses,
+                                deadline=deadline,
+                                on_partial=response_stream.update,
+                                signals=signals
                             )
                     except asyncio.TimeoutError:
                         logger.error("AI応答生成がタイムアウトしました")
+                        await response_stream.abort()
                         return
                 
                 elif required_info_type == "その他":
@@ -238,34 +386,51 @@ class EmailBot:
                     other_info_message = f"**追加情報が必要です**\n\n{required_info_details}\n\n**対処法の提案:**\n{suggestions_text}\n\n対処法を選択するには `!handle {email_data['id']} [番号または独自の対処法]` を入力してください。"
                     
                     try:
-                        async with async_timeout(15):
+                        async with deadline.stage("other_info_request"):
                             await self.discord_bot.send_other_info_request(channel_id, email_data, other_info_message)
                     except asyncio.TimeoutError:
                         logger.error("その他情報リクエストの送信がタイムアウトしました")
                     
+                    # 仮に表示した過去の返信案や生成途中の返信は使わない
+                    await response_stream.abort("追加情報が必要なため、この返信候補は使用しません")
+                    
                     # 情報待ちの状態なので、ここで処理を終了
                     logger.info(f"メール {email_data['id']} はその他情報待ちです")
                     return
                 
+                elif combined_responses:
+                    # 一括モードで分析と同時に作成した返信をそのまま使う
+                    logger.info(f"分析と同時に作成された返信候補を使用します: {len(combined_responses)}件")
+                    responses = combined_responses
+                
                 else:
                     # 必要情報がない場合は通常の返信生成
                     logger.log_flow(FlowStep.GENERATE_RESPONSE, "AIで返信を生成")
                     try:
-                        async with async_timeout(60):  # 60秒のタイムアウト（AI生成は時間がかかる可能性がある）
+                        async with deadline.stage("generation"):
                             responses = await self.response_processor.generate_responses(
                                 prompt,
                                 analysis_result,
-                                email_id=email_data['id']
+                                email_id=email_data['id'],
+                                signature=mailbox.signature,
+                                num_responses=self.num_responses,
+                                deadline=deadline,
+                                on_partial=response_stream.update,
+                                signals=signals
                             )
                     except asyncio.TimeoutError:
                         logger.error("AI応答生成がタイムアウトしました")
+                        await response_stream.abort()
                         return
                 
                 # 返信候補をDiscordに送信
                 logger.log_flow(FlowStep.DISPLAY_RESPONSE, "Discordに返信を表示")
                 try:
-                    async with async_timeout(30):  # 30秒のタイムアウト
-                        success = await self.discord_bot.send_response_options(channel_id, email_data, responses)
+                    async with deadline.stage("display"):
+                        success = await response_stream.finalize(
+                            responses,
+                            reused_from=duplicate.email_id if duplicate and not self.regenerate_duplicates else None
+                        )
                         if not success:
                             logger.error(f"返信候補の送信に失敗しました: チャンネルID {channel_id}")
                             return
@@ -273,8 +438,26 @@ class EmailBot:
                     logger.error(f"返信候補の送信がタイムアウトしました: チャンネルID {channel_id}")
                     return
                 
-                logger.log_flow(FlowStep.COMPLETE, f"メール {email_data['id']} の処理を完了")
+                # 追加情報なしで作成した返信案は、次に届く類似メールのために索引に追加する
+                if self.near_duplicates and required_info_type is None and (duplicate is None or self.regenerate_duplicates):
+                    await self.near_duplicates.add(
+                        duplicate_route, email_data['id'], email_data['body'], analysis_result, responses, address
+                    )
+                
+                logger.log_flow(FlowStep.COMPLETE, f"メール {email_data['id']} の処理を完了（{deadline.elapsed():.1f}秒）")
+            except asyncio.CancelledError:
+                # シャットダウンで中断された場合は処理済みにせず、チェックポイントから再開させる
+                cancelled = True
+                raise
             finally:
+                # 逐次表示の更新タスクを停止
+                if response_stream:
+                    await response_stream.close()
+                
+                # リースを処理済みにする
+                if self.lease_store and not cancelled:
+                    await self._complete_lease(email_data)
+                
                 # 処理完了したメールをトラッキングから削除
                 if email_data['id'] in self.processing_emails:
                     self.processing_emails.remove(email_data['id'])
@@ -287,52 +470,276 @@ class EmailBot:
             if email_data['id'] in self.processing_emails:
                 self.processing_emails.remove(email_data['id'])
     
-    def _setup_approval_handler(self, email_data, analysis_result, prompt, channel_id):
-        """承認イベントハンドラを設定"""
+    def _prepare_sender(self, email_data, mailbox):
+        """送信者情報を処理してemail_dataに追加し、宛名を返す"""
+        logger.log_flow(FlowStep.EXTRACT_ADDRESS, "送信者情報から宛名を抽出")
+        sender_info = mailbox.name_manager.process_email(email_data)
+        sender_email = sender_info['email']
+        logger.info(f"送信者メールアドレス: {sender_email}")
+        
+        # 宛名を生成
+        address = mailbox.name_manager.format_address(sender_email)
+        logger.info(f"生成された宛名: {address}")
+        
+        # 送信者情報をemail_dataに追加
+        email_data['sender_name'] = sender_info.get('name', '')
+        email_data['sender_company'] = sender_info.get('company', '')
+        logger.info(f"送信者名: {email_data['sender_name']}, 会社名: {email_data['sender_company']}")
+        return address
+    
+    def _duplicate_route(self, email_data, mailbox):
+        """類似メールを探す範囲（同じメールボックス・同じ通知先チャンネルのメールだけを比較する）"""
+        return f"{mailbox.name}:{email_data['discord_channel_id']}"
+    
+    async def _build_thread_context(self, email_data, mailbox, deadline):
+        """スレッドの経緯の要約を取得（無効・失敗・タイムアウトの場合はNone）"""
+        if not self.thread_context:
+            return None
+        try:
+            async with deadline.stage("thread_context"):
+                summary = await self.thread_context.build(
+                    email_data, mailbox.gmail_client, self.response_processor, deadline=deadline
+                )
+            if summary:
+                logger.info(f"メール {email_data['id']} のスレッドの経緯を追加します: {self.thread_context.get_stats()}")
+            return summary
+        except asyncio.TimeoutError:
+            logger.error("スレッドの経緯の要約がタイムアウトしました")
+        except Exception as e:
+            logger.error(f"スレッドの経緯の取得に失敗しました: {e}")
+        return None
+    
+    def _build_prompt(self, email_data, address, thread_summary=None):
+        """メール情報を含むプロンプトと、モデルの切り替えに使うメールの特徴を生成"""
+        # 特徴は圧縮前の本文から求める（圧縮で除く引用履歴がスレッドの深さの手がかりになる）
+        signals = RoutingSignals.from_email(email_data)
+        
+        # 引用履歴・署名・定型文を除き、トークン予算内に収める
+        body = email_data['body']
+        if self.text_compactor:
+            compaction = self.text_compactor.compact(body, model=getattr(self.response_processor, 'model', None))
+            body = compaction.text
+            logger.info(f"メール {email_data['id']} の本文を圧縮しました: {compaction.to_dict()}")
+        
+        thread_section = f"\n# スレッドのこれまでの経緯（要約）\n{thread_summary}\n" if thread_summary else ""
+        
+        prompt = f"""
+# 元のメール情報
+件名: {email_data['subject']}
+送信者: {email_data['sender']}
+本文:
+{body}
+{thread_section}
+# 宛名情報
+宛名: {address}
+"""
+        return prompt, signals
+    
+    async def _register_approval(self, email_data, analysis_result, prompt, channel_id):
+        """承認待ちのメールをレジストリに登録"""
         email_id = email_data['id']
+        request = self.discord_bot.approval_requests.get(email_id, {})
         
-        @self.discord_bot.bot.event
-        async def on_approval_decision(decided_email_id, decision):
-            """承認または拒否の決定を処理"""
-            if decided_email_id != email_id:
-                return  # 他のメールの承認イベントは無視
-                
-            logger.info(f"メール {email_id} の承認決定を受信: {decision}")
-            
-            # 承認情報を追加
-            additional_info = {
-                "type": "承認",
-                "decision": decision
-            }
-            
-            # 承認情報をプロンプトに追加
-            approval_info = f"\n\n# 承認情報\n承認結果: {decision}"
-            full_prompt = f"{prompt}\n\n# メール分析結果\n{analysis_result.get('analysis', '')}{approval_info}"
+        # 再起動後も処理を再開できるよう、生のメッセージを除いて保存する
+        stored_email = {key: value for key, value in email_data.items() if key != 'raw_message'}
+        self.approval_registry.register(email_id, {
+            "email_data": stored_email,
+            "analysis_result": analysis_result,
+            "prompt": prompt,
+            "channel_id": str(channel_id),
+            "message_id": request.get('message_id')
+        })
+        await self.approval_registry.persist()
+    
+    async def _on_approval_decision(self, decided_email_id, decision):
+        """承認または拒否の決定を処理"""
+        if self.shutting_down:
+            logger.warning(f"シャットダウン中のため、メール {decided_email_id} の承認決定は再起動後に処理されます")
+            return
+        
+        # シャットダウン時に完了を待てるよう処理中として記録
+        job_key = f"approval:{decided_email_id}"
+        self.in_flight_jobs[job_key] = (asyncio.current_task(), None)
+        try:
+            await self._handle_approval_decision(decided_email_id, decision)
+        finally:
+            self.in_flight_jobs.pop(job_key, None)
+    
+    async def _handle_approval_decision(self, decided_email_id, decision):
+        """承認または拒否の決定に応じて返信を生成"""
+        context = self.approval_registry.resolve(decided_email_id, decision)
+        if context is None:
+            logger.warning(f"メール {decided_email_id} の承認待ちが見つかりません")
+            return
+        await self.approval_registry.persist()
+        
+        email_id = decided_email_id
+        email_data = context["email_data"]
+        analysis_result = context["analysis_result"]
+        prompt = context["prompt"]
+        channel_id = context["channel_id"]
+        logger.info(f"メール {email_id} の承認決定を受信: {decision}")
+        set_call_context(email_id, email_data.get('sender'))
+        deadline = Deadline.for_email(email_id)
+        
+        # 承認情報を追加
+        additional_info = {
+            "type": "承認",
+            "decision": decision
+        }
+        
+        # 承認情報をプロンプトに追加
+        approval_info = f"\n\n# 承認情報\n承認結果: {decision}"
+        full_prompt = f"{prompt}\n\n# メール分析結果\n{analysis_result.get('analysis', '')}{approval_info}"
+        
+        response_stream = self.discord_bot.create_response_stream(channel_id, email_data)
+        try:
+            # 返信を生成
+            logger.log_flow(FlowStep.GENERATE_RESPONSE, "AIで返信を生成")
+            async with deadline.stage("generation"):
+                responses = await self.response_processor.generate_responses(
+                    full_prompt,
+                    analysis_result,
+                    email_id=email_id,
+                    additional_info=additional_info,
+                    signature=self._get_mailbox(email_data).signature,
+                    num_responses=self.num_responses,
+                    deadline=deadline,
+                    on_partial=response_stream.update,
+                    signals=RoutingSignals.from_email(email_data)
+                )
             
+            # 返信候補をDiscordに送信
+            logger.log_flow(FlowStep.DISPLAY_RESPONSE, "Discordに返信を表示")
+            async with deadline.stage("display"):
+                success = await response_stream.finalize(responses)
+                if not success:
+                    logger.error(f"返信候補の送信に失敗しました: チャンネルID {channel_id}")
+                    await self._reopen_approval(email_id, context, "返信候補を表示できませんでした")
+                    return
+        except asyncio.TimeoutError:
+            logger.error("AI応答生成または送信がタイムアウトしました")
+            await response_stream.abort()
+            await self._reopen_approval(email_id, context, "返信の生成がタイムアウトしました")
+        except asyncio.CancelledError:
+            # シャットダウンで中断された場合は承認待ちに戻し、再起動後に再度承認できるようにする
+            self.approval_registry.register(email_id, context)
+            await self.approval_registry.persist()
+            logger.info(f"メール {email_id} の承認後処理が中断されたため、承認待ちに戻しました")
+            raise
+        except Exception as e:
+            logger.error(f"承認後の処理でエラーが発生しました: {e}")
+            import traceback
+            logger.error(f"詳細なエラー情報: {traceback.format_exc()}")
+            await response_stream.abort()
+            await self._reopen_approval(email_id, context, "返信の生成中にエラーが発生しました")
+        finally:
+            await response_stream.close()
+    
+    async def _reopen_approval(self, email_id, context, reason):
+        """承認後の処理が失敗したメールを承認待ちに戻し、もう一度承認・拒否できるようにする"""
+        self.approval_registry.register(email_id, context)
+        await self.approval_registry.persist()
+        self.discord_bot.restore_approval_view(email_id, context)
+        logger.info(f"メール {email_id} の承認後処理が失敗したため、承認待ちに戻しました: {reason}")
+        try:
+            await self.discord_bot.send_message(
+                context["channel_id"],
+                f"**{reason}**\n\nメール {email_id} はもう一度承認または拒否できます。"
+            )
+        except Exception as e:
+            logger.error(f"承認待ちに戻したことの通知エラー: {e}")
+    
+    async def _claim_lease(self, email_data):
+        """メールのリースを取得（取得できた場合はTrue、他のワーカーが処理中・処理済みの場合はFalse、確認できなかった場合はNone）"""
+        payload = {
+            "discord_channel_id": email_data.get('discord_channel_id'),
+            "notified": bool(email_data.get('notified'))
+        }
+        try:
+            return await self.executor.run_disk(
+                self.lease_store.try_claim, self._get_mailbox(email_data).name, email_data['id'], payload
+            )
+        except Exception as e:
+            logger.error(f"リース取得エラー: {e}")
+            return None
+    
+    async def _update_lease(self, email_data, **fields):
+        """リースの payload を更新"""
+        try:
+            await self.executor.run_disk(
+                self.lease_store.update_payload, self._get_mailbox(email_data).name, email_data['id'], fields
+            )
+        except Exception as e:
+            logger.error(f"リース更新エラー: {e}")
+    
+    async def _complete_lease(self, email_data):
+        """メールのリースを処理済みにする"""
+        try:
+            await self.executor.run_disk(
+                self.lease_store.complete, self._get_mailbox(email_data).name, email_data['id']
+            )
+        except Exception as e:
+            logger.error(f"リース完了エラー: {e}")
+    
+    async def renew_leases(self):
+        """保持しているリースを定期的に延長（ワーカー停止時はこの更新が途絶えて期限切れになる）"""
+        while True:
+            await asyncio.sleep(self.lease_store.ttl / 3)
             try:
-                # 返信を生成
-                logger.log_flow(FlowStep.GENERATE_RESPONSE, "AIで返信を生成")
-                async with async_timeout(60):
-                    responses = await self.response_processor.generate_responses(
-                        full_prompt,
-                        analysis_result,
-                        email_id=email_id,
-                        additional_info=additional_info
-                    )
-                
-                # 返信候補をDiscordに送信
-                logger.log_flow(FlowStep.DISPLAY_RESPONSE, "Discordに返信を表示")
-                async with async_timeout(30):
-                    success = await self.discord_bot.send_response_options(channel_id, email_data, responses)
-                    if not success:
-                        logger.error(f"返信候補の送信に失敗しました: チャンネルID {channel_id}")
-                        return
-            except asyncio.TimeoutError:
-                logger.error("AI応答生成または送信がタイムアウトしました")
+                await self.executor.run_disk(self.lease_store.renew)
             except Exception as e:
-                logger.error(f"承認後の処理でエラーが発生しました: {e}")
-                import traceback
-                logger.error(f"詳細なエラー情報: {traceback.format_exc()}")
+                logger.error(f"リース延長エラー: {e}")
+    
+    async def take_over_expired_leases(self):
+        """停止したワーカーの期限切れリースを引き継ぎ、通常のメールと同じく処理待ちに追加して処理"""
+        try:
+            claimed = await self.executor.run_disk(self.lease_store.claim_expired)
+        except Exception as e:
+            logger.error(f"期限切れリースの引き継ぎエラー: {e}")
+            return
+        
+        for lease in claimed:
+            mailbox = self.mailboxes_by_name.get(lease['mailbox'])
+            if mailbox is None:
+                logger.warning(f"未知のメールボックスのリースです: {lease['mailbox']}")
+                continue
+            try:
+                email_data = await self.executor.run_network(mailbox.gmail_client.get_email, lease['email_id'])
+            except Exception as e:
+                logger.error(f"引き継いだメール {lease['email_id']} の取得エラー: {e}")
+                continue
+            if email_data is None:
+                continue
+            email_data['mailbox'] = mailbox.name
+            email_data['discord_channel_id'] = lease.get('discord_channel_id')
+            # 前のワーカーが通知済みのメールは再通知しない
+            email_data['notified'] = lease.get('notified', False)
+            self.queued_emails.append(email_data)
+        
+        if claimed:
+            await self.process_queued_emails()
+    
+    async def purge_done_leases(self):
+        """保存期間を過ぎた処理済みのリースを削除（1時間に1回まで）"""
+        now = time.monotonic()
+        if self._last_lease_purge is not None and now - self._last_lease_purge < 3600:
+            return
+        self._last_lease_purge = now
+        try:
+            purged = await self.executor.run_disk(self.lease_store.purge_done)
+            if purged:
+                logger.info(f"処理済みのリース{purged}件を削除しました")
+        except Exception as e:
+            logger.error(f"処理済みリースの削除エラー: {e}")
+    
+    def _get_mailbox(self, email_data):
+        """メールを受信したメールボックスを取得"""
+        return self.mailboxes_by_name.get(email_data.get('mailbox'), self.mailboxes[0])
+    
+    def _get_gmail_client_for_email(self, email_data):
+        """返信送信に使うGmailクライアントを取得"""
+        return self._get_mailbox(email_data).gmail_client
     
     def _extract_urls_from_email(self, email_body):
         """メール本文からURLを抽出"""
@@ -350,50 +757,339 @@ class EmailBot:
     async def check_emails(self):
         """新しいメールをチェックして処理"""
         try:
-            # 新しいメールを取得
-            emails = self.email_processor.process_new_emails()
+            # 各メールボックスから割り当て件数分の新しいメールを並列に取得
+            allocations = self.mailbox_scheduler.allocate()
+            results = await asyncio.gather(
+                *[self.executor.run_network(mailbox.fetch_new_emails, quota) for mailbox, quota in allocations],
+                return_exceptions=True
+            )
+            
+            email_lists = []
+            for (mailbox, quota), result in zip(allocations, results):
+                if isinstance(result, Exception):
+                    logger.error(f"メールボックス '{mailbox.name}' のメール取得エラー: {result}")
+                    continue
+                email_lists.append(result)
+            
+            # メールボックス間で交互に処理する
+            emails = MailboxScheduler.interleave(email_lists)
             
             if emails:
                 logger.log_flow(FlowStep.RECEIVE_EMAIL, f"{len(emails)}件の新しいメールを処理します")
-                
-                # 各メールを処理
-                for email_data in emails:
-                    await self.process_email_for_discord(email_data)
+                self.queued_emails.extend(emails)
             else:
                 logger.info("新しいメールはありません")
+            
+            # 各メールを処理
+            await self.process_queued_emails()
         
         except Exception as e:
             logger.error(f"メールチェックエラー: {e}")
     
+    async def process_queued_emails(self):
+        """処理待ちのメールを順に処理（処理中に処理待ちへ戻されたメールは次回のチェックで処理する）"""
+        for _ in range(len(self.queued_emails)):
+            if not self.queued_emails or self.shutting_down:
+                break
+            email_data = self.queued_emails.popleft()
+            if self.batch_coordinator and self.batch_coordinator.matches(email_data):
+                await self._enqueue_batch(email_data)
+                continue
+            await self._run_job(email_data)
+    
+    async def _enqueue_batch(self, email_data):
+        """急ぎでないメールをバッチ処理待ちに追加"""
+        try:
+            if self.lease_store:
+                claimed = await self._claim_lease(email_data)
+                if claimed is None:
+                    logger.warning(f"メール {email_data['id']} のリースを確認できなかったため、処理待ちに戻します")
+                    self.queued_emails.append(email_data)
+                    return
+                if not claimed:
+                    logger.info(f"メール {email_data['id']} は他のワーカーが処理しています")
+                    return
+            mailbox = self._get_mailbox(email_data)
+            address = self._prepare_sender(email_data, mailbox)
+            prompt, _ = self._build_prompt(email_data, address)
+            # リースは結果を表示するまで処理中のまま延長し続ける（このワーカーが停止した場合は
+            # 期限切れのリースとして他のワーカーが通常の処理で引き継ぐ）
+            await self.batch_coordinator.enqueue(email_data, prompt, signature=mailbox.signature)
+        except Exception as e:
+            logger.error(f"バッチ処理待ちへの追加エラー: {e}")
+            # 追加できなかった場合は通常の処理に回す
+            email_data['batch_fallback'] = True
+            await self._run_job(email_data)
+    
+    async def _handle_batch_result(self, email_data, response_text):
+        """バッチの結果をDiscordに表示（結果が得られなかった場合は通常の処理に戻す）"""
+        if self.lease_store:
+            # 停止中にリースが期限切れになり、他のワーカーが引き継いだメールの結果は破棄する
+            claimed = await self._claim_lease(email_data)
+            if claimed is None:
+                logger.warning(f"メール {email_data['id']} のリースを確認できなかったため、通常の処理に戻します")
+                email_data['batch_fallback'] = True
+                self.queued_emails.append(email_data)
+                return
+            if not claimed:
+                logger.info(f"メール {email_data['id']} は他のワーカーが引き継いだため、バッチ結果を破棄します")
+                return
+        
+        responses = None
+        if response_text:
+            _, responses = self.response_processor.parse_combined_response(response_text)
+        
+        if not responses:
+            logger.warning(f"メール {email_data['id']} のバッチ結果が得られなかったため、通常の処理に戻します")
+            email_data['batch_fallback'] = True
+            self.queued_emails.append(email_data)
+            return
+        
+        channel_id = email_data['discord_channel_id']
+        try:
+            if not email_data.get('notified'):
+                if not await self.discord_bot.send_email_notification(channel_id, email_data):
+                    logger.error(f"メール通知の送信に失敗しました: チャンネルID {channel_id}")
+                    return
+                email_data['notified'] = True
+            
+            response_stream = self.discord_bot.create_response_stream(channel_id, email_data)
+            if not await response_stream.finalize(responses):
+                logger.error(f"返信候補の送信に失敗しました: チャンネルID {channel_id}")
+                return
+            
+            logger.log_flow(FlowStep.COMPLETE, f"メール {email_data['id']} のバッチ処理を完了")
+        finally:
+            # 通常の処理と同じく、結果を表示した時点でリースを処理済みにする
+            if self.lease_store:
+                await self._complete_lease(email_data)
+    
+    async def _run_job(self, email_data):
+        """メール処理をタスクとして実行し、処理中として追跡"""
+        task = asyncio.ensure_future(self.process_email_for_discord(email_data))
+        self.in_flight_jobs[email_data['id']] = (task, email_data)
+        task.add_done_callback(lambda _: self.in_flight_jobs.pop(email_data['id'], None))
+        # 受付ループがキャンセルされても処理中のジョブは継続させる（シャットダウン時に完了を待つ）
+        await asyncio.shield(task)
+    
+    async def resume_unfinished_jobs(self):
+        """前回のシャットダウンで完了しなかったジョブを処理待ちに戻す"""
+        try:
+            jobs = await self.executor.run_disk(self.checkpoint.load)
+        except Exception as e:
+            logger.error(f"未完了ジョブの読み込みエラー: {e}")
+            return
+        if jobs:
+            logger.info(f"前回の未完了ジョブ{len(jobs)}件を再開します")
+            self.queued_emails.extendleft(reversed(jobs))
+    
+    async def shutdown(self):
+        """受付を停止し、処理中のジョブを期限まで待ってから、未完了分を保存して接続を順に閉じる"""
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+        logger.info("シャットダウンを開始します: 新しいメールの受付を停止しました")
+        
+        # 1. 受付を停止
+        self.discord_bot.accepting_sends = False
+        for task in self._background_tasks:
+            task.cancel()
+        
+        # 2. 処理中のジョブと送信処理の完了を待つ
+        pending = [task for task, _ in self.in_flight_jobs.values()] + list(self.discord_bot.pending_sends)
+        if pending:
+            logger.info(f"処理中の{len(pending)}件の完了を最大{self.drain_timeout}秒待機します")
+            done, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+            logger.info(f"{len(done)}件が完了しました（未完了: {len(not_done)}件）")
+            
+            # 期限内に終わらなかったジョブを中断
+            unfinished = [
+                email_data for task, email_data in self.in_flight_jobs.values()
+                if task in not_done and email_data is not None
+            ]
+            for task in not_done:
+                task.cancel()
+            await asyncio.gather(*not_done, return_exceptions=True)
+        else:
+            unfinished = []
+        
+        # 3. 未完了のジョブと処理待ちのメールを次回起動用に保存
+        unfinished.extend(self.queued_emails)
+        self.queued_emails.clear()
+        if unfinished:
+            try:
+                await self.executor.run_disk(self.checkpoint.save, unfinished)
+            except Exception as e:
+                logger.error(f"未完了ジョブの保存に失敗しました: {e}")
+            # 他のワーカーがすぐに引き継げるようリースを手放す
+            if self.lease_store:
+                for email_data in unfinished:
+                    try:
+                        await self.executor.run_disk(
+                            self.lease_store.release, self._get_mailbox(email_data).name, email_data['id']
+                        )
+                    except Exception as e:
+                        logger.error(f"リース解放エラー: {e}")
+        await self.approval_registry.persist()
+        
+        # 4. 接続を閉じる
+        if not self.discord_bot.bot.is_closed():
+            await self.discord_bot.bot.close()
+            logger.info("Discordボットを停止しました")
+        if hasattr(self.response_processor, 'close'):
+            try:
+                await self.response_processor.close()
+            except Exception as e:
+                logger.error(f"AIクライアントの終了エラー: {e}")
+    
+    def request_shutdown(self):
+        """シャットダウンを要求（シグナルハンドラから呼び出す）"""
+        if self._stop_event and not self._stop_event.is_set():
+            logger.info("停止シグナルを受信しました")
+            self._stop_event.set()
+    
+    async def prewarm(self, bot_task):
+        """起動時の事前準備を並行して実行（Discord接続、チャンネル解決、各APIへの接続、プロンプト読み込み）"""
+        await asyncio.gather(
+            self.readiness.track("discord", self._wait_discord_ready(bot_task)),
+            self.readiness.track("llm", self._warmup_llm()),
+            self.readiness.track("google", self._warmup_google()),
+            self.readiness.track("prompts", self.executor.run_disk(config.preload_prompts)),
+        )
+        # チャンネルの解決はDiscordの接続後に行う
+        if self.readiness.is_ready:
+            await self.readiness.track("channels", self._resolve_channels())
+    
+    async def _wait_discord_ready(self, bot_task):
+        """Discordのゲートウェイ接続（READY）を待つ"""
+        ready_task = asyncio.ensure_future(self.discord_bot.bot.wait_until_ready())
+        await asyncio.wait([ready_task, bot_task], return_when=asyncio.FIRST_COMPLETED)
+        if not ready_task.done():
+            ready_task.cancel()
+            error = bot_task.exception() if not bot_task.cancelled() else None
+            raise RuntimeError(f"Discordボットが接続前に終了しました: {error}")
+    
+    async def _warmup_llm(self):
+        """LLM APIへの接続を確立"""
+        if hasattr(self.response_processor, 'warmup'):
+            await self.response_processor.warmup()
+    
+    async def _warmup_google(self):
+        """Gmail/カレンダーAPIへの接続を確立"""
+        calls = [self.executor.run_network(mailbox.gmail_client.get_user_email) for mailbox in self.mailboxes]
+        schedule_analyzer = getattr(self.response_processor, 'schedule_analyzer', None)
+        if schedule_analyzer is not None:
+            calls.append(self.executor.run_network(schedule_analyzer.calendar_client.get_calendar_list))
+        await asyncio.gather(*calls)
+    
+    async def _resolve_channels(self):
+        """マッピングに登録された送信先チャンネルを事前に解決"""
+        channel_ids = set()
+        for mailbox in self.mailboxes:
+            for entry in mailbox.email_processor.email_channel_mapping.values():
+                if isinstance(entry, dict) and entry.get("discord_channel_id"):
+                    channel_ids.add(str(entry["discord_channel_id"]))
+        
+        missing = []
+        for channel_id in channel_ids:
+            if self.discord_bot.bot.get_channel(int(channel_id)) is not None:
+                continue
+            try:
+                await self.discord_bot.bot.fetch_channel(int(channel_id))
+            except Exception as e:
+                missing.append(channel_id)
+                logger.warning(f"チャンネル {channel_id} を解決できませんでした: {e}")
+        logger.info(f"{len(channel_ids) - len(missing)}/{len(channel_ids)}件の送信先チャンネルを解決しました")
+    
     async def periodic_check(self):
         """定期的にメールをチェック"""
         while True:
             await self.check_emails()
+            # 停止したワーカーのメールを引き継ぎ、古い処理済みのリースを削除
+            if self.lease_store:
+                await self.take_over_expired_leases()
+                await self.purge_done_leases()
+            # 期限切れの承認待ちを整理
+            if self.approval_registry.purge_expired():
+                await self.approval_registry.persist()
             await asyncio.sleep(self.check_interval)
     
     async def start_bot_and_check(self):
         """DiscordボットとメールチェックをまとめてAsync実行"""
         logger.info("Discordボットを非同期モードで起動します")
         
+        # イベントループのブロッキング監視を開始
+        self.loop_lag_monitor.start()
+        
+        # 停止シグナルでシャットダウンを開始する（シグナルハンドラ非対応の環境ではKeyboardInterruptで処理）
+        self._stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_shutdown)
+            except (NotImplementedError, RuntimeError):
+                pass
+        
+        # 前回の未完了ジョブを読み込む
+        await self.resume_unfinished_jobs()
+        
         # Discordボットを非同期で起動
         bot_task = asyncio.create_task(self.discord_bot.bot.start(self.discord_bot.token))
         
-        # 少し待ってからメールチェックを開始（ボットの起動を待つ）
-        await asyncio.sleep(5)
-        
-        # 定期チェックを開始
-        logger.info("メールの定期チェックを開始します")
-        check_task = asyncio.create_task(self.periodic_check())
+        # Discordの接続と事前準備を並行して進め、準備完了を待ってからメールチェックを開始
+        self.readiness = ReadinessState(
+            required=["discord"],
+            optional=["channels", "llm", "google", "prompts"]
+        )
+        prewarm_task = asyncio.create_task(self.prewarm(bot_task))
+        self._background_tasks = [prewarm_task]
+        if await self.readiness.wait(timeout=self.ready_timeout):
+            logger.info(f"起動準備が完了しました: {self.readiness.status()}")
+            
+            # 定期チェックを開始
+            logger.info("メールの定期チェックを開始します")
+            self._background_tasks.append(asyncio.create_task(self.periodic_check()))
+        else:
+            logger.error(f"起動準備が完了しませんでした: {self.readiness.status()}")
+            self.request_shutdown()
+        if self.lease_store:
+            self._background_tasks.append(asyncio.create_task(self.renew_leases()))
+        if self.batch_coordinator:
+            self._background_tasks.append(asyncio.create_task(self.batch_coordinator.run(self._handle_batch_result)))
         
-        # 両方のタスクが完了するまで待機
+        # ボットが終了するか停止要求を受けるまで待機
+        stop_task = asyncio.create_task(self._stop_event.wait())
         try:
-            await asyncio.gather(bot_task, check_task)
+            await asyncio.wait([bot_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+            if bot_task.done() and not bot_task.cancelled() and bot_task.exception():
+                logger.error(f"Discordボットが異常終了しました: {bot_task.exception()}")
         except asyncio.CancelledError:
             logger.info("タスクがキャンセルされました")
         except Exception as e:
             logger.error(f"タスク実行中にエラーが発生しました: {e}")
             import traceback
             logger.error(f"詳細なエラー情報: {traceback.format_exc()}")
+        finally:
+            stop_task.cancel()
+            await self.shutdown()
+            await asyncio.wait([bot_task], timeout=10)
+            self.loop_lag_monitor.stop()
+            logger.info(f"スレッドプール統計: {self.executor.get_stats()}")
+            logger.info(f"ステージ別の期限切れ集計: {get_deadline_stats()}")
+            response_cache = get_response_cache()
+            if response_cache:
+                logger.info(f"応答キャッシュ統計: {response_cache.get_stats()}")
+            if hasattr(self.response_processor, 'get_stats'):
+                logger.info(f"AIプロバイダー統計: {self.response_processor.get_stats()}")
+            logger.info(f"モデル別のレイテンシ・コスト: {get_model_policy().get_stats()}")
+            logger.info(f"AI APIの接続プール統計: {get_pool_stats()}")
+            logger.info(f"レート制限の待機統計: {get_rate_limit_stats()}")
+            if self.text_compactor:
+                logger.info(f"本文圧縮による削減トークン数: {self.text_compactor.get_stats()}")
+            if self.near_duplicates:
+                logger.info(f"類似メールの再利用: {self.near_duplicates.get_stats()}")
+            if self.thread_context:
+                logger.info(f"スレッドの要約: {self.thread_context.get_stats()}")
     
     def run(self):
         """ボットを実行"""
@@ -403,14 +1099,19 @@ class EmailBot:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         
+        main_task = loop.create_task(self.start_bot_and_check())
         try:
-            loop.run_until_complete(self.start_bot_and_check())
+            loop.run_until_complete(main_task)
         except KeyboardInterrupt:
+            # シグナルハンドラを登録できない環境ではここでシャットダウンを行う
             logger.info("アプリケーションを停止します")
-            # Discordボットを停止
-            if hasattr(loop, 'is_running') and loop.is_running():
-                asyncio.create_task(self.discord_bot.bot.close())
+            if self._stop_event is None:
+                main_task.cancel()
+            else:
+                self.request_shutdown()
+            loop.run_until_complete(asyncio.gather(main_task, return_exceptions=True))
         finally:
+            self.executor.shutdown(wait=True)
             loop.close()
             logger.info("イベントループを閉じました")
 
@@ -8,8 +8,8 @@ from ..config import config
 logger = setup_logger(__name__)
 
 class NameManager:
-    def __init__(self):
-        self.email_mapping = config.get_email_channel_mapping()
+    def __init__(self, email_mapping=None):
+        self.email_mapping = email_mapping if email_mapping is not None else config.get_email_channel_mapping()
     
     @flow_step(FlowStep.EXTRACT_ADDRESS)
     def process_email(self, email_data):
@@ -0,0 +1,65 @@
+import json
+import os
+import datetime
+from pathlib import Path
+
+from ..config import config
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+class JobCheckpoint:
+    """シャットダウン時に完了しなかったメール処理を保存し、次回起動時に再開するためのクラス"""
+
+    def __init__(self, checkpoint_file=None):
+        """
+        初期化
+
+        Args:
+            checkpoint_file: 保存先ファイルのパス。指定しない場合はデータディレクトリを使用
+        """
+        self.checkpoint_file = Path(checkpoint_file) if checkpoint_file else config.DATA_DIR / "unfinished_jobs.json"
+
+    def save(self, jobs):
+        """
+        未完了のメールデータを保存
+
+        Args:
+            jobs: メールデータのリスト
+
+        Returns:
+            保存した件数
+        """
+        # 生のメッセージは再開に不要なため除外する
+        stored_jobs = [
+            {key: value for key, value in email_data.items() if key != 'raw_message'}
+            for email_data in jobs
+        ]
+        content = {
+            "saved_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "jobs": stored_jobs
+        }
+
+        tmp_file = self.checkpoint_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp_file, self.checkpoint_file)
+
+        logger.info(f"{len(stored_jobs)}件の未完了ジョブを保存しました: {self.checkpoint_file}")
+        return len(stored_jobs)
+
+    def load(self):
+        """保存された未完了のメールデータを読み込み、保存ファイルを削除"""
+        try:
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            logger.error(f"未完了ジョブの読み込みに失敗しました: {e}")
+            return []
+
+        jobs = content.get("jobs", [])
+        os.remove(self.checkpoint_file)
+        logger.info(f"{len(jobs)}件の未完了ジョブを読み込みました（保存日時: {content.get('saved_at')}）")
+        return jobs
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+from async_timeout import timeout as async_timeout
+
+from ..config import config
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# メール1件あたりの処理時間の上限（秒）。従来の段階別タイムアウト 15+30+60+30 秒の合計
+DEFAULT_JOB_BUDGET = 135
+
+class DeadlineStats:
+    """ステージごとの実行回数・期限切れ回数・所要時間の集計"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, stage, elapsed, expired):
+        """ステージの実行結果を記録"""
+        stats = self.stages.setdefault(stage, {"calls": 0, "expired": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["calls"] += 1
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+        if expired:
+            stats["expired"] += 1
+
+    def to_dict(self):
+        """集計結果を辞書形式で返す"""
+        return {
+            stage: {
+                "calls": stats["calls"],
+                "expired": stats["expired"],
+                "avg_seconds": round(stats["total_seconds"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                "max_seconds": round(stats["max_seconds"], 2),
+            }
+            for stage, stats in self.stages.items()
+        }
+
+deadline_stats = DeadlineStats()
+
+class _Stage:
+    """Deadline.stage() が返す非同期コンテキストマネージャ"""
+
+    def __init__(self, deadline, name, cap):
+        self.deadline = deadline
+        self.name = name
+        self.cap = cap
+        self._timeout = None
+        self._started_at = None
+
+    async def __aenter__(self):
+        self._started_at = time.monotonic()
+        budget = self.deadline.remaining()
+        if self.cap is not None:
+            budget = min(budget, self.cap)
+        if budget <= 0:
+            deadline_stats.record(self.name, 0.0, True)
+            logger.error(f"[{self.deadline.name}] ステージ '{self.name}' の開始前に期限切れになりました")
+            raise asyncio.TimeoutError()
+        self._timeout = async_timeout(budget)
+        await self._timeout.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            return await self._timeout.__aexit__(exc_type, exc, tb)
+        finally:
+            elapsed = time.monotonic() - self._started_at
+            expired = self._timeout.expired
+            deadline_stats.record(self.name, elapsed, expired)
+            if expired:
+                logger.error(
+                    f"[{self.deadline.name}] ステージ '{self.name}' が期限切れでキャンセルされました"
+                    f"（{elapsed:.1f}秒経過、全体の残り {self.deadline.remaining():.1f}秒）"
+                )
+
+class Deadline:
+    """ジョブ全体の処理期限
+
+    各ステージは `async with deadline.stage("name"):` で実行し、残り時間を
+    そのままタイムアウトとして使う。早く終わったステージの余り時間は後続の
+    ステージが使え、期限を過ぎたステージはキャンセルされる。
+    """
+
+    def __init__(self, budget, name="job", stage_caps=None):
+        """
+        初期化
+
+        Args:
+            budget: ジョブ全体の制限時間（秒）
+            name: ログ出力用の名前（メールIDなど）
+            stage_caps: ステージ名をキーとした個別の上限時間（秒）の辞書（任意）
+        """
+        self.name = name
+        self.budget = budget
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget
+        self.stage_caps = stage_caps or {}
+
+    @classmethod
+    def for_email(cls, email_id):
+        """設定に従ってメール1件分の期限を作成"""
+        settings = config.get_email_settings().get("deadlines", {})
+        return cls(
+            settings.get("email_job_seconds", DEFAULT_JOB_BUDGET),
+            name=f"メール {email_id}",
+            stage_caps=settings.get("stage_caps", {})
+        )
+
+    def remaining(self):
+        """残り時間（秒）。期限切れの場合は0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self):
+        """経過時間（秒）"""
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def stage(self, name, cap=None):
+        """
+        残り時間を上限としてステージを実行するコンテキストマネージャを返す
+
+        Args:
+            name: ステージ名（期限切れの集計に使用）
+            cap: このステージの個別上限（秒）。指定しない場合は設定値、設定もなければ残り時間すべて
+        """
+        if cap is None:
+            cap = self.stage_caps.get(name)
+        return _Stage(self, name, cap)
+
+def get_deadline_stats():
+    """ステージごとの期限切れ集計を取得"""
+    return deadline_stats.to_dict()
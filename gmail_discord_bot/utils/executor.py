@@ -0,0 +1,253 @@
+import asyncio
+import functools
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import config
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# プールごとのデフォルト設定（email_settings.json の "performance" で上書き可能）
+DEFAULT_POOL_SETTINGS = {
+    "network": {"workers": 8, "max_queued": 64},
+    "disk": {"workers": 2, "max_queued": 32},
+}
+
+class PoolStats:
+    """スレッドプールの実行統計"""
+
+    def __init__(self, name):
+        self.name = name
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+        self.slowest_call = None
+
+    def to_dict(self):
+        """統計情報を辞書形式で返す"""
+        finished = self.completed + self.failed
+        return {
+            "pool": self.name,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "avg_wait_ms": round(self.total_wait / finished * 1000, 1) if finished else 0.0,
+            "avg_run_ms": round(self.total_run / finished * 1000, 1) if finished else 0.0,
+            "max_run_ms": round(self.max_run * 1000, 1),
+            "slowest_call": self.slowest_call,
+        }
+
+class ExecutorManager:
+    """ブロッキング処理（ネットワーク/ディスク）をイベントループ外で実行するためのプール管理クラス"""
+
+    def __init__(self, pool_settings=None, slow_call_ms=1000):
+        """
+        初期化
+
+        Args:
+            pool_settings: プール名をキーとした {"workers": int, "max_queued": int} の辞書
+            slow_call_ms: この時間を超えた呼び出しを警告ログに出力する閾値（ミリ秒）
+        """
+        pool_settings = pool_settings or DEFAULT_POOL_SETTINGS
+        self.slow_call_ms = slow_call_ms
+        self.pools = {}
+        self.limits = {}
+        self.stats = {}
+        for name, settings in pool_settings.items():
+            workers = settings.get("workers", 4)
+            self.pools[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-pool")
+            # 実行中 + 待機中の上限（これを超えると呼び出し側が await で待たされる）
+            self.limits[name] = workers + settings.get("max_queued", workers * 4)
+            self.stats[name] = PoolStats(name)
+        # セマフォはイベントループ上で遅延生成する
+        self._semaphores = {}
+        self._closed = False
+
+    def _get_semaphore(self, pool):
+        """プールごとのセマフォを取得（初回呼び出し時に生成）"""
+        if pool not in self._semaphores:
+            self._semaphores[pool] = asyncio.Semaphore(self.limits[pool])
+        return self._semaphores[pool]
+
+    async def run(self, pool, func, *args, **kwargs):
+        """
+        指定したプールで同期関数を実行し、結果を返す
+
+        Args:
+            pool: プール名（"network" または "disk"）
+            func: 実行する同期関数
+            *args, **kwargs: 関数に渡す引数
+
+        Returns:
+            関数の戻り値
+        """
+        if pool not in self.pools:
+            raise ValueError(f"未知のスレッドプールです: {pool}")
+        if self._closed:
+            raise RuntimeError("スレッドプールは既にシャットダウンされています")
+
+        stats = self.stats[pool]
+        call_name = getattr(func, "__qualname__", repr(func))
+        loop = asyncio.get_running_loop()
+
+        stats.submitted += 1
+        stats.waiting += 1
+        queued_at = time.monotonic()
+        acquired = False
+        try:
+            async with self._get_semaphore(pool):
+                acquired = True
+                stats.waiting -= 1
+                started_at = time.monotonic()
+                stats.total_wait += started_at - queued_at
+                stats.in_flight += 1
+                try:
+                    result = await loop.run_in_executor(
+                        self.pools[pool], functools.partial(func, *args, **kwargs)
+                    )
+                    stats.completed += 1
+                    return result
+                except BaseException:
+                    stats.failed += 1
+                    raise
+                finally:
+                    stats.in_flight -= 1
+                    elapsed = time.monotonic() - started_at
+                    stats.total_run += elapsed
+                    if elapsed > stats.max_run:
+                        stats.max_run = elapsed
+                        stats.slowest_call = call_name
+                    if elapsed * 1000 > self.slow_call_ms:
+                        logger.warning(f"[{pool}] {call_name} の実行に {elapsed * 1000:.0f}ms かかりました")
+        finally:
+            # セマフォ待ちの間にキャンセルされた場合は待機数を戻す
+            if not acquired:
+                stats.waiting -= 1
+
+    async def run_network(self, func, *args, **kwargs):
+        """ネットワークI/Oを伴う同期関数を実行"""
+        return await self.run("network", func, *args, **kwargs)
+
+    async def run_disk(self, func, *args, **kwargs):
+        """ディスクI/Oを伴う同期関数を実行"""
+        return await self.run("disk", func, *args, **kwargs)
+
+    def get_stats(self):
+        """全プールの統計情報を取得"""
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
+
+    def shutdown(self, wait=True):
+        """全プールをシャットダウン"""
+        self._closed = True
+        for name, pool in self.pools.items():
+            pool.shutdown(wait=wait)
+            logger.info(f"スレッドプール '{name}' をシャットダウンしました: {self.stats[name].to_dict()}")
+
+class LoopLagMonitor:
+    """イベントループのブロッキングを検出して報告するモニター"""
+
+    def __init__(self, threshold_ms=100, interval=0.25):
+        """
+        初期化
+
+        Args:
+            threshold_ms: ループが停止したとみなす閾値（ミリ秒）
+            interval: ハートビートの間隔（秒）
+        """
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self._last_beat = None
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stop_event = threading.Event()
+
+    def start(self, loop=None):
+        """モニターを開始（イベントループ上で呼び出す）"""
+        loop = loop or asyncio.get_running_loop()
+        # asyncioのデバッグモード時は、遅いコールバックを直接ログに出す
+        loop.slow_callback_duration = self.threshold
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"イベントループ監視を開始しました（閾値: {self.threshold * 1000:.0f}ms）")
+
+    def stop(self):
+        """モニターを停止"""
+        self._stop_event.set()
+        if self._task and not self._task.done():
+            self._task.cancel()
+        logger.info(f"イベントループ監視を停止しました: {self.get_stats()}")
+
+    async def _heartbeat(self):
+        """ループ上で定期的にハートビートを更新し、遅延を計測"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - expected
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self._last_beat = now
+
+    def _watch(self):
+        """別スレッドでハートビートを監視し、停止中のループのスタックを記録"""
+        reported_beat = None
+        while not self._stop_event.wait(self.interval / 2):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat - self.interval
+            if stalled > self.threshold and reported_beat != last_beat:
+                reported_beat = last_beat
+                self.stall_count += 1
+                frame = sys._current_frames().get(self._loop_thread_id)
+                stack = "".join(traceback.format_stack(frame, limit=8)) if frame else "（スタック取得不可）"
+                logger.warning(
+                    f"イベントループが {stalled * 1000:.0f}ms 以上ブロックされています。実行中の処理:\n{stack}"
+                )
+
+    def get_stats(self):
+        """監視結果の統計を取得"""
+        return {
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stall_count": self.stall_count,
+        }
+
+_executor = None
+
+def get_executor():
+    """プロセス共通のExecutorManagerを取得"""
+    global _executor
+    if _executor is None:
+        performance = config.get_email_settings().get("performance", {})
+        pool_settings = {}
+        for name, defaults in DEFAULT_POOL_SETTINGS.items():
+            pool_settings[name] = {
+                "workers": performance.get(f"{name}_workers", defaults["workers"]),
+                "max_queued": performance.get(f"{name}_max_queued", defaults["max_queued"]),
+            }
+        _executor = ExecutorManager(pool_settings, slow_call_ms=performance.get("slow_call_ms", 1000))
+    return _executor
+
+async def run_network(func, *args, **kwargs):
+    """共通プールでネットワークI/Oを伴う同期関数を実行"""
+    return await get_executor().run_network(func, *args, **kwargs)
+
+async def run_disk(func, *args, **kwargs):
+    """共通プールでディスクI/Oを伴う同期関数を実行"""
+    return await get_executor().run_disk(func, *args, **kwargs)
@@ -0,0 +1,244 @@
+import json
+import os
+import re
+import socket
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+from ..config import config
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+LEASED = "leased"
+DONE = "done"
+
+class LeaseStore:
+    """複数のワーカープロセス間でメールの処理権（リース）を管理するSQLiteストア
+
+    同じメールボックス群を複数プロセスで監視する場合に、メールごとにリースを取得した
+    ワーカーだけが処理する。リースには有効期限があり、ワーカーが停止して更新が
+    途絶えたリースは他のワーカーが引き継ぐ。排他制御はSQLiteのファイルロックに任せる。
+    """
+
+    def __init__(self, db_file=None, worker_id=None, ttl=300, done_retention_days=7):
+        """
+        初期化
+
+        Args:
+            db_file: SQLiteファイルのパス。指定しない場合はデータディレクトリを使用
+            worker_id: このワーカーの識別子。指定しない場合はホスト名・PID・乱数から生成
+            ttl: リースの有効期限（秒）
+            done_retention_days: 処理済みレコードを残す日数（purge_done で削除する）
+        """
+        self.db_file = Path(db_file) if db_file else config.DATA_DIR / "leases.sqlite3"
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.ttl = ttl
+        self.done_retention = done_retention_days * 86400
+        self._initialize()
+        logger.info(f"リースストアを初期化しました: {self.db_file}（ワーカーID: {self.worker_id}）")
+
+    def worker_file(self, filename):
+        """データディレクトリ内のワーカーごとの状態ファイルのパス（例: batch_jobs.json → batch_jobs_<ワーカーID>.json）
+
+        同じデータディレクトリを共有する他のワーカーと、ファイル全体の上書きで状態を消し合わないようにする。
+        """
+        name = Path(filename)
+        worker = re.sub(r'[^A-Za-z0-9_.-]', '_', self.worker_id)
+        return config.DATA_DIR / f"{name.stem}_{worker}{name.suffix}"
+
+    def _connect(self):
+        """接続を作成（スレッドをまたいで共有しないよう操作ごとに接続する）"""
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _initialize(self):
+        """テーブルを作成"""
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    mailbox TEXT NOT NULL,
+                    email_id TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    payload TEXT,
+                    PRIMARY KEY (mailbox, email_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_leases_status_expires ON leases (status, expires_at)")
+        finally:
+            conn.close()
+
+    def try_claim(self, mailbox, email_id, payload=None):
+        """
+        メールのリースを取得
+
+        Args:
+            mailbox: メールボックス名
+            email_id: メールID
+            payload: 引き継ぎ時にメールを再取得するための情報（JSONに変換可能な辞書）
+
+        Returns:
+            リースを取得できた場合はTrue（他のワーカーが処理中・処理済みの場合はFalse）
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT owner, status, expires_at FROM leases WHERE mailbox = ? AND email_id = ?",
+                (mailbox, email_id)
+            ).fetchone()
+
+            if row is None:
+                conn.execute(
+                    "INSERT INTO leases (mailbox, email_id, owner, status, expires_at, updated_at, payload) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (mailbox, email_id, self.worker_id, LEASED, now + self.ttl, now, json.dumps(payload or {}, ensure_ascii=False))
+                )
+                conn.execute("COMMIT")
+                return True
+
+            owner, status, expires_at = row
+            if status == DONE or (owner != self.worker_id and expires_at > now):
+                conn.execute("ROLLBACK")
+                return False
+
+            conn.execute(
+                "UPDATE leases SET owner = ?, status = ?, expires_at = ?, updated_at = ? WHERE mailbox = ? AND email_id = ?",
+                (self.worker_id, LEASED, now + self.ttl, now, mailbox, email_id)
+            )
+            conn.execute("COMMIT")
+            if owner != self.worker_id:
+                logger.info(f"期限切れのリースを引き継ぎました: {mailbox}/{email_id}（前の所有者: {owner}）")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim_expired(self, limit=10):
+        """
+        期限切れのリースをまとめて引き継ぐ
+
+        Returns:
+            引き継いだリースの payload のリスト（mailbox と email_id を含む）
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT mailbox, email_id, owner, payload FROM leases WHERE status = ? AND expires_at <= ? AND owner != ? LIMIT ?",
+                (LEASED, now, self.worker_id, limit)
+            ).fetchall()
+            claimed = []
+            for mailbox, email_id, owner, payload in rows:
+                conn.execute(
+                    "UPDATE leases SET owner = ?, expires_at = ?, updated_at = ? WHERE mailbox = ? AND email_id = ?",
+                    (self.worker_id, now + self.ttl, now, mailbox, email_id)
+                )
+                data = json.loads(payload) if payload else {}
+                data.update({"mailbox": mailbox, "email_id": email_id})
+                claimed.append(data)
+                logger.info(f"停止したワーカー {owner} のリースを引き継ぎました: {mailbox}/{email_id}")
+            conn.execute("COMMIT")
+            return claimed
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def update_payload(self, mailbox, email_id, fields):
+        """このワーカーが保持しているリースの payload に値を追加・更新（引き継ぎ先に処理の進み具合を伝える）"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT payload FROM leases WHERE mailbox = ? AND email_id = ? AND owner = ?",
+                (mailbox, email_id, self.worker_id)
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            payload = json.loads(row[0]) if row[0] else {}
+            payload.update(fields)
+            conn.execute(
+                "UPDATE leases SET payload = ? WHERE mailbox = ? AND email_id = ?",
+                (json.dumps(payload, ensure_ascii=False), mailbox, email_id)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew(self):
+        """このワーカーが保持している処理中のリースをすべて延長し、延長した件数を返す"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE leases SET expires_at = ?, updated_at = ? WHERE owner = ? AND status = ?",
+                (now + self.ttl, now, self.worker_id, LEASED)
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def complete(self, mailbox, email_id):
+        """処理済みとして記録（以後どのワーカーも処理しない）"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE leases SET status = ?, updated_at = ? WHERE mailbox = ? AND email_id = ? AND owner = ?",
+                (DONE, now, mailbox, email_id, self.worker_id)
+            )
+        finally:
+            conn.close()
+
+    def release(self, mailbox, email_id):
+        """処理を終えずにリースを手放す（すぐに他のワーカーが引き継げるようにする）"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE leases SET expires_at = 0 WHERE mailbox = ? AND email_id = ? AND owner = ? AND status = ?",
+                (mailbox, email_id, self.worker_id, LEASED)
+            )
+        finally:
+            conn.close()
+
+    def purge_done(self, older_than=None):
+        """一定期間（指定しない場合は done_retention_days）より古い処理済みレコードを削除し、削除件数を返す"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM leases WHERE status = ? AND updated_at < ?",
+                (DONE, time.time() - (self.done_retention if older_than is None else older_than))
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+def create_lease_store():
+    """設定に従ってリースストアを作成（シャーディングが無効の場合はNone）"""
+    sharding = config.get_email_settings().get("sharding", {})
+    if not sharding.get("enabled", False):
+        return None
+    db_file = config.DATA_DIR / sharding["lease_store"] if sharding.get("lease_store") else None
+    return LeaseStore(
+        db_file=db_file,
+        worker_id=sharding.get("worker_id"),
+        ttl=sharding.get("lease_ttl_seconds", 300),
+        done_retention_days=sharding.get("done_retention_days", 7)
+    )
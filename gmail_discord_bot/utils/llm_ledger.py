@@ -0,0 +1,340 @@
+import argparse
+import contextvars
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+
+from ..config import config
+from .logger import setup_logger
+from .executor import run_disk
+
+logger = setup_logger(__name__)
+
+# 処理中のメール（メールIDと送信者）。メール処理のタスクごとに設定し、その中のLLM呼び出しに記録する
+_call_context = contextvars.ContextVar("llm_call_context", default={})
+# 1回のLLM呼び出しで送ったHTTPリクエスト数（SDK内部のリトライを数えるため）
+_http_attempts = contextvars.ContextVar("llm_http_attempts", default=None)
+
+# レポートの集計単位
+GROUP_COLUMNS = {
+    "day": "day",
+    "provider": "provider",
+    "model": "model",
+    "route": "route",
+    "stage": "stage",
+    "sender": "sender",
+}
+
+def set_call_context(email_id=None, sender=None):
+    """以降のLLM呼び出しに記録するメールIDと送信者を設定（現在のタスク内でのみ有効）"""
+    _call_context.set({"email_id": email_id, "sender": sender})
+
+def count_http_attempt():
+    """HTTPリクエストを1回送ったことを記録（LLM呼び出しの計測中のみ）"""
+    attempts = _http_attempts.get()
+    if attempts is not None:
+        attempts[0] += 1
+
+def _percentile(values, percentile):
+    """パーセンタイル（最近傍法）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+class LLMCall:
+    """1回のLLM呼び出しの計測（async with で使い、終了時に台帳へ記録する）"""
+
+    def __init__(self, ledger, provider, stage, route, model):
+        self.ledger = ledger
+        self.entry = {
+            "provider": provider, "stage": stage, "route": route, "model": model,
+            "input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0,
+            "cost": 0.0,
+        }
+        self._attempts = [0]
+        self._token = None
+        self._started = None
+
+    def set_usage(self, input_tokens=0, output_tokens=0, cache_read_tokens=0, cache_write_tokens=0, cost=0.0):
+        """応答のトークン数とコストを設定"""
+        self.entry.update(
+            input_tokens=input_tokens, output_tokens=output_tokens,
+            cache_read_tokens=cache_read_tokens, cache_write_tokens=cache_write_tokens, cost=cost
+        )
+
+    async def __aenter__(self):
+        self._token = _http_attempts.set(self._attempts)
+        self._started = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        latency = time.monotonic() - self._started
+        _http_attempts.reset(self._token)
+        if exc_type is None:
+            outcome, error = "ok", None
+        elif exc_type.__name__ in ("CancelledError", "TimeoutError"):
+            outcome, error = "cancelled" if exc_type.__name__ == "CancelledError" else "timeout", None
+        else:
+            outcome, error = "error", f"{exc_type.__name__}: {exc}"[:500]
+        if self.ledger:
+            await self.ledger.record(
+                **self.entry, latency=latency, retries=max(0, self._attempts[0] - 1),
+                outcome=outcome, error=error
+            )
+        return False
+
+class LLMLedger:
+    """LLM呼び出しの台帳（SQLite）
+
+    呼び出しごとにプロバイダー・モデル・ルート・ステージ・メールID・送信者・トークン数・
+    レイテンシ・リトライ回数・結果・コストを記録し、日・ルート・ステージなどの単位で
+    レイテンシのパーセンタイル・スループット・コストを集計する。
+    """
+
+    def __init__(self, db_file=None, retention_days=90):
+        """
+        初期化
+
+        Args:
+            db_file: SQLiteファイルのパス。指定しない場合はデータディレクトリを使用
+            retention_days: 記録を残す日数
+        """
+        self.db_file = Path(db_file) if db_file else config.DATA_DIR / "llm_ledger.sqlite3"
+        self.retention_days = retention_days
+        self._initialize()
+
+    def _connect(self):
+        """接続を作成（スレッドプールから呼ばれるため操作ごとに接続する）"""
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _initialize(self):
+        """テーブルを作成"""
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    day TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    route TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    email_id TEXT,
+                    sender TEXT,
+                    input_tokens INTEGER NOT NULL DEFAULT 0,
+                    output_tokens INTEGER NOT NULL DEFAULT 0,
+                    cache_read_tokens INTEGER NOT NULL DEFAULT 0,
+                    cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+                    latency REAL NOT NULL,
+                    retries INTEGER NOT NULL DEFAULT 0,
+                    outcome TEXT NOT NULL,
+                    error TEXT,
+                    cost REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_created_at ON llm_calls (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_email_id ON llm_calls (email_id)")
+        finally:
+            conn.close()
+
+    def call(self, provider, stage, route, model):
+        """LLM呼び出しの計測を開始（async with で使用）"""
+        return LLMCall(self, provider, stage, route, model)
+
+    def record_sync(self, provider, model, route, stage, latency, outcome, email_id=None, sender=None,
+                    input_tokens=0, output_tokens=0, cache_read_tokens=0, cache_write_tokens=0,
+                    retries=0, error=None, cost=0.0):
+        """1回の呼び出しを記録"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                INSERT INTO llm_calls (
+                    created_at, day, provider, model, route, stage, email_id, sender,
+                    input_tokens, output_tokens, cache_read_tokens, cache_write_tokens,
+                    latency, retries, outcome, error, cost
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    now, datetime.fromtimestamp(now).strftime("%Y-%m-%d"), provider, model, route, stage,
+                    email_id, sender, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens,
+                    latency, retries, outcome, error, cost
+                )
+            )
+        finally:
+            conn.close()
+
+    async def record(self, **entry):
+        """呼び出しを記録（ディスク用プールで実行。メールID・送信者は処理中のメールから補う）"""
+        context = _call_context.get()
+        entry.setdefault("email_id", context.get("email_id"))
+        entry.setdefault("sender", context.get("sender"))
+        try:
+            await run_disk(self.record_sync, **entry)
+        except Exception as e:
+            logger.error(f"LLM呼び出しの記録に失敗しました: {e}")
+
+    def purge_sync(self):
+        """保存期間を過ぎた記録を削除"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM llm_calls WHERE created_at < ?", (time.time() - self.retention_days * 86400,)
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def report(self, days=7, group_by=("day", "route", "stage")):
+        """
+        呼び出しを集計
+
+        Args:
+            days: 集計対象の日数
+            group_by: 集計単位（day / provider / model / route / stage / sender）
+
+        Returns:
+            集計結果の辞書のリスト（呼び出し数・エラー数・p50/p95レイテンシ・スループット・トークン数・コスト）
+        """
+        columns = [GROUP_COLUMNS[name] for name in group_by]
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"""
+                SELECT {", ".join(columns)}, created_at, latency, outcome, retries,
+                       input_tokens, output_tokens, cache_read_tokens, cost
+                FROM llm_calls WHERE created_at >= ? ORDER BY created_at
+                """,
+                (time.time() - days * 86400,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        groups = {}
+        for row in rows:
+            key = tuple(value if value is not None else "-" for value in row[:len(columns)])
+            created_at, latency, outcome, retries, input_tokens, output_tokens, cache_read_tokens, cost = row[len(columns):]
+            group = groups.setdefault(key, {
+                "latencies": [], "first": created_at, "last": created_at, "calls": 0, "errors": 0, "cached": 0,
+                "retries": 0, "input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cost": 0.0
+            })
+            group["calls"] += 1
+            group["last"] = created_at
+            group["retries"] += retries
+            group["input_tokens"] += input_tokens
+            group["output_tokens"] += output_tokens
+            group["cache_read_tokens"] += cache_read_tokens
+            group["cost"] += cost
+            if outcome == "cached":
+                group["cached"] += 1
+            elif outcome == "ok":
+                group["latencies"].append(latency)
+            else:
+                group["errors"] += 1
+
+        report = []
+        for key, group in sorted(groups.items()):
+            latencies = group["latencies"]
+            p50 = _percentile(latencies, 50)
+            p95 = _percentile(latencies, 95)
+            span_hours = max(1.0, (group["last"] - group["first"]) / 3600)
+            report.append({
+                **dict(zip(group_by, key)),
+                "calls": group["calls"],
+                "errors": group["errors"],
+                "cached": group["cached"],
+                "retries": group["retries"],
+                "p50_seconds": round(p50, 2) if p50 is not None else None,
+                "p95_seconds": round(p95, 2) if p95 is not None else None,
+                "calls_per_hour": round(group["calls"] / span_hours, 1),
+                "output_tokens_per_second": round(group["output_tokens"] / sum(latencies), 1) if latencies and sum(latencies) else None,
+                "input_tokens": group["input_tokens"],
+                "output_tokens": group["output_tokens"],
+                "cache_read_tokens": group["cache_read_tokens"],
+                "cost_usd": round(group["cost"], 4),
+            })
+        return report
+
+class _NullCall:
+    """台帳が無効な場合の計測（何も記録しない）"""
+
+    def set_usage(self, **usage):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+_ledger = None
+_ledger_loaded = False
+
+def get_llm_ledger():
+    """設定に従ってプロセス共通のLLM呼び出し台帳を取得（無効の場合はNone）"""
+    global _ledger, _ledger_loaded
+    if not _ledger_loaded:
+        _ledger_loaded = True
+        settings = config.get_email_settings().get("ledger", {})
+        if settings.get("enabled", True):
+            try:
+                _ledger = LLMLedger(retention_days=settings.get("retention_days", 90))
+                purged = _ledger.purge_sync()
+                if purged:
+                    logger.info(f"保存期間を過ぎたLLM呼び出しの記録を{purged}件削除しました")
+            except Exception as e:
+                logger.error(f"LLM呼び出し台帳の初期化に失敗しました: {e}")
+                _ledger = None
+    return _ledger
+
+def track_llm_call(provider, stage, route, model):
+    """LLM呼び出しを計測して台帳に記録（台帳が無効な場合は何もしない）"""
+    ledger = get_llm_ledger()
+    if ledger is None:
+        return _NullCall()
+    return ledger.call(provider, stage, route, model)
+
+async def record_cached_call(provider, stage, route, model):
+    """応答キャッシュから返した呼び出しを記録（APIは呼び出していないためトークン数・コストは0）"""
+    ledger = get_llm_ledger()
+    if ledger is not None:
+        await ledger.record(
+            provider=provider, model=model, route=route, stage=stage, latency=0.0, outcome="cached"
+        )
+
+def _format_table(rows):
+    """集計結果を表形式の文字列に変換"""
+    if not rows:
+        return "記録がありません"
+    headers = list(rows[0].keys())
+    cells = [[("-" if row[h] is None else str(row[h])) for h in headers] for row in rows]
+    widths = [max(len(h), *(len(cell[i]) for cell in cells)) for i, h in enumerate(headers)]
+    lines = ["  ".join(h.ljust(w) for h, w in zip(headers, widths))]
+    lines.append("  ".join("-" * w for w in widths))
+    lines.extend("  ".join(cell.ljust(w) for cell, w in zip(row, widths)) for row in cells)
+    return "\n".join(lines)
+
+def main(argv=None):
+    """LLM呼び出しの集計レポートを表示
+
+    例: python -m gmail_discord_bot.utils.llm_ledger --days 7 --by day stage
+    """
+    parser = argparse.ArgumentParser(description="LLM呼び出しのレイテンシ・トークン数・コストを集計します")
+    parser.add_argument("--days", type=int, default=7, help="集計対象の日数（既定: 7）")
+    parser.add_argument("--by", nargs="+", default=["day", "route", "stage"], choices=list(GROUP_COLUMNS),
+                        help="集計単位（既定: day route stage）")
+    parser.add_argument("--db", help="台帳のSQLiteファイル（既定: データディレクトリの llm_ledger.sqlite3）")
+    args = parser.parse_args(argv)
+
+    ledger = LLMLedger(db_file=args.db)
+    print(_format_table(ledger.report(days=args.days, group_by=args.by)))
+
+if __name__ == "__main__":
+    main()
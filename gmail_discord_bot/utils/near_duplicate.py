@@ -0,0 +1,254 @@
+import hashlib
+import json
+import re
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+
+from ..config import config
+from .logger import setup_logger
+from .executor import run_disk
+
+logger = setup_logger(__name__)
+
+SIMHASH_BITS = 64
+# シグネチャを8ビットずつ8つに分けて索引を作る（ハミング距離7以下なら少なくとも1つが一致する）
+BAND_COUNT = 8
+BAND_BITS = SIMHASH_BITS // BAND_COUNT
+BAND_MASK = (1 << BAND_BITS) - 1
+
+URL_PATTERN = re.compile(r'https?://\S+')
+QUOTE_LINE_PATTERN = re.compile(r'^\s*>.*$', re.MULTILINE)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+# 日付・時刻・金額・数量などの数字（正規化で全角数字も半角になる）
+NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)*')
+
+def normalize_body(body):
+    """類似判定用に本文を正規化（全角・半角の統一、小文字化、引用行とURLの除去、空白の圧縮）"""
+    text = unicodedata.normalize("NFKC", body or "").lower()
+    text = QUOTE_LINE_PATTERN.sub(" ", text)
+    text = URL_PATTERN.sub(" ", text)
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+def extract_facts(text):
+    """正規化した本文に含まれる数字の一覧（日付・金額だけが違う定型文を区別するため）"""
+    return sorted(set(NUMBER_PATTERN.findall(text)))
+
+def simhash(text, ngram=3):
+    """文字 n-gram の SimHash（64ビット）を計算（日本語は単語に区切らず文字単位で扱う）"""
+    weights = [0] * SIMHASH_BITS
+    if len(text) < ngram:
+        shingles = [text] if text else []
+    else:
+        shingles = (text[index:index + ngram] for index in range(len(text) - ngram + 1))
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+def _to_signed(value):
+    """SQLiteの INTEGER（符号付き64ビット）に収まるように変換"""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+def _to_unsigned(value):
+    return value + (1 << SIMHASH_BITS) if value < 0 else value
+
+def _bands(signature):
+    return [signature >> (BAND_BITS * index) & BAND_MASK for index in range(BAND_COUNT)]
+
+class DuplicateMatch:
+    """類似した過去のメールとその分析結果・返信案"""
+
+    def __init__(self, email_id, distance, analysis_result, responses, address, created_at):
+        self.email_id = email_id
+        self.distance = distance
+        self.analysis_result = analysis_result
+        self.responses = responses
+        self.address = address
+        self.created_at = created_at
+
+    def responses_for(self, address):
+        """返信案の宛名を今回のメールの宛名に置き換えて返す"""
+        if not self.address or not address or self.address == address:
+            return list(self.responses)
+        return [response.replace(self.address, address) for response in self.responses]
+
+class NearDuplicateIndex:
+    """メール本文の SimHash による類似メールの索引（SQLite）
+
+    返信案を作成したメールの本文のシグネチャと分析結果・返信案を、ルート（メールボックスと
+    通知先チャンネル）ごとに保存する。新しいメールと同じルートの直近のメールのうち、
+    シグネチャのハミング距離が閾値以下のものがあれば、その分析結果と返信案を再利用できる。
+    定型の問い合わせは日付や金額だけが違っても距離が小さくなるため、本文に含まれる数字が
+    一致しない場合は類似とみなさない。
+    """
+
+    def __init__(self, db_file=None, threshold=6, max_age_days=30, min_chars=50):
+        """
+        初期化
+
+        Args:
+            db_file: SQLiteファイルのパス。指定しない場合はデータディレクトリを使用
+            threshold: 類似とみなすハミング距離の上限（64ビット中）
+            max_age_days: 再利用の対象とする過去のメールの日数（これより古いものは削除する）
+            min_chars: 正規化後の本文がこれより短いメールは対象外（短文は誤判定しやすいため）
+        """
+        self.db_file = Path(db_file) if db_file else config.DATA_DIR / "near_duplicates.sqlite3"
+        self.threshold = threshold
+        self.max_age = max_age_days * 86400
+        self.min_chars = min_chars
+        self.lookups = 0
+        self.matches = 0
+        self.fact_mismatches = 0
+        self._initialize()
+
+    def _connect(self):
+        """接続を作成（スレッドプールから呼ばれるため操作ごとに接続する）"""
+        return sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+
+    def _initialize(self):
+        """テーブルを作成"""
+        conn = self._connect()
+        try:
+            band_columns = ",\n                    ".join(f"band{index} INTEGER NOT NULL" for index in range(BAND_COUNT))
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS signatures (
+                    email_id TEXT PRIMARY KEY,
+                    route TEXT NOT NULL,
+                    signature INTEGER NOT NULL,
+                    {band_columns},
+                    address TEXT,
+                    facts TEXT,
+                    analysis_result TEXT NOT NULL,
+                    responses TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            for index in range(BAND_COUNT):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_signatures_band{index} ON signatures (route, band{index})")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_signatures_created_at ON signatures (created_at)")
+            # 数字の一覧を保存していなかった索引には列を追加する（既存の行は照合できないため再利用しない）
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(signatures)")]
+            if "facts" not in columns:
+                conn.execute("ALTER TABLE signatures ADD COLUMN facts TEXT")
+        finally:
+            conn.close()
+
+    def signature(self, body):
+        """本文のシグネチャと数字の一覧（短すぎる本文の場合は (None, None)）"""
+        text = normalize_body(body)
+        if len(text) < self.min_chars:
+            return None, None
+        return simhash(text), extract_facts(text)
+
+    def find_sync(self, route, body):
+        """同じルートの直近のメールから最も類似したものを探す（見つからない場合はNone）"""
+        signature, facts = self.signature(body)
+        if signature is None:
+            return None
+        self.lookups += 1
+        facts_json = json.dumps(facts)
+
+        conn = self._connect()
+        try:
+            columns = "email_id, signature, facts, analysis_result, responses, address, created_at"
+            since = time.time() - self.max_age
+            if self.threshold < BAND_COUNT:
+                # 閾値がバンド数未満なら、いずれかのバンドが一致するものだけを候補にすればよい
+                bands = _bands(signature)
+                conditions = " OR ".join(f"band{index} = ?" for index in range(BAND_COUNT))
+                rows = conn.execute(
+                    f"SELECT {columns} FROM signatures WHERE route = ? AND created_at >= ? AND ({conditions})",
+                    (route, since, *bands)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f"SELECT {columns} FROM signatures WHERE route = ? AND created_at >= ?", (route, since)
+                ).fetchall()
+        finally:
+            conn.close()
+
+        best = None
+        for email_id, stored, stored_facts, analysis_result, responses, address, created_at in rows:
+            distance = hamming_distance(signature, _to_unsigned(stored))
+            if distance > self.threshold:
+                continue
+            if stored_facts != facts_json:
+                # 本文はほぼ同じでも日付・金額などが違うメールの返信案は使えない
+                self.fact_mismatches += 1
+                continue
+            if best is None or (distance, -created_at) < (best[0], -best[5]):
+                best = (distance, email_id, analysis_result, responses, address, created_at)
+        if best is None:
+            return None
+
+        self.matches += 1
+        distance, email_id, analysis_result, responses, address, created_at = best
+        return DuplicateMatch(email_id, distance, json.loads(analysis_result), json.loads(responses), address, created_at)
+
+    def add_sync(self, route, email_id, body, analysis_result, responses, address=None):
+        """返信案を作成したメールを索引に追加し、保存期間を過ぎたものを削除"""
+        signature, facts = self.signature(body)
+        if signature is None or not responses:
+            return False
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO signatures (
+                    email_id, route, signature, {", ".join(f"band{index}" for index in range(BAND_COUNT))},
+                    address, facts, analysis_result, responses, created_at
+                ) VALUES ({", ".join("?" * (BAND_COUNT + 8))})
+                """,
+                (
+                    email_id, route, _to_signed(signature), *_bands(signature), address, json.dumps(facts),
+                    json.dumps(analysis_result, ensure_ascii=False), json.dumps(responses, ensure_ascii=False),
+                    time.time()
+                )
+            )
+            conn.execute("DELETE FROM signatures WHERE created_at < ?", (time.time() - self.max_age,))
+        finally:
+            conn.close()
+        return True
+
+    async def find(self, route, body):
+        """類似した過去のメールを探す（ディスク用プールで実行）"""
+        try:
+            return await run_disk(self.find_sync, route, body)
+        except Exception as e:
+            logger.error(f"類似メールの検索エラー: {e}")
+            return None
+
+    async def add(self, route, email_id, body, analysis_result, responses, address=None):
+        """メールを索引に追加（ディスク用プールで実行）"""
+        try:
+            return await run_disk(self.add_sync, route, email_id, body, analysis_result, responses, address)
+        except Exception as e:
+            logger.error(f"類似メール索引への追加エラー: {e}")
+            return False
+
+    def get_stats(self):
+        """検索数と再利用できた数（数字の違いで対象外にした候補の数を含む）"""
+        return {
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "fact_mismatches": self.fact_mismatches,
+            "match_rate": round(self.matches / self.lookups, 3) if self.lookups else 0.0,
+        }
+
+def create_near_duplicate_index():
+    """設定に従って類似メールの索引を作成（無効の場合はNone）"""
+    settings = config.get_email_settings().get("near_duplicates", {})
+    if not settings.get("enabled", False):
+        return None
+    return NearDuplicateIndex(
+        db_file=config.DATA_DIR / settings["file"] if settings.get("file") else None,
+        threshold=settings.get("threshold_bits", 6),
+        max_age_days=settings.get("max_age_days", 30),
+        min_chars=settings.get("min_body_chars", 50)
+    )
@@ -51,8 +51,7 @@ class OutputSaver:
         content += json.dumps(analysis_result, ensure_ascii=False, indent=2)
         
         # ファイルに保存
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
+        self._write_file(filepath, content)
         
         return filepath
     
@@ -99,8 +98,7 @@ class OutputSaver:
             content += f"{response}\n\n"
         
         # ファイルに保存
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
+        self._write_file(filepath, content)
         
         return filepath
     
@@ -136,11 +134,23 @@ class OutputSaver:
                 content += f"- {attachment.get('filename', 'Unknown')}\n"
         
         # ファイルに保存
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
+        self._write_file(filepath, content)
         
         return filepath
     
+    def _write_file(self, filepath, content):
+        """
+        一時ファイルに書き込んでから置き換える（停止時に書きかけのファイルを残さない）
+        
+        Args:
+            filepath: 保存先のパス
+            content: 書き込む内容
+        """
+        tmp_path = filepath.with_name(filepath.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, filepath)
+    
     def get_output_files(self, email_id=None, provider=None, output_type=None):
         """
         保存されたファイルの一覧を取得
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+class ReadinessState:
+    """起動時の各コンポーネントの準備状態をまとめて管理するクラス
+
+    必須コンポーネントがすべて準備完了になった時点でアプリケーション全体を
+    準備完了とみなす。任意コンポーネントの失敗は記録のみ行い、起動は止めない。
+    """
+
+    def __init__(self, required=None, optional=None):
+        """
+        初期化
+
+        Args:
+            required: 準備完了が必須のコンポーネント名のリスト
+            optional: 失敗しても起動を続けるコンポーネント名のリスト
+        """
+        self.required = list(required or [])
+        self.optional = list(optional or [])
+        self.started_at = time.monotonic()
+        self.components = {
+            name: {"status": PENDING, "seconds": None, "error": None}
+            for name in self.required + self.optional
+        }
+        self._ready_event = asyncio.Event()
+        self._failed_event = asyncio.Event()
+
+    def mark_ready(self, name):
+        """コンポーネントを準備完了にする"""
+        component = self.components[name]
+        component["status"] = READY
+        component["seconds"] = round(time.monotonic() - self.started_at, 2)
+        logger.info(f"起動準備: {name} が完了しました（{component['seconds']}秒）")
+        if all(self.components[required]["status"] == READY for required in self.required):
+            self._ready_event.set()
+
+    def mark_failed(self, name, error):
+        """コンポーネントの準備失敗を記録"""
+        component = self.components[name]
+        component["status"] = FAILED
+        component["seconds"] = round(time.monotonic() - self.started_at, 2)
+        component["error"] = str(error)
+        if name in self.required:
+            logger.error(f"起動準備: 必須コンポーネント {name} の準備に失敗しました: {error}")
+            self._failed_event.set()
+        else:
+            logger.warning(f"起動準備: {name} の準備に失敗しました（起動は継続します）: {error}")
+
+    async def track(self, name, coro):
+        """コルーチンを実行し、結果に応じて準備状態を更新"""
+        try:
+            await coro
+            self.mark_ready(name)
+        except Exception as e:
+            self.mark_failed(name, e)
+
+    @property
+    def is_ready(self):
+        return self._ready_event.is_set()
+
+    async def wait(self, timeout=None):
+        """
+        必須コンポーネントの準備完了を待つ
+
+        Returns:
+            準備完了ならTrue、失敗またはタイムアウトならFalse
+        """
+        ready_task = asyncio.ensure_future(self._ready_event.wait())
+        failed_task = asyncio.ensure_future(self._failed_event.wait())
+        try:
+            await asyncio.wait([ready_task, failed_task], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ready_task.cancel()
+            failed_task.cancel()
+        return self.is_ready
+
+    def status(self):
+        """各コンポーネントの状態を辞書形式で返す"""
+        return {"ready": self.is_ready, "components": dict(self.components)}
@@ -0,0 +1,159 @@
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+
+from ..config import config
+from .logger import setup_logger
+from .executor import run_disk
+
+logger = setup_logger(__name__)
+
+class ResponseCache:
+    """LLMの応答をプロンプトの内容ハッシュで保存するディスクキャッシュ
+
+    キーはプロバイダー・モデル・システムプロンプトのハッシュ・ユーザープロンプトのハッシュと
+    サンプリングの設定（温度・最大出力トークン数・候補の番号）から作成する。
+    有効期限（TTL）を過ぎたエントリは使わず、合計サイズが上限を超えた場合は
+    最後に参照された時刻が古いものから削除する（LRU）。
+    """
+
+    def __init__(self, db_file=None, ttl=86400, max_bytes=50 * 1024 * 1024):
+        """
+        初期化
+
+        Args:
+            db_file: SQLiteファイルのパス。指定しない場合はデータディレクトリを使用
+            ttl: エントリの有効期限（秒）
+            max_bytes: キャッシュ全体の最大サイズ（バイト）
+        """
+        self.db_file = Path(db_file) if db_file else config.DATA_DIR / "response_cache.sqlite3"
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._initialize()
+
+    @staticmethod
+    def make_key(provider, model, system_prompt, user_prompt, temperature=None, max_tokens=None, variant=None):
+        """
+        キャッシュキーを作成
+
+        Args:
+            temperature: サンプリング温度（値が違えば別の応答として扱う）
+            max_tokens: 最大出力トークン数
+            variant: 同じリクエストから複数の応答を得る場合の番号（返信候補の番号など）
+        """
+        system_hash = hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+        user_hash = hashlib.sha256((user_prompt or "").encode("utf-8")).hexdigest()
+        return hashlib.sha256(
+            f"{provider}\0{model}\0{system_hash}\0{user_hash}\0{temperature}\0{max_tokens}\0{variant}".encode("utf-8")
+        ).hexdigest()
+
+    def _connect(self):
+        """接続を作成（スレッドプールから呼ばれるため操作ごとに接続する）"""
+        return sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+
+    def _initialize(self):
+        """テーブルを作成"""
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        finally:
+            conn.close()
+
+    def get_sync(self, key):
+        """キャッシュから応答を取得（見つからないか期限切れの場合はNone）"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if created_at + self.ttl <= now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.expired += 1
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+        finally:
+            conn.close()
+
+    def set_sync(self, key, value):
+        """応答をキャッシュに保存し、上限を超えた分を古い順に削除"""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                row = conn.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT 1").fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+                self.evictions += 1
+        finally:
+            conn.close()
+
+    async def get(self, key):
+        """キャッシュから応答を取得（ディスク用プールで実行）"""
+        try:
+            return await run_disk(self.get_sync, key)
+        except Exception as e:
+            logger.error(f"応答キャッシュの読み込みエラー: {e}")
+            return None
+
+    async def set(self, key, value):
+        """応答をキャッシュに保存（ディスク用プールで実行）"""
+        try:
+            await run_disk(self.set_sync, key, value)
+        except Exception as e:
+            logger.error(f"応答キャッシュの書き込みエラー: {e}")
+
+    def get_stats(self):
+        """ヒット率などの統計を取得"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+_response_cache = None
+
+def get_response_cache():
+    """設定に従ってプロセス共通の応答キャッシュを取得（無効の場合はNone）"""
+    global _response_cache
+    settings = config.get_email_settings().get("response_cache", {})
+    if not settings.get("enabled", True):
+        return None
+    if _response_cache is None:
+        db_file = config.DATA_DIR / settings["file"] if settings.get("file") else None
+        _response_cache = ResponseCache(
+            db_file=db_file,
+            ttl=settings.get("ttl_seconds", 86400),
+            max_bytes=settings.get("max_megabytes", 50) * 1024 * 1024
+        )
+    return _response_cache
@@ -0,0 +1,248 @@
+import re
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# LLMの出力で使うタグ（これ以外の "<...>" は本文の一部として扱う）
+KNOWN_TAGS = frozenset({"本文", "分析", "必要情報", "タイプ", "詳細", "日程候補", "候補", "返信", "要約"})
+# 中身をそのまま扱う要素（元のメール本文や返信・要約に "<タグ>" のような文字列が含まれていても解釈しない）
+RAW_TEXT_TAGS = frozenset({"本文", "返信", "要約"})
+# タグの候補（"<" から ">" まで）
+TAG_PATTERN = re.compile(r'<(/?)([^<>/\s]{1,16})>')
+# 末尾に届きかけのタグ（例: "</返"）
+TRAILING_TAG_PATTERN = re.compile(r'<[^<>]*$')
+# タグとして扱う最大の長さ（これを超えて ">" が届かない "<" は本文の一部とみなす）
+MAX_TAG_LENGTH = 20
+
+# 日程候補に時間範囲を補うための、メール本文中の日付と時間範囲のパターン
+DATE_TIME_RANGE_PATTERNS = (
+    re.compile(r'(\d{1,2}月\d{1,2}日).*?(\d{1,2}:\d{2})[-〜~](\d{1,2}:\d{2})'),  # 4月10日21:00〜23:00
+    re.compile(r'(\d{1,2}/\d{1,2}).*?(\d{1,2}:\d{2})[-〜~](\d{1,2}:\d{2})'),     # 4/10 21:00-23:00
+)
+TIME_RANGE_PATTERN = re.compile(r'\d{1,2}:\d{2}-\d{1,2}:\d{2}')
+DATE_PATTERN = re.compile(r'(\d{1,2}月\d{1,2}日|\d{1,2}/\d{1,2})')
+
+class TagElement:
+    """閉じた（または出力の終わりで打ち切られた）要素"""
+
+    def __init__(self, name, text, parents, closed=True):
+        self.name = name
+        self.text = text
+        self.parents = parents
+        self.closed = closed
+
+    def __repr__(self):
+        return f"TagElement({self.name!r}, closed={self.closed}, parents={self.parents})"
+
+class IncrementalTagParser:
+    """XMLタグ形式のLLM出力をチャンク単位で解析するパーサー
+
+    feed() で受け取ったチャンクを前回の続きから1回だけ走査し、閉じタグが届いた要素から順に
+    on_element に渡す。閉じタグのないタグ、対応しない閉じタグ、未知のタグは本文として扱い、
+    例外にはしない。close() を呼ぶと、出力の終わりまでに閉じなかった要素を closed=False で通知する。
+    """
+
+    def __init__(self, on_element=None):
+        self.on_element = on_element
+        self.buffer = ""
+        self.position = 0
+        self.stack = []
+        self.elements = []
+        self.started = {}
+        self.finished = False
+
+    def feed(self, chunk):
+        """
+        チャンクを追加して解析
+
+        Returns:
+            このチャンクで閉じた要素のリスト
+        """
+        if not chunk or self.finished:
+            return []
+        self.buffer += chunk
+        completed = []
+
+        while True:
+            start = self.buffer.find("<", self.position)
+            if start < 0:
+                self.position = len(self.buffer)
+                break
+            end = self.buffer.find(">", start, start + MAX_TAG_LENGTH)
+            if end < 0:
+                if len(self.buffer) < start + MAX_TAG_LENGTH:
+                    # タグの途中でチャンクが切れている場合は次のチャンクを待つ
+                    self.position = start
+                    break
+                self.position = start + 1
+                continue
+
+            match = TAG_PATTERN.fullmatch(self.buffer, start, end + 1)
+            self.position = start + 1
+            if not match or match.group(2) not in KNOWN_TAGS:
+                continue
+            self.position = end + 1
+            completed.extend(self._handle_tag(match.group(2), bool(match.group(1)), start, end + 1))
+
+        return completed
+
+    def _handle_tag(self, name, closing, start, end):
+        """タグを処理し、閉じた要素を返す"""
+        raw_parent = self.stack[-1][0] if self.stack and self.stack[-1][0] in RAW_TEXT_TAGS else None
+        if raw_parent and name != raw_parent:
+            # 本文・返信の中では同じ名前のタグ以外は解釈しない
+            return []
+
+        completed = []
+        if closing:
+            # 閉じていない内側の要素があればまとめて閉じる
+            for depth in range(len(self.stack) - 1, -1, -1):
+                if self.stack[depth][0] == name:
+                    while len(self.stack) > depth:
+                        completed.append(self._pop(start))
+                    break
+        else:
+            if raw_parent:
+                # 返信が閉じないまま次の返信が始まった場合は、前の返信をここで閉じる
+                completed.append(self._pop(start))
+            self.stack.append((name, end))
+            self.started[name] = self.started.get(name, 0) + 1
+        return completed
+
+    def _pop(self, end, closed=True):
+        name, content_start = self.stack.pop()
+        element = TagElement(name, self.buffer[content_start:end], [parent for parent, _ in self.stack], closed)
+        self._emit(element)
+        return element
+
+    def _emit(self, element):
+        self.elements.append(element)
+        if self.on_element:
+            try:
+                self.on_element(element)
+            except Exception as e:
+                logger.error(f"要素の通知エラー（{element.name}）: {e}")
+
+    def open_text(self, name):
+        """閉じていない要素のその時点までのテキスト（末尾の届きかけのタグは除く）"""
+        for open_name, content_start in reversed(self.stack):
+            if open_name == name:
+                return TRAILING_TAG_PATTERN.sub('', self.buffer[content_start:])
+        return None
+
+    def close(self):
+        """出力の終わりに閉じていない要素を打ち切りとして通知"""
+        completed = []
+        if not self.finished:
+            self.finished = True
+            while self.stack:
+                completed.append(self._pop(len(self.buffer), closed=False))
+        return completed
+
+    def find(self, name, parent=None, closed_only=False):
+        """名前（と親要素）が一致する要素をリストで取得"""
+        return [
+            element for element in self.elements
+            if element.name == name
+            and (parent is None or parent in element.parents)
+            and (element.closed or not closed_only)
+        ]
+
+class TaggedOutput:
+    """LLMの出力全体を1回だけ走査し、分析・必要情報・返信を取り出すクラス"""
+
+    def __init__(self, text):
+        self.text = text or ""
+        self.parser = IncrementalTagParser()
+        self.parser.feed(self.text)
+        self.parser.close()
+
+    @classmethod
+    def from_parser(cls, parser, text):
+        """ストリーミングで解析済みのパーサーから作成"""
+        output = cls.__new__(cls)
+        output.text = text or ""
+        output.parser = parser
+        parser.close()
+        return output
+
+    def _first(self, name, parent=None):
+        elements = self.parser.find(name, parent)
+        return elements[0].text.strip() if elements else None
+
+    @property
+    def analysis(self):
+        """分析結果（分析タグがない場合は出力全体）"""
+        analysis = self._first("分析")
+        return analysis if analysis is not None else self.text
+
+    @property
+    def summary(self):
+        """スレッドの要約（要約タグがない場合は出力全体）"""
+        summary = self._first("要約")
+        return summary if summary is not None else self.text.strip()
+
+    @property
+    def has_responses(self):
+        return self.parser.started.get("返信", 0) > 0
+
+    def responses(self):
+        """返信のリスト（返信タグがない場合は出力全体を1つの返信とする）"""
+        responses = [element.text.strip() for element in self.parser.find("返信", closed_only=True)]
+        if not responses:
+            # 閉じタグのない返信は、出力の終わりまでを返信とみなす
+            responses = [element.text.strip() for element in self.parser.find("返信") if element.text.strip()]
+        return responses or [self.text.strip()]
+
+    def required_info(self):
+        """必要情報（タイプ・詳細・カレンダーの場合は日程候補）"""
+        info_type = self._first("タイプ", parent="必要情報")
+        if info_type is None:
+            return {"type": None, "details": ""}
+
+        result = {
+            "type": info_type,
+            "details": self._first("詳細", parent="必要情報") or ""
+        }
+        date_suggestions = self.date_suggestions()
+        if info_type == "カレンダー" and date_suggestions:
+            result["date_suggestions"] = date_suggestions
+        return result
+
+    def date_suggestions(self):
+        """日程候補（時間範囲がない候補はメール本文から補う）"""
+        suggestions = [element.text.strip() for element in self.parser.find("候補", parent="日程候補")]
+        if not suggestions:
+            return []
+
+        body = self._first("本文")
+        if body:
+            suggestions = self._complete_time_ranges(suggestions, body)
+        logger.info(f"抽出された日程候補: {suggestions}")
+        return suggestions
+
+    def _complete_time_ranges(self, suggestions, body):
+        """メール本文から日付ごとの時間範囲を取り出し、時間範囲のない日程候補に補う"""
+        # 本文は候補ごとではなくパターンごとに1回だけ走査する
+        ranges = [
+            (match.group(1), match.group(2), match.group(3))
+            for pattern in DATE_TIME_RANGE_PATTERNS
+            for match in pattern.finditer(body)
+        ]
+
+        completed = []
+        for suggestion in suggestions:
+            date_match = DATE_PATTERN.search(suggestion)
+            if TIME_RANGE_PATTERN.search(suggestion) or not date_match:
+                completed.append(suggestion)
+                continue
+
+            date_str = date_match.group(1)
+            for found_date, start_time, end_time in ranges:
+                if date_str in found_date or found_date in date_str:
+                    completed.append(suggestion.replace(date_str, f"{date_str} {start_time}-{end_time}"))
+                    break
+            else:
+                completed.append(suggestion)
+        return completed
@@ -0,0 +1,218 @@
+import re
+import math
+
+from ..config import config
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 引用履歴の開始行（これ以降はすべて過去のやり取りとみなす）
+QUOTE_HEADER_PATTERN = re.compile(
+    r'^\s*(On .+wrote:|\d{4}年\d{1,2}月\d{1,2}日.*<[^<>]+>:?|\d{4}/\d{1,2}/\d{1,2}.*<[^<>]+>:?|-+\s*Original Message\s*-+|-+\s*元のメッセージ\s*-+)\s*$',
+    re.MULTILINE | re.IGNORECASE
+)
+# 引用記号で始まる行
+QUOTED_LINE_PATTERN = re.compile(r'^\s*>.*$\n?', re.MULTILINE)
+# 署名の区切り線（"-- " や罫線・記号の連続）
+SIGNATURE_SEPARATOR_PATTERN = re.compile(r'^\s*(--\s*|[-─━=＝_＿*＊~〜]{5,})\s*$')
+# RFC 3676 の署名区切り（これ以降は連絡先の行がなくても署名とみなす）
+RFC_SIGNATURE_SEPARATOR_PATTERN = re.compile(r'^--\s?$')
+# 署名らしい行（会社名・電話番号・メールアドレス・URL）
+SIGNATURE_LINE_PATTERN = re.compile(
+    r'(株式会社|有限会社|合同会社|一般社団法人|\b(Inc|Ltd|LLC|Corp|Co)\b\.?|'
+    r'\b(TEL|Tel|FAX|Fax|Phone|Mobile)\b|電話|携帯|\d{2,4}-\d{2,4}-\d{3,4}|'
+    r'[\w.+-]+@[\w-]+\.[\w.-]+|https?://|www\.)'
+)
+# 日付・時刻を含む行（日程調整に必要なため、署名・定型文の判定では省略しない）
+DATE_TIME_PATTERN = re.compile(
+    r'(\d{1,2}月\d{1,2}日|\d{4}[/-]\d{1,2}[/-]\d{1,2}|\b\d{1,2}/\d{1,2}\b|\d{1,2}[:：]\d{2}|\d{1,2}時|[月火水木金土日]曜)'
+)
+# 機密保持の注意書き・配信停止などの定型文（「機密」などの語だけでは本文と区別できないため、削除・破棄の依頼と組で判定する）
+BOILERPLATE_PATTERN = re.compile(
+    r'(intended (solely )?for the (use of the )?(addressee|recipient)|'
+    r'(confidential|機密|守秘|誤って|誤送信|心当たりのない).*(削除|破棄|notify|delete|destroy)|'
+    r'unsubscribe|配信停止|配信解除|本メールは送信専用|このメールは.*自動.*送信)',
+    re.IGNORECASE | re.DOTALL
+)
+SIGNATURE_MARKER = "\n[署名省略]"
+BOILERPLATE_MARKER = "\n\n[定型文省略]"
+# 日本語（かな・漢字・全角記号）の文字
+CJK_PATTERN = re.compile(r'[　-ヿ㐀-䶿一-鿿豈-﫿＀-￯]')
+# 署名とみなす末尾の行数
+SIGNATURE_MAX_LINES = 15
+
+def estimate_tokens(text):
+    """トークン数を簡易的に見積もる（日本語は1文字1トークン、それ以外は4文字1トークン）"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+class CompactionResult:
+    """圧縮結果"""
+
+    def __init__(self, text, original_tokens, compacted_tokens, steps):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.compacted_tokens = compacted_tokens
+        self.steps = steps
+
+    @property
+    def saved_tokens(self):
+        return self.original_tokens - self.compacted_tokens
+
+    def to_dict(self):
+        return {
+            "original_tokens": self.original_tokens,
+            "compacted_tokens": self.compacted_tokens,
+            "saved_tokens": self.saved_tokens,
+            "steps": self.steps,
+        }
+
+class TextCompactor:
+    """プロンプトに入れる前にメール本文を圧縮するクラス
+
+    引用履歴・署名・定型文を取り除き、モデルごとのトークン予算を超える場合は
+    先頭と末尾を残して中間を省略する。
+    """
+
+    def __init__(self, default_budget=6000, model_budgets=None):
+        """
+        初期化
+
+        Args:
+            default_budget: 本文に使えるトークン数の上限（モデル別の設定がない場合）
+            model_budgets: モデル名（前方一致）をキーとしたトークン数の上限の辞書
+        """
+        self.default_budget = default_budget
+        self.model_budgets = model_budgets or {}
+        self.total_original_tokens = 0
+        self.total_saved_tokens = 0
+        self.emails = 0
+
+    def budget_for(self, model=None):
+        """モデルのトークン予算を取得"""
+        if model:
+            for prefix, budget in self.model_budgets.items():
+                if model.startswith(prefix):
+                    return budget
+        return self.default_budget
+
+    def strip_quoted(self, text):
+        """引用履歴（引用見出し以降と '>' で始まる行）を取り除く"""
+        match = QUOTE_HEADER_PATTERN.search(text)
+        if match and text[:match.start()].strip():
+            text = text[:match.start()]
+        return QUOTED_LINE_PATTERN.sub('', text)
+
+    def _is_signature(self, separator, block):
+        """区切り線以降の行が署名かどうか（日付・時刻を含む場合は本文とみなす）"""
+        if any(DATE_TIME_PATTERN.search(line) for line in block):
+            return False
+        if RFC_SIGNATURE_SEPARATOR_PATTERN.match(separator):
+            return True
+        return any(SIGNATURE_LINE_PATTERN.search(line) for line in block)
+
+    def collapse_signature(self, text):
+        """末尾の区切り線以降を署名とみなして省略（区切り線の下に会社名・連絡先などがある場合のみ）"""
+        lines = text.rstrip().split('\n')
+        start = max(1, len(lines) - SIGNATURE_MAX_LINES)
+        for index in range(len(lines) - 1, start - 1, -1):
+            if not SIGNATURE_SEPARATOR_PATTERN.match(lines[index]):
+                continue
+            if not '\n'.join(lines[index + 1:]).strip():
+                # 区切り線が2本で署名を囲む形式の場合は、上側の区切り線から省略する
+                upper = next(
+                    (upper for upper in range(index - 1, start - 1, -1) if SIGNATURE_SEPARATOR_PATTERN.match(lines[upper])),
+                    None
+                )
+                if upper is None:
+                    break
+                index = upper
+            if self._is_signature(lines[index], lines[index + 1:]) and '\n'.join(lines[:index]).strip():
+                return '\n'.join(lines[:index]).rstrip() + SIGNATURE_MARKER
+            break
+        return text
+
+    def collapse_boilerplate(self, text):
+        """末尾に続く機密保持の注意書きなどの定型文の段落を省略（本文の段落が現れたところで止める）"""
+        suffix = ""
+        if text.endswith(SIGNATURE_MARKER):
+            text, suffix = text[:-len(SIGNATURE_MARKER)], SIGNATURE_MARKER
+        paragraphs = re.split(r'\n\s*\n', text.rstrip())
+        kept = list(paragraphs)
+        while len(kept) > 1 and BOILERPLATE_PATTERN.search(kept[-1]) and not DATE_TIME_PATTERN.search(kept[-1]):
+            kept.pop()
+        if len(kept) == len(paragraphs):
+            return text + suffix
+        return '\n\n'.join(kept) + suffix + BOILERPLATE_MARKER
+
+    def truncate_to_budget(self, text, budget):
+        """トークン予算を超える場合は先頭7割・末尾3割を残して中間を省略"""
+        tokens = estimate_tokens(text)
+        if tokens <= budget:
+            return text
+        marker = "\n…（中略）…\n"
+        # 文字数あたりのトークン数から残す文字数を決める
+        keep_chars = max(0, int(len(text) * budget / tokens) - len(marker))
+        head = int(keep_chars * 0.7)
+        tail = keep_chars - head
+        return text[:head] + marker + (text[-tail:] if tail else "")
+
+    def compact(self, text, model=None):
+        """
+        メール本文を圧縮
+
+        Args:
+            text: メール本文
+            model: 使用するモデル名（トークン予算の決定に使用）
+
+        Returns:
+            CompactionResult
+        """
+        text = text or ""
+        original_tokens = estimate_tokens(text)
+        steps = []
+
+        for name, step in (
+            ("quoted", self.strip_quoted),
+            ("signature", self.collapse_signature),
+            ("boilerplate", self.collapse_boilerplate),
+        ):
+            compacted = step(text)
+            if compacted != text:
+                steps.append(name)
+                text = compacted
+
+        text = re.sub(r'\n{3,}', '\n\n', text).strip()
+
+        budget = self.budget_for(model)
+        truncated = self.truncate_to_budget(text, budget)
+        if truncated != text:
+            steps.append("budget")
+            text = truncated
+
+        result = CompactionResult(text, original_tokens, estimate_tokens(text), steps)
+        self.emails += 1
+        self.total_original_tokens += result.original_tokens
+        self.total_saved_tokens += result.saved_tokens
+        return result
+
+    def get_stats(self):
+        """累計の削減トークン数を取得"""
+        return {
+            "emails": self.emails,
+            "original_tokens": self.total_original_tokens,
+            "saved_tokens": self.total_saved_tokens,
+            "saved_ratio": round(self.total_saved_tokens / self.total_original_tokens, 3) if self.total_original_tokens else 0.0,
+        }
+
+def create_text_compactor():
+    """設定に従って本文圧縮クラスを作成（無効の場合はNone）"""
+    settings = config.get_email_settings().get("compaction", {})
+    if not settings.get("enabled", True):
+        return None
+    return TextCompactor(
+        default_budget=settings.get("default_budget_tokens", 6000),
+        model_budgets=settings.get("model_budgets", {})
+    )
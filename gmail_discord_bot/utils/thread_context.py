@@ -0,0 +1,200 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from ..config import config
+from .logger import setup_logger
+from .executor import run_disk, run_network
+from .text_compactor import TextCompactor, estimate_tokens
+
+logger = setup_logger(__name__)
+
+class ThreadSummaryStore:
+    """メールスレッドごとの要約と、要約に含めたメッセージIDを保存するストア（SQLite）"""
+
+    def __init__(self, db_file=None, max_age_days=90):
+        """
+        初期化
+
+        Args:
+            db_file: SQLiteファイルのパス。指定しない場合はデータディレクトリを使用
+            max_age_days: 更新されないままこの日数を過ぎた要約は削除する
+        """
+        self.db_file = Path(db_file) if db_file else config.DATA_DIR / "thread_summaries.sqlite3"
+        self.max_age = max_age_days * 86400
+        self._initialize()
+
+    def _connect(self):
+        """接続を作成（スレッドプールから呼ばれるため操作ごとに接続する）"""
+        return sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+
+    def _initialize(self):
+        """テーブルを作成"""
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS thread_summaries (
+                    thread_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    message_ids TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_thread_summaries_updated_at ON thread_summaries (updated_at)")
+        finally:
+            conn.close()
+
+    def get_sync(self, thread_id):
+        """
+        スレッドの要約を取得
+
+        Returns:
+            (要約, 要約に含めたメッセージIDのリスト)。要約がない場合は ("", [])
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT summary, message_ids FROM thread_summaries WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return "", []
+        return row[0], json.loads(row[1])
+
+    def set_sync(self, thread_id, summary, message_ids):
+        """スレッドの要約を保存し、保存期間を過ぎた要約を削除"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO thread_summaries (thread_id, summary, message_ids, tokens, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (thread_id, summary, json.dumps(message_ids), estimate_tokens(summary), now)
+            )
+            conn.execute("DELETE FROM thread_summaries WHERE updated_at < ?", (now - self.max_age,))
+        finally:
+            conn.close()
+
+class ThreadContextBuilder:
+    """プロンプトに入れるメールスレッドの経緯（要約）を作成するクラス
+
+    スレッドごとの要約をストアに保存しておき、新しいメールが届いたときは前回の要約以降に
+    追加されたメッセージだけを前回の要約と合わせてLLMに送り、要約を更新する。
+    スレッド全体を毎回送らないため、スレッドが長くなってもプロンプトの大きさは要約の予算で頭打ちになる。
+    """
+
+    def __init__(self, store, budget_tokens=600, max_input_tokens=4000, max_message_tokens=1500):
+        """
+        初期化
+
+        Args:
+            store: ThreadSummaryStore
+            budget_tokens: 要約のトークン予算（プロンプトに入れる経緯の上限）
+            max_input_tokens: 1回の要約で送る新しいメッセージのトークン数の上限（超える場合は分けて要約する）
+            max_message_tokens: 1通あたりのトークン数の上限（引用履歴・署名を除いたうえで超える分は省略）
+        """
+        self.store = store
+        self.budget_tokens = budget_tokens
+        self.max_input_tokens = max_input_tokens
+        self.compactor = TextCompactor(default_budget=max_message_tokens)
+        self.stats = {"threads": 0, "reused": 0, "summarized_messages": 0, "summary_calls": 0, "failures": 0}
+
+    def _format_message(self, message):
+        """要約に送るメッセージのテキスト（引用履歴・署名・定型文を除く）"""
+        body = self.compactor.compact(message.get('body', '')).text
+        return f"## {message.get('date', '')} {message.get('sender', '')}\n件名: {message.get('subject', '')}\n{body}"
+
+    def _summary_prompt(self, summary, message_texts):
+        return (
+            f"# これまでの要約\n{summary or '（なし）'}\n\n"
+            f"# 新しいメッセージ\n" + "\n\n".join(message_texts) + "\n\n"
+            f"# 文字数の目安\n{self.budget_tokens}文字以内"
+        )
+
+    def _batches(self, messages):
+        """新しいメッセージを1回の要約で送る量ごとに分ける"""
+        batch, batch_tokens = [], 0
+        for message in messages:
+            text = self._format_message(message)
+            tokens = estimate_tokens(text)
+            if batch and batch_tokens + tokens > self.max_input_tokens:
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append((message['id'], text))
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    async def build(self, email_data, gmail_client, summarizer, deadline=None):
+        """
+        メールのスレッドの経緯を取得（必要な場合は要約を更新）
+
+        Args:
+            email_data: 処理中のメール
+            gmail_client: スレッドを取得する GmailClient
+            summarizer: 要約を作成するオブジェクト（summarize_thread(prompt, max_tokens, deadline) を持つ応答処理クラス）
+            deadline: メール1件分の処理期限
+
+        Returns:
+            経緯の要約テキスト（スレッドに過去のメッセージがない場合はNone）
+        """
+        thread_id = email_data.get('thread_id')
+        # 返信でないメール（スレッドの最初のメッセージ）はスレッドを取得しない
+        if not thread_id or not (email_data.get('in_reply_to') or email_data.get('references')):
+            return None
+
+        summary, summarized_ids = await run_disk(self.store.get_sync, thread_id)
+        messages = await run_network(gmail_client.get_thread_messages, thread_id)
+        current_date = email_data.get('internal_date') or float('inf')
+        earlier = [
+            message for message in messages
+            if message['id'] != email_data['id'] and message['internal_date'] <= current_date
+        ]
+        if not earlier:
+            return summary or None
+
+        self.stats["threads"] += 1
+        summarized = set(summarized_ids)
+        new_messages = [message for message in earlier if message['id'] not in summarized]
+        if not new_messages:
+            self.stats["reused"] += 1
+            return summary or None
+
+        for batch in self._batches(new_messages):
+            updated = await summarizer.summarize_thread(
+                self._summary_prompt(summary, [text for _, text in batch]),
+                max_tokens=self.budget_tokens + 200,
+                deadline=deadline
+            )
+            self.stats["summary_calls"] += 1
+            if not updated:
+                # 要約できなかったメッセージは次のメールで改めて要約する
+                self.stats["failures"] += 1
+                break
+            summary = updated
+            summarized_ids = summarized_ids + [message_id for message_id, _ in batch]
+            self.stats["summarized_messages"] += len(batch)
+            await run_disk(self.store.set_sync, thread_id, summary, summarized_ids)
+
+        return self.compactor.truncate_to_budget(summary, self.budget_tokens) if summary else None
+
+    def get_stats(self):
+        return dict(self.stats)
+
+def create_thread_context_builder():
+    """設定に従ってスレッドの経緯を作成するクラスを作成（無効の場合はNone）"""
+    settings = config.get_email_settings().get("thread_context", {})
+    if not settings.get("enabled", False):
+        return None
+    store = ThreadSummaryStore(
+        db_file=config.DATA_DIR / settings["file"] if settings.get("file") else None,
+        max_age_days=settings.get("max_age_days", 90)
+    )
+    return ThreadContextBuilder(
+        store,
+        budget_tokens=settings.get("budget_tokens", 600),
+        max_input_tokens=settings.get("max_input_tokens", 4000),
+        max_message_tokens=settings.get("max_message_tokens", 1500)
+    )
@@ -0,0 +1,13 @@
+import os
+import sys
+from pathlib import Path
+
+from dotenv import dotenv_values
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+# config.py は読み込み時に必須の環境変数を参照するため、.env.example の値を既定値として設定する
+for key, value in dotenv_values(ROOT_DIR / "gmail_discord_bot" / "config" / ".env.example").items():
+    if value is not None:
+        os.environ.setdefault(key, value.split("#")[0].strip())
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from gmail_discord_bot.ai_module import batch
+from gmail_discord_bot.ai_module.batch import BatchCoordinator, LocalBatchBackend
+
+@pytest.fixture(autouse=True)
+def no_ledger(monkeypatch):
+    # テストではLLM台帳に記録しない
+    monkeypatch.setattr(batch, "get_llm_ledger", lambda: None)
+
+def make_coordinator(tmp_path, backend, **kwargs):
+    return BatchCoordinator(
+        backend, "claude-test", state_file=tmp_path / "batch_jobs.json", poll_interval=0, **kwargs
+    )
+
+def email(email_id):
+    return {"id": email_id, "sender": "news@example.com", "subject": "お知らせ", "body": "本文"}
+
+async def collect(coordinator):
+    received = []
+
+    async def on_result(email_data, text):
+        received.append((email_data["id"], text))
+
+    await coordinator.collect(on_result)
+    return received
+
+def test_flush_and_collect(tmp_path):
+    async def complete(request):
+        return f"<返信>{request['user']}への返信</返信>"
+
+    async def scenario():
+        coordinator = make_coordinator(tmp_path, LocalBatchBackend(complete=complete, delay=0), max_batch_size=2)
+        await coordinator.enqueue(email("m1"), "prompt1")
+        await coordinator.enqueue(email("m2"), "prompt2")
+        await coordinator.enqueue(email("m3"), "prompt3")
+        assert coordinator._should_flush()
+
+        await coordinator.flush()
+        assert [job["email_data"]["id"] for job in coordinator.pending] == ["m3"]
+        assert len(coordinator.submitted) == 1
+        return await collect(coordinator), coordinator
+
+    received, coordinator = asyncio.run(scenario())
+    assert received == [("m1", "<返信>prompt1への返信</返信>"), ("m2", "<返信>prompt2への返信</返信>")]
+    assert coordinator.submitted == {}
+
+def test_collect_waits_until_batch_is_done(tmp_path):
+    async def scenario():
+        coordinator = make_coordinator(tmp_path, LocalBatchBackend(delay=60))
+        await coordinator.enqueue(email("m1"), "prompt1")
+        await coordinator.flush()
+        return await collect(coordinator), coordinator
+
+    received, coordinator = asyncio.run(scenario())
+    assert received == []
+    assert len(coordinator.submitted) == 1
+
+def test_restart_restores_state_and_falls_back_when_batch_is_lost(tmp_path):
+    async def before_restart():
+        coordinator = make_coordinator(tmp_path, LocalBatchBackend(delay=60))
+        await coordinator.enqueue(email("m1"), "prompt1")
+        await coordinator.flush()
+        await coordinator.enqueue(email("m2"), "prompt2")
+
+    async def after_restart():
+        # ローカルバックエンドのバッチはプロセスとともに失われる
+        coordinator = make_coordinator(tmp_path, LocalBatchBackend(delay=0))
+        assert [job["email_data"]["id"] for job in coordinator.pending] == ["m2"]
+        assert len(coordinator.submitted) == 1
+        return await collect(coordinator)
+
+    asyncio.run(before_restart())
+    assert asyncio.run(after_restart()) == [("m1", None)]
+
+def test_missing_result_is_passed_as_none(tmp_path):
+    class PartialBackend(LocalBatchBackend):
+        async def results(self, batch_id):
+            results = await super().results(batch_id)
+            results.pop(next(iter(results)))
+            return results
+
+    async def scenario():
+        coordinator = make_coordinator(tmp_path, PartialBackend(delay=0))
+        await coordinator.enqueue(email("m1"), "prompt1")
+        await coordinator.enqueue(email("m2"), "prompt2")
+        await coordinator.flush()
+        return await collect(coordinator)
+
+    received = dict(asyncio.run(scenario()))
+    assert received["m1"] is None
+    assert received["m2"] is not None
+
+def test_failed_submit_keeps_jobs_pending(tmp_path):
+    class FailingBackend(LocalBatchBackend):
+        async def submit(self, requests):
+            raise RuntimeError("submit failed")
+
+    async def scenario():
+        coordinator = make_coordinator(tmp_path, FailingBackend())
+        await coordinator.enqueue(email("m1"), "prompt1")
+        with pytest.raises(RuntimeError):
+            await coordinator.flush()
+        return coordinator
+
+    coordinator = asyncio.run(scenario())
+    assert [job["email_data"]["id"] for job in coordinator.pending] == ["m1"]
+    assert coordinator.submitted == {}
+
+def test_workers_do_not_overwrite_each_others_state(tmp_path):
+    async def scenario():
+        a = BatchCoordinator(LocalBatchBackend(), "claude-test", state_file=tmp_path / "batch_jobs_a.json")
+        b = BatchCoordinator(LocalBatchBackend(), "claude-test", state_file=tmp_path / "batch_jobs_b.json")
+        await a.enqueue(email("m1"), "prompt1")
+        await b.enqueue(email("m2"), "prompt2")
+
+    asyncio.run(scenario())
+    reloaded_a = BatchCoordinator(LocalBatchBackend(), "claude-test", state_file=tmp_path / "batch_jobs_a.json")
+    reloaded_b = BatchCoordinator(LocalBatchBackend(), "claude-test", state_file=tmp_path / "batch_jobs_b.json")
+    assert [job["email_data"]["id"] for job in reloaded_a.pending] == ["m1"]
+    assert [job["email_data"]["id"] for job in reloaded_b.pending] == ["m2"]
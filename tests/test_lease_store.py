@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from gmail_discord_bot.config import config
+from gmail_discord_bot.discord_module.approval_registry import ApprovalRegistry
+from gmail_discord_bot.utils.checkpoint import JobCheckpoint
+from gmail_discord_bot.utils.lease_store import LeaseStore
+
+def make_store(tmp_path, worker_id, ttl=300):
+    return LeaseStore(db_file=tmp_path / "leases.sqlite3", worker_id=worker_id, ttl=ttl)
+
+def test_only_one_worker_claims(tmp_path):
+    a = make_store(tmp_path, "a")
+    b = make_store(tmp_path, "b")
+
+    assert a.try_claim("inbox", "m1", {"discord_channel_id": "1"})
+    assert not b.try_claim("inbox", "m1")
+    # 自分のリースは取り直せる
+    assert a.try_claim("inbox", "m1")
+
+def test_completed_lease_is_never_claimed_again(tmp_path):
+    a = make_store(tmp_path, "a")
+    b = make_store(tmp_path, "b", ttl=0)
+    a.try_claim("inbox", "m1")
+    a.complete("inbox", "m1")
+
+    assert not b.try_claim("inbox", "m1")
+    assert b.claim_expired() == []
+
+def test_expired_lease_is_taken_over_with_payload(tmp_path):
+    a = make_store(tmp_path, "a", ttl=0)
+    b = make_store(tmp_path, "b")
+    a.try_claim("inbox", "m1", {"discord_channel_id": "1", "notified": False})
+    a.update_payload("inbox", "m1", {"notified": True})
+    time.sleep(0.01)
+
+    claimed = b.claim_expired()
+    assert claimed == [{"discord_channel_id": "1", "notified": True, "mailbox": "inbox", "email_id": "m1"}]
+    # 引き継いだ後は元のワーカーは payload を更新できない
+    assert not a.update_payload("inbox", "m1", {"notified": False})
+
+def test_released_lease_is_taken_over_immediately(tmp_path):
+    a = make_store(tmp_path, "a")
+    b = make_store(tmp_path, "b")
+    a.try_claim("inbox", "m1")
+    a.release("inbox", "m1")
+
+    assert [lease["email_id"] for lease in b.claim_expired()] == ["m1"]
+
+def test_renew_extends_own_leases(tmp_path):
+    a = make_store(tmp_path, "a", ttl=0)
+    b = make_store(tmp_path, "b")
+    a.try_claim("inbox", "m1")
+    a.ttl = 300
+
+    assert a.renew() == 1
+    assert b.claim_expired() == []
+
+def test_purge_done_removes_old_records(tmp_path):
+    a = make_store(tmp_path, "a")
+    a.try_claim("inbox", "m1")
+    a.try_claim("inbox", "m2")
+    a.complete("inbox", "m1")
+
+    assert a.purge_done(older_than=-1) == 1
+    assert a.purge_done() == 0
+
+def test_worker_file_is_separate_per_worker(tmp_path):
+    a = make_store(tmp_path, "host-1/a")
+    b = make_store(tmp_path, "b")
+
+    assert a.worker_file("batch_jobs.json").name == "batch_jobs_host-1_a.json"
+    assert a.worker_file("batch_jobs.json") != b.worker_file("batch_jobs.json")
+
+def test_workers_keep_their_own_checkpoint_and_approvals(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DATA_DIR", tmp_path)
+    a = make_store(tmp_path, "a")
+    b = make_store(tmp_path, "b")
+
+    JobCheckpoint(a.worker_file("unfinished_jobs.json")).save([{"id": "m1"}])
+    asyncio.run(_persist_approval(ApprovalRegistry(store_file=a.worker_file("pending_approvals.json")), "m1"))
+    asyncio.run(_persist_approval(ApprovalRegistry(store_file=b.worker_file("pending_approvals.json")), "m2"))
+
+    # 他のワーカーの未完了ジョブは読み込まず、削除もしない
+    assert JobCheckpoint(b.worker_file("unfinished_jobs.json")).load() == []
+    assert JobCheckpoint(a.worker_file("unfinished_jobs.json")).load() == [{"id": "m1"}]
+    assert [email_id for email_id, _ in ApprovalRegistry(store_file=a.worker_file("pending_approvals.json")).pending()] == ["m1"]
+    assert [email_id for email_id, _ in ApprovalRegistry(store_file=b.worker_file("pending_approvals.json")).pending()] == ["m2"]
+
+async def _persist_approval(registry, email_id):
+    registry.register(email_id, {"channel_id": "1"})
+    await registry.persist()
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from gmail_discord_bot.ai_module.model_routing import ModelRoutingPolicy, RoutingSignals
+from gmail_discord_bot.main import EmailBot
+from gmail_discord_bot.utils.text_compactor import TextCompactor
+
+THREAD_BODY = (
+    "承知しました。来週の打ち合わせで確認します。\n\n"
+    "On Mon, Jun 3, 2024 at 10:00 AM 田中 <tanaka@example.com> wrote:\n"
+    "> 資料を確認しました。\n"
+    "> On Sun, Jun 2, 2024 at 9:00 AM 佐藤 <sato@example.com> wrote:\n"
+    "> > 資料をお送りします。\n"
+    "> > On Sat, Jun 1, 2024 at 8:00 AM 田中 <tanaka@example.com> wrote:\n"
+    "> > > 資料をお願いできますか。\n"
+)
+
+def build_prompt(body):
+    bot = SimpleNamespace(text_compactor=TextCompactor(), response_processor=SimpleNamespace(model=None))
+    email_data = {"id": "m1", "subject": "Re: 資料", "sender": "tanaka@example.com", "body": body}
+    return EmailBot._build_prompt(bot, email_data, "田中様")
+
+def test_signals_are_taken_before_compaction():
+    prompt, signals = build_prompt(THREAD_BODY)
+
+    # 引用履歴はプロンプトから除かれるが、スレッドの深さには数える
+    assert "> > >" not in prompt
+    assert RoutingSignals.from_prompt(prompt).thread_depth == 0
+    assert signals.thread_depth == 3
+    assert signals.body_length == len(THREAD_BODY)
+
+def test_deep_thread_escalates_through_build_prompt():
+    policy = ModelRoutingPolicy({
+        "enabled": True,
+        "providers": {"claude": {"analysis": {"model": "small", "escalate_to": "large"}}},
+        "escalation": {"thread_depth": 3},
+    })
+    _, signals = build_prompt(THREAD_BODY)
+
+    assert policy.select("claude", "analysis", "default", signals) == ("claude:analysis:escalated", "large")
+
+def test_with_analysis_keeps_email_signals():
+    signals = RoutingSignals(body_length=100, thread_depth=3).with_analysis({"required_info": {"type": "カレンダー"}})
+
+    assert (signals.body_length, signals.thread_depth, signals.required_info_type) == (100, 3, "カレンダー")
@@ -0,0 +1,37 @@
+from gmail_discord_bot.utils.near_duplicate import NearDuplicateIndex
+
+TEMPLATE = (
+    "いつもお世話になっております。下記の件についてお見積もりをお願いしたくご連絡いたしました。"
+    "打ち合わせ希望日時は{date}、ご予算は{amount}を想定しております。"
+    "ご多忙のところ恐れ入りますが、ご確認のほどよろしくお願いいたします。"
+)
+ANALYSIS = {"analysis": "見積もり依頼", "required_info": {}}
+
+def make_index(tmp_path, threshold=6):
+    return NearDuplicateIndex(db_file=tmp_path / "near_duplicates.sqlite3", threshold=threshold)
+
+def test_reuses_identical_template(tmp_path):
+    index = make_index(tmp_path)
+    body = TEMPLATE.format(date="5月10日14:00", amount="120万円")
+    index.add_sync("inbox:1", "m1", body, ANALYSIS, ["山田様\n承知しました。"], address="山田様")
+
+    match = index.find_sync("inbox:1", body)
+    assert match is not None and match.email_id == "m1"
+    assert match.responses_for("佐藤様") == ["佐藤様\n承知しました。"]
+
+def test_rejects_match_with_different_date_and_amount(tmp_path):
+    # 距離が閾値以内でも数字が違えば類似とみなさないことを確かめるため、閾値を大きくする
+    index = make_index(tmp_path, threshold=32)
+    index.add_sync(
+        "inbox:1", "m1", TEMPLATE.format(date="5月10日14:00", amount="120万円"), ANALYSIS, ["返信案"]
+    )
+
+    assert index.find_sync("inbox:1", TEMPLATE.format(date="6月3日10:30", amount="85万円")) is None
+    assert index.get_stats()["fact_mismatches"] == 1
+
+def test_other_route_is_not_searched(tmp_path):
+    index = make_index(tmp_path)
+    body = TEMPLATE.format(date="5月10日14:00", amount="120万円")
+    index.add_sync("inbox:1", "m1", body, ANALYSIS, ["返信案"])
+
+    assert index.find_sync("inbox:2", body) is None
@@ -0,0 +1,72 @@
+import asyncio
+
+from gmail_discord_bot.ai_module.provider_router import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ProviderRouter
+
+class FakeProcessor:
+    def __init__(self, fail=True):
+        self.fail = fail
+        self.calls = 0
+        self.release = None
+        self.output_saver = object()
+        self.schedule_analyzer_reads = 0
+
+    @property
+    def schedule_analyzer(self):
+        self.schedule_analyzer_reads += 1
+        return "schedule_analyzer"
+
+    async def analyze_email(self, prompt, email_id=None, deadline=None, signals=None):
+        self.calls += 1
+        if self.release:
+            await self.release.wait()
+        if self.fail:
+            raise RuntimeError("backend down")
+        return {"analysis": "ok", "required_info": {"type": None}}
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure()
+
+    assert breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.acquire()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.acquire() and breaker.acquire()
+
+def test_cancelled_probe_is_released():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure()
+    assert breaker.acquire()
+
+    breaker.release()
+    assert breaker.acquire()
+
+def test_burst_sends_only_one_probe_to_failing_backend():
+    processor = FakeProcessor()
+    router = ProviderRouter([("a", processor)], failure_threshold=1, cooldown=0)
+
+    async def scenario():
+        await router.analyze_email("prompt")
+        processor.release = asyncio.Event()
+        burst = [asyncio.ensure_future(router.analyze_email("prompt")) for _ in range(3)]
+        await asyncio.sleep(0)
+        processor.release.set()
+        return await asyncio.gather(*burst)
+
+    results = asyncio.run(scenario())
+    assert processor.calls == 2
+    assert all(result["required_info"] == {"type": None} for result in results)
+    assert router.providers[0].breaker.state == OPEN
+
+def test_schedule_analyzer_is_not_created_at_construction():
+    processor = FakeProcessor(fail=False)
+    router = ProviderRouter([("a", processor)])
+
+    assert processor.schedule_analyzer_reads == 0
+    assert router.schedule_analyzer == "schedule_analyzer"
+    assert processor.schedule_analyzer_reads == 1
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from gmail_discord_bot.ai_module.rate_limiter import RateLimiter, TokenBucket
+
+def test_token_bucket_wait_time_and_refill():
+    bucket = TokenBucket(60)  # 毎秒1補充
+    bucket.take(60)
+    assert bucket.wait_time(3) == pytest.approx(3.0)
+
+    bucket.refill(bucket.updated + 2)
+    assert bucket.level == pytest.approx(2.0)
+    assert bucket.wait_time(3) == pytest.approx(1.0)
+
+def test_token_bucket_does_not_overfill_and_caps_request():
+    bucket = TokenBucket(60)
+    bucket.refill(bucket.updated + 600)
+    assert bucket.level == 60
+    # 容量を超える要求は満杯になれば通す
+    assert bucket.wait_time(1000) == 0.0
+
+def test_acquire_times_out_when_tokens_are_exhausted():
+    async def scenario():
+        limiter = RateLimiter("test", tpm=600)
+        await limiter.acquire(600)
+        with pytest.raises(asyncio.TimeoutError):
+            await limiter.acquire(300, timeout=1)
+
+    asyncio.run(scenario())
+
+def test_reconcile_returns_unused_tokens():
+    async def scenario():
+        limiter = RateLimiter("test", tpm=1000)
+        reservation = await limiter.acquire(800)
+        reservation.reconcile(100)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.tokens.level == pytest.approx(900, abs=1)
+    assert limiter.get_stats()["actual_tokens"] == 100
+
+def test_failed_call_reconciled_with_zero_restores_bucket():
+    async def scenario():
+        limiter = RateLimiter("test", tpm=1000)
+        for _ in range(5):
+            reservation = await limiter.acquire(200, timeout=1)
+            reservation.reconcile(0)
+            # 2回目以降の補正は無視する
+            reservation.reconcile(200)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.tokens.level == pytest.approx(1000, abs=1)
+
+def test_rpm_limit_and_backoff():
+    async def scenario():
+        limiter = RateLimiter("test", rpm=2)
+        await limiter.acquire()
+        await limiter.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await limiter.acquire(timeout=1)
+
+        limiter = RateLimiter("test", rpm=100)
+        limiter.backoff(30)
+        with pytest.raises(asyncio.TimeoutError):
+            await limiter.acquire(timeout=1)
+        return limiter
+
+    assert asyncio.run(scenario()).get_stats()["rate_limited"] == 1
@@ -0,0 +1,16 @@
+from gmail_discord_bot.utils.response_cache import ResponseCache
+
+def test_key_depends_on_sampling_parameters_and_variant():
+    base = ResponseCache.make_key("claude", "model", "system", "user", temperature=0.7, max_tokens=2000, variant=0)
+    assert base == ResponseCache.make_key("claude", "model", "system", "user", temperature=0.7, max_tokens=2000, variant=0)
+    assert base != ResponseCache.make_key("claude", "model", "system", "user", temperature=0.3, max_tokens=2000, variant=0)
+    assert base != ResponseCache.make_key("claude", "model", "system", "user", temperature=0.7, max_tokens=800, variant=0)
+    # スタイル数より多い候補は同じプロンプトになるため、候補の番号でキーを分ける
+    assert base != ResponseCache.make_key("claude", "model", "system", "user", temperature=0.7, max_tokens=2000, variant=3)
+
+def test_get_and_set(tmp_path):
+    cache = ResponseCache(db_file=tmp_path / "response_cache.sqlite3")
+    key = ResponseCache.make_key("chatgpt", "model", "system", "user")
+    assert cache.get_sync(key) is None
+    cache.set_sync(key, "応答")
+    assert cache.get_sync(key) == "応答"
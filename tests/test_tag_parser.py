@@ -0,0 +1,89 @@
+import pytest
+
+from gmail_discord_bot.utils.tag_parser import IncrementalTagParser, TaggedOutput
+
+OUTPUT = (
+    "<分析>\n日程調整の依頼です。\n</分析>\n"
+    "<必要情報>\n<タイプ>カレンダー</タイプ>\n<詳細>空き時間の確認</詳細>\n"
+    "<日程候補>\n<候補>4月10日</候補>\n<候補>4/12 10:00-11:00</候補>\n</日程候補>\n</必要情報>\n"
+    "<返信>\n山田様\n\n承知しました。\n</返信>\n"
+    "<返信>\n山田様\n\nご連絡ありがとうございます。\n</返信>"
+)
+
+def summarize(parser):
+    return [(element.name, element.text, element.parents, element.closed) for element in parser.elements]
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_chunked_feed_matches_single_feed(size):
+    whole = IncrementalTagParser()
+    whole.feed(OUTPUT)
+    whole.close()
+
+    chunked = IncrementalTagParser()
+    for start in range(0, len(OUTPUT), size):
+        chunked.feed(OUTPUT[start:start + size])
+    chunked.close()
+
+    assert summarize(chunked) == summarize(whole)
+
+def test_elements_are_reported_when_they_close():
+    received = []
+    parser = IncrementalTagParser(on_element=lambda element: received.append(element.name))
+    parser.feed("<返信>途中")
+    assert received == []
+    assert parser.open_text("返信") == "途中"
+    parser.feed("まで</返")
+    assert parser.open_text("返信") == "途中まで"
+    parser.feed("信>")
+    assert received == ["返信"]
+
+def test_tagged_output_fields():
+    output = TaggedOutput(OUTPUT)
+    assert output.analysis == "日程調整の依頼です。"
+    assert output.responses() == ["山田様\n\n承知しました。", "山田様\n\nご連絡ありがとうございます。"]
+    assert output.required_info()["type"] == "カレンダー"
+    assert output.required_info()["details"] == "空き時間の確認"
+
+def test_unclosed_reply_runs_to_end_of_output():
+    output = TaggedOutput("<分析>不要</分析>\n<返信>\n打ち切られた返信")
+    assert output.responses() == ["打ち切られた返信"]
+    assert output.parser.find("返信")[0].closed is False
+
+def test_reply_opened_inside_unclosed_reply_starts_new_reply():
+    output = TaggedOutput("<返信>1つ目\n<返信>2つ目</返信>")
+    assert output.responses() == ["1つ目", "2つ目"]
+
+def test_no_tags_uses_whole_output():
+    output = TaggedOutput("タグのない返信です。")
+    assert output.responses() == ["タグのない返信です。"]
+    assert output.analysis == "タグのない返信です。"
+    assert output.required_info() == {"type": None, "details": ""}
+
+def test_unknown_and_stray_tags_are_text():
+    output = TaggedOutput("<分析>件名に<重要>とあります</詳細></分析>")
+    assert output.analysis == "件名に<重要>とあります</詳細>"
+
+def test_reply_text_containing_angle_brackets_is_kept():
+    reply = "<株式会社サンプル> 御中\n資料は<分析>フォルダと<https://example.com/a?b=<1>>にあります。\n1 < 2 > 0"
+    output = TaggedOutput(f"<返信>{reply}</返信>")
+    assert output.responses() == [reply]
+
+def test_long_text_after_lone_angle_bracket_is_not_held_back():
+    parser = IncrementalTagParser()
+    parser.feed("<返信>a < b であり、" + "続き" * 20 + "</返信>")
+    assert [element.text for element in parser.find("返信")] == ["a < b であり、" + "続き" * 20]
+
+def test_date_suggestions_complete_time_range_from_body():
+    text = (
+        "<本文>\n4月10日 21:00〜23:00 または 4/12 10:00-11:00 でいかがでしょうか。\n</本文>\n"
+        "<必要情報><タイプ>カレンダー</タイプ><詳細>空き確認</詳細>"
+        "<日程候補><候補>4月10日</候補><候補>4/12</候補><候補>4/15 9:00-10:00</候補><候補>4/20</候補></日程候補>"
+        "</必要情報>"
+    )
+    assert TaggedOutput(text).required_info()["date_suggestions"] == [
+        "4月10日 21:00-23:00", "4/12 10:00-11:00", "4/15 9:00-10:00", "4/20"
+    ]
+
+def test_date_suggestions_only_for_calendar_type():
+    text = "<必要情報><タイプ>承認</タイプ><日程候補><候補>4/12</候補></日程候補></必要情報>"
+    assert "date_suggestions" not in TaggedOutput(text).required_info()
@@ -0,0 +1,68 @@
+from gmail_discord_bot.utils.text_compactor import TextCompactor
+
+def compact(text):
+    return TextCompactor().compact(text)
+
+def test_keeps_paragraph_mentioning_confidential():
+    body = (
+        "いつもお世話になっております。\n\n"
+        "今回の資料は機密情報を含むため、メールでの送付は控えさせていただきます。"
+        "来週の打ち合わせで詳細を説明いたします。\n\n"
+        "よろしくお願いいたします。"
+    )
+    result = compact(body)
+    assert "機密情報を含むため" in result.text
+    assert "[定型文省略]" not in result.text
+
+def test_keeps_dates_between_rule_lines():
+    body = (
+        "下記の日程で打ち合わせを予定しております。ご確認ください。\n"
+        "==========\n"
+        "【日時】5月10日 14:00\n"
+        "【場所】本社会議室\n"
+        "==========\n"
+        "ご出席の可否をご返信ください。"
+    )
+    result = compact(body)
+    assert result.text == body
+    assert "signature" not in result.steps
+
+def test_keeps_dates_in_enclosed_block():
+    body = "打ち合わせの詳細です。\n-----\n日時: 2024/05/10 14:00\n場所: 本社\n-----"
+    assert "2024/05/10 14:00" in compact(body).text
+
+def test_collapses_enclosed_signature_with_contact_lines():
+    body = (
+        "ご確認をお願いいたします。\n"
+        "----------\n"
+        "株式会社サンプル 営業部\n"
+        "山田 太郎\n"
+        "TEL: 03-1234-5678\n"
+        "----------"
+    )
+    result = compact(body)
+    assert result.text == "ご確認をお願いいたします。\n[署名省略]"
+    assert "signature" in result.steps
+
+def test_rule_line_without_contact_lines_is_not_signature():
+    body = "本文です。\n==========\n以上、よろしくお願いいたします。"
+    assert compact(body).text == body
+
+def test_collapses_rfc_separator():
+    body = "本文です。\n-- \n山田"
+    assert compact(body).text == "本文です。\n[署名省略]"
+
+def test_strips_trailing_boilerplate_only():
+    body = (
+        "配信停止の手続きについて教えてください。\n\n"
+        "よろしくお願いいたします。\n\n"
+        "本メールに心当たりのない場合は、お手数ですが削除してください。"
+    )
+    result = compact(body)
+    assert "配信停止の手続きについて" in result.text
+    assert "心当たりのない" not in result.text
+    assert result.text.endswith("[定型文省略]")
+
+def test_keeps_trailing_boilerplate_with_date():
+    body = "本文です。\n\n配信停止は5月10日まで受け付けます。"
+    assert compact(body).text == body